@@ -0,0 +1,348 @@
+import datetime
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+from sqlalchemy import insert
+from alert_record import AlertRecord
+from config import Config
+from models import ReportDelivery, SentAlert, SystemConfig, db
+
+logger = logging.getLogger(__name__)
+
+# Keep IN (...) lists well under every backend's bound-parameter limit
+LOOKUP_CHUNK_SIZE = 500
+
+
+def alert_identifier(alert_data):
+    """
+    Hash the fields that make two alerts the same notification: rule,
+    agent and level within the same minute
+    """
+    record = AlertRecord.from_hit(alert_data)
+
+    # Use fewer fields to prevent over-deduplication
+    fields = {
+        'rule_id': record.rule_id if record.rule_id is not None else '',
+        'agent_ip': record.agent_ip if record.agent_ip is not None else '',
+        'agent_name': record.agent_name if record.agent_name is not None else '',
+        'rule_level': record.rule_level if record.rule_level is not None else '',
+        # Use rounded timestamp (to nearest minute) to group similar alerts
+        'timestamp_minute': record.timestamp_raw[:16] if record.timestamp_raw else ''
+    }
+
+    identifier_str = json.dumps(fields, sort_keys=True)
+    return hashlib.md5(identifier_str.encode()).hexdigest()
+
+
+class _BloomFilter:
+    """Fixed-size Bloom filter sized for capacity items at error_rate"""
+
+    def __init__(self, capacity, error_rate):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def add(self, key):
+        if key in self:
+            return
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def false_positive_rate(self):
+        """Expected false positive rate at the current fill"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class SentAlertCache:
+    """
+    In-memory mirror of recent SentAlert rows: one Bloom filter of
+    (alert_config_id, identifier) per hour, covering the duplicate window.
+
+    A miss means "definitely not sent", so most new alerts never reach the
+    database; a hit only means "maybe sent" and is confirmed against
+    SentAlert, which stays the source of truth. Each sync pulls rows written
+    since the last one (by any process), so the mirror does not go stale
+    when the scheduler lease moves. Syncs are at most one per
+    ALERT_DEDUP_SYNC_SECONDS; this process's own sends are added at once.
+    """
+
+    # Re-read this much before the last sync to catch rows committed late
+    SYNC_OVERLAP = datetime.timedelta(seconds=60)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._synced_at = None
+        self._window = None
+
+    @staticmethod
+    def _key(alert_config_id, identifier):
+        return f"{alert_config_id}:{identifier}"
+
+    @staticmethod
+    def _hour(timestamp):
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+
+    def _add(self, alert_config_id, identifier, timestamp):
+        hour = self._hour(timestamp)
+        bucket = self._buckets.get(hour)
+        if bucket is None:
+            bucket = self._buckets[hour] = _BloomFilter(Config.ALERT_DEDUP_BUCKET_CAPACITY,
+                                                        Config.ALERT_DEDUP_FALSE_POSITIVE_RATE)
+        bucket.add(self._key(alert_config_id, identifier))
+
+    def sync(self, window, force=False):
+        """Load SentAlert rows since the last sync (the whole window the first time) and drop expired hours"""
+        now = datetime.datetime.utcnow()
+        with self._lock:
+            if not force and self._synced_at is not None and window == self._window and \
+                    (now - self._synced_at).total_seconds() < Config.ALERT_DEDUP_SYNC_SECONDS:
+                return
+            if self._synced_at is None or window != self._window:
+                self._buckets = {}
+                since = now - window
+            else:
+                since = max(self._synced_at - self.SYNC_OVERLAP, now - window)
+
+            rows = db.session.query(
+                SentAlert.alert_config_id, SentAlert.alert_identifier, SentAlert.timestamp
+            ).filter(SentAlert.timestamp >= since).all()
+            for row in rows:
+                if row.timestamp is not None:
+                    self._add(row.alert_config_id, row.alert_identifier, row.timestamp)
+
+            oldest_hour = self._hour(now - window)
+            for hour in [hour for hour in self._buckets if hour < oldest_hour]:
+                del self._buckets[hour]
+            self._synced_at = now
+            self._window = window
+
+    def might_contain(self, alert_config_id, identifier):
+        key = self._key(alert_config_id, identifier)
+        with self._lock:
+            return any(key in bucket for bucket in self._buckets.values())
+
+    def add(self, alert_config_id, identifiers, timestamp):
+        with self._lock:
+            if self._synced_at is None:
+                return
+            for identifier in identifiers:
+                self._add(alert_config_id, identifier, timestamp)
+
+    def reset(self):
+        with self._lock:
+            self._buckets = {}
+            self._synced_at = None
+
+    def stats(self):
+        with self._lock:
+            buckets = list(self._buckets.values())
+            return {
+                "warm": self._synced_at is not None,
+                "synced_at": self._synced_at.isoformat() if self._synced_at else None,
+                "buckets": len(buckets),
+                "entries": sum(bucket.count for bucket in buckets),
+                "memory_bytes": sum(len(bucket.bits) for bucket in buckets),
+                "bucket_capacity": Config.ALERT_DEDUP_BUCKET_CAPACITY,
+                "configured_false_positive_rate": Config.ALERT_DEDUP_FALSE_POSITIVE_RATE,
+                # A lookup checks every bucket, so the per-bucket rates add up
+                "estimated_false_positive_rate": min(1.0, sum(bucket.false_positive_rate() for bucket in buckets))
+            }
+
+
+class AlertDeduplicator:
+    """
+    Decide which alerts of a batch were already sent for an alert config
+    within the alert_duplicate_window, and record the ones that go out.
+    A batch costs at most one SentAlert lookup and one insert, not one of
+    each per alert, and the lookup only covers identifiers the in-memory
+    SentAlertCache cannot rule out.
+    """
+
+    def __init__(self):
+        self.cache = SentAlertCache()
+        self._counters = {"lookups": 0, "answered_from_memory": 0, "checked_in_db": 0,
+                          "confirmed_duplicates": 0, "false_positives": 0, "cache_errors": 0}
+        self._counter_lock = threading.Lock()
+        self._last_prune = None
+        self._window = None
+        self._window_read_at = None
+
+    def _count(self, **increments):
+        with self._counter_lock:
+            for name, value in increments.items():
+                self._counters[name] += value
+
+    def warm(self):
+        """Load the duplicate window into memory; call inside an app context"""
+        if not Config.ALERT_DEDUP_CACHE_ENABLED:
+            return
+        try:
+            self.cache.sync(self.duplicate_window(), force=True)
+            logger.info(f"Warmed sent alert cache: {self.cache.stats()['entries']} entries")
+        except Exception as e:
+            logger.warning(f"Could not warm sent alert cache: {str(e)}")
+
+    def duplicate_window(self):
+        """How far back a sent alert suppresses the same identifier; re-read every ALERT_DEDUP_SYNC_SECONDS"""
+        now = time.monotonic()
+        if self._window is None or now - self._window_read_at >= Config.ALERT_DEDUP_SYNC_SECONDS:
+            # Reduced from 24 hours to 4 hours by default to allow more alerts through
+            self._window = datetime.timedelta(hours=int(SystemConfig.get_value('alert_duplicate_window', '4')))
+            self._window_read_at = now
+        return self._window
+
+    def sent_identifiers(self, alert_config_id, identifiers, window=None):
+        """Return which of the identifiers were sent for the config within the window"""
+        identifiers = list(set(identifiers))
+        cutoff_time = datetime.datetime.utcnow() - (window or self.duplicate_window())
+        sent = set()
+        for start in range(0, len(identifiers), LOOKUP_CHUNK_SIZE):
+            rows = db.session.query(SentAlert.alert_identifier).filter(
+                SentAlert.alert_config_id == alert_config_id,
+                SentAlert.alert_identifier.in_(identifiers[start:start + LOOKUP_CHUNK_SIZE]),
+                SentAlert.timestamp >= cutoff_time
+            ).all()
+            sent.update(row.alert_identifier for row in rows)
+        return sent
+
+    def filter_new(self, alert_config_id, alerts):
+        """
+        Drop alerts already sent for the config.
+
+        Returns:
+            (new_alerts, new_identifiers, duplicate_count), with
+            new_identifiers in the same order as new_alerts
+        """
+        identifiers = [alert_identifier(alert) for alert in alerts]
+        unique = set(identifiers)
+        candidates = unique
+        window = self.duplicate_window() if unique else None
+        if Config.ALERT_DEDUP_CACHE_ENABLED and unique:
+            try:
+                self.cache.sync(window)
+                candidates = {identifier for identifier in unique
+                              if self.cache.might_contain(alert_config_id, identifier)}
+            except Exception as e:
+                # Fall back to checking everything in the database
+                logger.warning(f"Sent alert cache unavailable: {str(e)}")
+                self._count(cache_errors=1)
+                candidates = unique
+
+        sent = self.sent_identifiers(alert_config_id, candidates, window) if candidates else set()
+        self._count(lookups=len(unique), answered_from_memory=len(unique) - len(candidates),
+                    checked_in_db=len(candidates), confirmed_duplicates=len(sent),
+                    false_positives=len(candidates) - len(sent) if candidates is not unique else 0)
+
+        new_alerts = []
+        new_identifiers = []
+        for alert, identifier in zip(alerts, identifiers):
+            if identifier in sent:
+                logger.debug(f"Duplicate alert skipped: {identifier[:10]}...")
+                continue
+            new_alerts.append(alert)
+            new_identifiers.append(identifier)
+        return new_alerts, new_identifiers, len(alerts) - len(new_alerts)
+
+    def record_sent(self, alert_config_id, identifiers):
+        """Record identifiers as sent for the config in one insert and one commit"""
+        now = datetime.datetime.utcnow()
+        rows = [
+            {"alert_config_id": alert_config_id, "alert_identifier": identifier, "timestamp": now}
+            for identifier in dict.fromkeys(identifiers)
+        ]
+        if not rows:
+            return
+        try:
+            db.session.execute(insert(SentAlert), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if Config.ALERT_DEDUP_CACHE_ENABLED:
+            self.cache.add(alert_config_id, [row["alert_identifier"] for row in rows], now)
+
+    def _prune_table(self, model, column, cutoff):
+        """Delete rows older than cutoff in bounded batches; return (deleted, batches)"""
+        deleted = 0
+        batches = 0
+        while batches < Config.DEDUP_PRUNE_MAX_BATCHES:
+            ids = [row.id for row in db.session.query(model.id).filter(
+                column < cutoff).limit(Config.DEDUP_PRUNE_BATCH_SIZE).all()]
+            if not ids:
+                break
+            try:
+                model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            deleted += len(ids)
+            batches += 1
+            if len(ids) < Config.DEDUP_PRUNE_BATCH_SIZE:
+                break
+        return deleted, batches
+
+    def prune(self):
+        """
+        Delete sent alerts older than the duplicate window (but not younger
+        than SENT_ALERT_MIN_RETENTION_HOURS) and report deliveries older than
+        REPORT_DELIVERY_RETENTION_DAYS, at most DEDUP_PRUNE_MAX_BATCHES
+        batches of each per run; call inside an app context
+        """
+        started = time.monotonic()
+        now = datetime.datetime.utcnow()
+        retention = max(self.duplicate_window(), datetime.timedelta(hours=Config.SENT_ALERT_MIN_RETENTION_HOURS))
+        sent_alerts, sent_batches = self._prune_table(SentAlert, SentAlert.timestamp, now - retention)
+        deliveries, delivery_batches = self._prune_table(
+            ReportDelivery, ReportDelivery.sent_at,
+            now - datetime.timedelta(days=Config.REPORT_DELIVERY_RETENTION_DAYS))
+
+        self._last_prune = {
+            "at": now.isoformat(),
+            "sent_alerts_deleted": sent_alerts,
+            "report_deliveries_deleted": deliveries,
+            "batches": sent_batches + delivery_batches,
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+            "complete": max(sent_batches, delivery_batches) < Config.DEDUP_PRUNE_MAX_BATCHES
+        }
+        return self._last_prune
+
+    def table_stats(self):
+        """Row counts of the dedup tables and the last prune run; call inside an app context"""
+        return {
+            "sent_alert_rows": SentAlert.query.count(),
+            "report_delivery_rows": ReportDelivery.query.count(),
+            "last_prune": self._last_prune
+        }
+
+    def stats(self):
+        with self._counter_lock:
+            counters = dict(self._counters)
+        counters["observed_false_positive_rate"] = round(
+            counters["false_positives"] / counters["checked_in_db"], 6) if counters["checked_in_db"] else 0.0
+        counters["cache_enabled"] = Config.ALERT_DEDUP_CACHE_ENABLED
+        counters["cache"] = self.cache.stats()
+        return counters
+
+
+_alert_deduplicator = AlertDeduplicator()
+
+
+def get_alert_deduplicator():
+    """Return the process-wide alert deduplicator"""
+    return _alert_deduplicator
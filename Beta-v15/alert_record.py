@@ -0,0 +1,172 @@
+import datetime
+
+# Where Wazuh puts the same fact for different decoders, in lookup order
+USERNAME_PATHS = (
+    ("data", "win", "eventdata", "targetUserName"),
+    ("data", "win", "eventdata", "SubjectUserName"),
+    ("data", "win", "eventdata", "subjectUserName"),
+    ("data", "win", "eventdata", "UserName"),
+    ("syscheck", "uname_after"),
+    ("data", "user")
+)
+
+SOURCE_IP_PATHS = (
+    ("data", "srcip"),
+    ("data", "win", "eventdata", "SourceAddress")
+)
+
+DESTINATION_IP_PATHS = (
+    ("data", "dstip"),
+    ("data", "win", "eventdata", "DestinationAddress")
+)
+
+
+def severity_bucket(level):
+    """Map a Wazuh rule level to critical, high, medium or low"""
+    try:
+        level = int(level)
+    except (TypeError, ValueError):
+        return "low"
+    if level >= 15:
+        return "critical"
+    if level >= 12:
+        return "high"
+    if level >= 7:
+        return "medium"
+    return "low"
+
+
+def _dig(source, path):
+    current = source
+    for part in path:
+        if not isinstance(current, dict):
+            return None
+        current = current.get(part)
+    return current
+
+
+def _first(source, paths):
+    for path in paths:
+        value = _dig(source, path)
+        if value:
+            return value
+    return None
+
+
+def parse_timestamp(value):
+    """Parse an ISO timestamp into a naive UTC datetime, or None"""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class AlertRecord:
+    """
+    The fields every consumer reads from a Wazuh alert, pulled out of the
+    hit once. The raw _source stays reachable through .source and .get()
+    for anything else.
+    """
+
+    __slots__ = (
+        "id", "index", "timestamp", "timestamp_raw",
+        "agent_id", "agent_name", "agent_ip", "location",
+        "rule_id", "rule_description", "rule_level", "rule_groups", "mitre_ids", "severity",
+        "username", "source_ip", "destination_ip", "login_type", "file_path",
+        "_source"
+    )
+
+    def __init__(self, source, alert_id=None, index=None):
+        source = source or {}
+        agent = source.get("agent") or {}
+        rule = source.get("rule") or {}
+
+        self.id = alert_id
+        self.index = index
+        self.timestamp_raw = source.get("@timestamp")
+        self.timestamp = parse_timestamp(self.timestamp_raw)
+
+        self.agent_id = agent.get("id")
+        self.agent_name = agent.get("name")
+        self.agent_ip = agent.get("ip")
+        self.location = _dig(agent, ("labels", "location", "set"))
+
+        self.rule_id = rule.get("id")
+        self.rule_description = rule.get("description")
+        self.rule_level = rule.get("level")
+        self.rule_groups = rule.get("groups") or []
+        self.mitre_ids = _dig(rule, ("mitre", "id")) or []
+        self.severity = severity_bucket(self.rule_level)
+
+        self.username = _first(source, USERNAME_PATHS)
+        self.source_ip = _first(source, SOURCE_IP_PATHS)
+        self.destination_ip = _first(source, DESTINATION_IP_PATHS)
+        self.login_type = _dig(source, ("data", "win", "eventdata", "logonType"))
+        self.file_path = _dig(source, ("syscheck", "path"))
+
+        self._source = source
+
+    @classmethod
+    def from_hit(cls, hit):
+        """
+        Build a record from an OpenSearchAPI result ({"id", "index", "source"})
+        or a raw OpenSearch hit ({"_id", "_index", "_source"})
+        """
+        if isinstance(hit, cls):
+            return hit
+        if "source" in hit:
+            return cls(hit["source"], hit.get("id"), hit.get("index"))
+        return cls(hit.get("_source"), hit.get("_id"), hit.get("_index"))
+
+    @property
+    def source(self):
+        """The raw alert _source"""
+        return self._source
+
+    def get(self, field, default=None):
+        """Look up a dotted field (e.g. "decoder.name") in the raw source"""
+        value = _dig(self._source, field.split("."))
+        return default if value is None else value
+
+    def apply_rule_metadata(self, entry):
+        """Fill rule fields the alert (or its projection) lacks from a rule catalog entry"""
+        if not entry:
+            return
+        if not self.rule_description:
+            self.rule_description = entry.get("description")
+        if self.rule_level is None and entry.get("level") is not None:
+            self.rule_level = entry["level"]
+            self.severity = severity_bucket(self.rule_level)
+        if not self.rule_groups:
+            self.rule_groups = entry.get("groups") or []
+        if not self.mitre_ids:
+            self.mitre_ids = entry.get("mitre_ids") or []
+
+    def format_timestamp(self, fmt='%Y-%m-%d %H:%M:%S', offset_hours=0, default='N/A'):
+        """
+        Format the alert time shifted by offset_hours from UTC, falling back
+        to the raw value (or default) when it could not be parsed
+        """
+        if self.timestamp is None:
+            return self.timestamp_raw or default
+        return (self.timestamp + datetime.timedelta(hours=offset_hours)).strftime(fmt)
+
+
+def normalize_alerts(hits):
+    """Lazily turn an iterable of hits into AlertRecords"""
+    for hit in hits:
+        yield AlertRecord.from_hit(hit)
+
+
+def enrich_rules(records, rule_catalog):
+    """Fill missing rule metadata on AlertRecords with one catalog lookup"""
+    records = list(records)
+    entries = rule_catalog.lookup_many(record.rule_id for record in records)
+    for record in records:
+        record.apply_rule_metadata(entries.get(str(record.rule_id)))
+    return records
@@ -1,6 +1,10 @@
 import logging
 import time
+from config import Config
 from email_alerts import EmailAlerts
+from mail_sender import get_mail_outbox
+from opensearch_api import query_caller
+from leader_election import get_leader_lease
 from app import app
 from models import db, SystemConfig
 
@@ -9,22 +13,43 @@ logger = logging.getLogger('alert_worker')
 def alert_worker():
     """
     Background worker that checks for new alerts and sends email notifications.
+    Only the process holding the scheduler lease sends; the rest stand by.
+
+    The worker only runs when the scheduler could not start, so it also
+    drains the mail outbox every OUTBOX_POLL_SECONDS in place of the
+    scheduler's deliver_outbox job.
     """
     logger.info("Starting alert worker thread")
     email_manager = EmailAlerts()
+    outbox = get_mail_outbox()
+    lease = get_leader_lease()
+    lease.start(app)
+    next_check = 0
     
     while True:
         try:
             with app.app_context():
                 # Get check interval from system config (in minutes, default 2)
                 interval_mins = int(SystemConfig.get_value('alert_check_interval', '2'))
-                logger.debug(f"Alert worker checking for new alerts (interval: {interval_mins}m)")
                 
-                # Check and send alerts
-                email_manager.check_and_send_alerts()
+                if lease.is_leader:
+                    # Check and send alerts
+                    if time.monotonic() >= next_check:
+                        logger.debug(f"Alert worker checking for new alerts (interval: {interval_mins}m)")
+                        with query_caller('worker:alert_worker'):
+                            email_manager.check_and_send_alerts()
+                        next_check = time.monotonic() + interval_mins * 60
+                    
+                    # Deliver the emails queued above, and any retries now due
+                    result = outbox.deliver_due()
+                    if result['retrying'] or result['dead']:
+                        logger.warning(f"Outbox: {result['sent']} sent, {result['retrying']} to retry, "
+                                       f"{result['dead']} dead-lettered")
+                else:
+                    logger.debug("Alert worker standing by: not the scheduler leader")
                 
-            # Wait for next check
-            time.sleep(interval_mins * 60)
+            # Wait for the next outbox poll
+            time.sleep(min(Config.OUTBOX_POLL_SECONDS, interval_mins * 60))
         except Exception as e:
             logger.error(f"Error in alert worker: {str(e)}")
             time.sleep(60) # Wait a minute before retrying on error
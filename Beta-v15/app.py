@@ -103,9 +103,11 @@ except ImportError as e:
     # Continue without the problematic blueprint
 
 # Initialize the scheduler for background tasks
+scheduler_started = False
 try:
     import scheduler
     scheduler.init_app(app)
+    scheduler_started = True
     logger.info("Scheduler initialized successfully")
 except Exception as e:
     logger.warning(f"Scheduler initialization issue: {e}")
@@ -114,8 +116,11 @@ except Exception as e:
 # Create tables and default admin user within app context
 with app.app_context():
     try:
-        from models import User, AlertConfig, ReportConfig, AiInsightTemplate, AiInsightResult, RetentionPolicy, SentAlert, SystemConfig, StoredAlert
+        from models import User, AlertConfig, ReportConfig, AiInsightTemplate, AiInsightResult, RetentionPolicy, SentAlert, SystemConfig, StoredAlert, SchedulerLease, AlertWatermark, ReportDelivery, OutboundEmail
         db.create_all()
+        # create_all skips indexes added to tables that already exist
+        for index in SentAlert.__table__.indexes | StoredAlert.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
 
         # Create default admin user if no users exist
         if User.query.count() == 0:
@@ -134,6 +139,9 @@ with app.app_context():
 @app.before_request
 def before_request():
     g.user = current_user
+    # Retention may have deleted data from another worker process
+    from retention_manager import sync_retention_invalidation
+    sync_retention_invalidation()
     # Check if user is authenticated and accessing a non-auth route
     if current_user.is_authenticated:
         session.permanent = True
@@ -158,15 +166,17 @@ def internal_error(error):
     logger.error(f"Internal server error: {error}")
     return "Internal server error", 500
 
-# Start alert worker thread
-try:
-    import threading
-    from alert_worker import alert_worker
-    worker_thread = threading.Thread(target=alert_worker, daemon=True)
-    worker_thread.start()
-    logger.info("Alert worker thread started successfully")
-except Exception as e:
-    logger.error(f"Failed to start alert worker thread: {e}")
+# The scheduler's check_alerts job (check_and_send_alerts) already sweeps alerts; the standalone
+# worker thread is only a fallback when the scheduler could not start
+if not scheduler_started:
+    try:
+        import threading
+        from alert_worker import alert_worker
+        worker_thread = threading.Thread(target=alert_worker, daemon=True)
+        worker_thread.start()
+        logger.info("Alert worker thread started successfully")
+    except Exception as e:
+        logger.error(f"Failed to start alert worker thread: {e}")
 
 if __name__ == '__main__':
     import socket
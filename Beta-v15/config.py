@@ -17,6 +17,24 @@ class Config:
     WAZUH_API_PASSWORD = os.environ.get('WAZUH_API_PASSWORD',
                                         'Jbbp1P*9ydI*EP7.Wa2MCLsKM?lcz+iH')
     WAZUH_VERIFY_SSL = os.environ.get('WAZUH_VERIFY_SSL', 'False') == 'True'
+    # Shared keep-alive session: pool size and connect/read timeouts (seconds)
+    WAZUH_POOL_MAXSIZE = int(os.environ.get('WAZUH_POOL_MAXSIZE', 10))
+    WAZUH_CONNECT_TIMEOUT = float(os.environ.get('WAZUH_CONNECT_TIMEOUT', 5))
+    WAZUH_TIMEOUT = float(os.environ.get('WAZUH_TIMEOUT', 30))
+    # Re-authenticate this many seconds before the JWT expires
+    WAZUH_TOKEN_REFRESH_MARGIN = int(os.environ.get('WAZUH_TOKEN_REFRESH_MARGIN', 60))
+    # Bulk listings (agents, rules) are paged in parallel
+    WAZUH_PAGE_SIZE = int(os.environ.get('WAZUH_PAGE_SIZE', 500))
+    WAZUH_FETCH_WORKERS = int(os.environ.get('WAZUH_FETCH_WORKERS', 4))
+    # Agent inventory: status refresh and full reload intervals (seconds)
+    WAZUH_AGENT_REFRESH_SECONDS = int(os.environ.get('WAZUH_AGENT_REFRESH_SECONDS', 60))
+    WAZUH_AGENT_FULL_RELOAD_SECONDS = int(
+        os.environ.get('WAZUH_AGENT_FULL_RELOAD_SECONDS', 900))
+    # Minimum seconds between inventory load attempts after one fails
+    WAZUH_AGENT_RETRY_SECONDS = int(os.environ.get('WAZUH_AGENT_RETRY_SECONDS', 30))
+    # Rule catalog: full reload interval, and minimum seconds between lookups of unknown IDs
+    WAZUH_RULE_RELOAD_SECONDS = int(os.environ.get('WAZUH_RULE_RELOAD_SECONDS', 3600))
+    WAZUH_RULE_MISS_RETRY_SECONDS = int(os.environ.get('WAZUH_RULE_MISS_RETRY_SECONDS', 300))
 
     # OpenSearch configuration
     OPENSEARCH_URL = os.environ.get('OPENSEARCH_URL',
@@ -27,6 +45,58 @@ class Config:
                                            'False') == 'True'
     OPENSEARCH_INDEX_PATTERN = os.environ.get('OPENSEARCH_INDEX_PATTERN',
                                               'wazuh-alerts-*')
+    # Shared OpenSearch client pool (one client per process)
+    OPENSEARCH_POOL_MAXSIZE = int(os.environ.get('OPENSEARCH_POOL_MAXSIZE', 10))
+    OPENSEARCH_TIMEOUT = int(os.environ.get('OPENSEARCH_TIMEOUT', 30))
+    OPENSEARCH_KEEPALIVE = os.environ.get('OPENSEARCH_KEEPALIVE',
+                                          'True') == 'True'
+    OPENSEARCH_HEALTH_CHECK_INTERVAL = int(
+        os.environ.get('OPENSEARCH_HEALTH_CHECK_INTERVAL', 60))
+    # Per-request timeout for interactive reads; bulk reads use OPENSEARCH_TIMEOUT
+    OPENSEARCH_REQUEST_TIMEOUT = int(os.environ.get('OPENSEARCH_REQUEST_TIMEOUT', 10))
+    # Jittered retries for idempotent reads (backoff in seconds)
+    OPENSEARCH_MAX_RETRIES = int(os.environ.get('OPENSEARCH_MAX_RETRIES', 2))
+    OPENSEARCH_RETRY_BACKOFF = float(os.environ.get('OPENSEARCH_RETRY_BACKOFF', 0.2))
+    OPENSEARCH_RETRY_BACKOFF_MAX = float(
+        os.environ.get('OPENSEARCH_RETRY_BACKOFF_MAX', 2.0))
+    # Circuit breaker: consecutive failures before opening, seconds before a trial request
+    OPENSEARCH_BREAKER_FAILURES = int(os.environ.get('OPENSEARCH_BREAKER_FAILURES', 5))
+    OPENSEARCH_BREAKER_RESET_SECONDS = int(
+        os.environ.get('OPENSEARCH_BREAKER_RESET_SECONDS', 30))
+    # Streaming (point-in-time + search_after) page size and PIT lifetime
+    OPENSEARCH_BATCH_SIZE = int(os.environ.get('OPENSEARCH_BATCH_SIZE', 1000))
+    OPENSEARCH_PIT_KEEP_ALIVE = os.environ.get('OPENSEARCH_PIT_KEEP_ALIVE', '2m')
+    # Timeline buckets older than this many seconds are treated as final
+    OPENSEARCH_TIMELINE_SETTLE_SECONDS = int(
+        os.environ.get('OPENSEARCH_TIMELINE_SETTLE_SECONDS', 300))
+    # Resolve time-bounded queries to the daily indices they cover
+    OPENSEARCH_INDEX_PRUNING = os.environ.get('OPENSEARCH_INDEX_PRUNING',
+                                              'True') == 'True'
+    OPENSEARCH_INDEX_REFRESH_INTERVAL = int(
+        os.environ.get('OPENSEARCH_INDEX_REFRESH_INTERVAL', 300))
+    # Seconds between checks for retention deletions made by other processes
+    RETENTION_SYNC_SECONDS = int(os.environ.get('RETENTION_SYNC_SECONDS', 30))
+    # OpenSearch calls slower than this are logged and kept in the slow-query log
+    OPENSEARCH_SLOW_QUERY_MS = int(os.environ.get('OPENSEARCH_SLOW_QUERY_MS', 1000))
+    OPENSEARCH_SLOW_QUERY_LOG_SIZE = int(
+        os.environ.get('OPENSEARCH_SLOW_QUERY_LOG_SIZE', 100))
+    # Aggregation response cache (per process)
+    OPENSEARCH_CACHE_ENABLED = os.environ.get('OPENSEARCH_CACHE_ENABLED',
+                                              'True') == 'True'
+    OPENSEARCH_CACHE_MAXSIZE = int(os.environ.get('OPENSEARCH_CACHE_MAXSIZE', 256))
+    # Dashboards may be served cached results up to this old while the cluster is failing
+    OPENSEARCH_STALE_MAX_AGE = int(os.environ.get('OPENSEARCH_STALE_MAX_AGE', 900))
+    # Time bounds are rounded to this many seconds so near-identical requests share an entry
+    OPENSEARCH_CACHE_GRANULARITY = int(
+        os.environ.get('OPENSEARCH_CACHE_GRANULARITY', 60))
+
+    # Free-text alert search: auto, exact, prefix, phrase or deep (slow fuzzy/wildcard)
+    SEARCH_DEFAULT_MODE = os.environ.get('SEARCH_DEFAULT_MODE', 'auto')
+
+    # Background jobs run in one process at a time: lease lifetime and renewal
+    # interval in seconds (a dead leader is replaced within about the lifetime)
+    LEADER_LEASE_SECONDS = int(os.environ.get('LEADER_LEASE_SECONDS', 60))
+    LEADER_RENEW_SECONDS = int(os.environ.get('LEADER_RENEW_SECONDS', 15))
 
     # AI Model configuration
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY','')
@@ -44,6 +114,44 @@ class Config:
     SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', 'wceayzkwergccqrd')
     SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS', 'True') == 'True'
     SMTP_SENDER_NAME = os.environ.get('SMTP_SENDER_NAME', 'WAZUH Alerts')
+    SMTP_TIMEOUT = int(os.environ.get('SMTP_TIMEOUT', 30))
+    # Pooled SMTP sessions, each reused for this many messages or seconds
+    SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 2))
+    SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.environ.get('SMTP_MAX_MESSAGES_PER_CONNECTION', 50))
+    SMTP_CONNECTION_MAX_AGE = int(os.environ.get('SMTP_CONNECTION_MAX_AGE', 120))
+    # Outbox: emails queued by the scheduled jobs, delivered every
+    # OUTBOX_POLL_SECONDS by SMTP_SEND_WORKERS threads with exponential backoff
+    SMTP_SEND_WORKERS = int(os.environ.get('SMTP_SEND_WORKERS', 2))
+    OUTBOX_POLL_SECONDS = int(os.environ.get('OUTBOX_POLL_SECONDS', 10))
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 50))
+    OUTBOX_SEND_TIMEOUT = int(os.environ.get('OUTBOX_SEND_TIMEOUT', 300))
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 8))
+    OUTBOX_RETRY_BASE_SECONDS = int(os.environ.get('OUTBOX_RETRY_BASE_SECONDS', 30))
+    OUTBOX_RETRY_MAX_SECONDS = int(os.environ.get('OUTBOX_RETRY_MAX_SECONDS', 3600))
+    OUTBOX_RETENTION_DAYS = int(os.environ.get('OUTBOX_RETENTION_DAYS', 7))
+    # Alert configs are evaluated from one streamed query per cycle: alerts kept
+    # per config, and the most alerts read from that stream
+    ALERT_CONFIG_MAX_ALERTS = int(os.environ.get('ALERT_CONFIG_MAX_ALERTS', 100))
+    ALERT_CYCLE_MAX_ALERTS = int(os.environ.get('ALERT_CYCLE_MAX_ALERTS', 10000))
+    # Polling only reads alerts older than this, so ones still being indexed
+    # are not skipped past by the watermark
+    ALERT_INGEST_GRACE_SECONDS = int(os.environ.get('ALERT_INGEST_GRACE_SECONDS', 60))
+    # Watermarks older than this are dropped rather than replayed from
+    ALERT_WATERMARK_MAX_AGE_MINUTES = int(os.environ.get('ALERT_WATERMARK_MAX_AGE_MINUTES', 1440))
+    # In-memory sent alert cache: one Bloom filter per hour of the duplicate
+    # window, sized for this many sent alerts at this false positive rate
+    ALERT_DEDUP_CACHE_ENABLED = os.environ.get('ALERT_DEDUP_CACHE_ENABLED', 'True') == 'True'
+    ALERT_DEDUP_BUCKET_CAPACITY = int(os.environ.get('ALERT_DEDUP_BUCKET_CAPACITY', 50000))
+    ALERT_DEDUP_FALSE_POSITIVE_RATE = float(os.environ.get('ALERT_DEDUP_FALSE_POSITIVE_RATE', 0.001))
+    # Minimum seconds between cache syncs (and duplicate window reads) from the database
+    ALERT_DEDUP_SYNC_SECONDS = int(os.environ.get('ALERT_DEDUP_SYNC_SECONDS', 30))
+    # Pruning: sent alerts are kept for the duplicate window but at least this
+    # long (the alert config debug view shows the last 24 hours)
+    SENT_ALERT_MIN_RETENTION_HOURS = int(os.environ.get('SENT_ALERT_MIN_RETENTION_HOURS', 24))
+    REPORT_DELIVERY_RETENTION_DAYS = int(os.environ.get('REPORT_DELIVERY_RETENTION_DAYS', 90))
+    DEDUP_PRUNE_INTERVAL_MINUTES = int(os.environ.get('DEDUP_PRUNE_INTERVAL_MINUTES', 60))
+    DEDUP_PRUNE_BATCH_SIZE = int(os.environ.get('DEDUP_PRUNE_BATCH_SIZE', 5000))
+    DEDUP_PRUNE_MAX_BATCHES = int(os.environ.get('DEDUP_PRUNE_MAX_BATCHES', 20))
     # Alert severity levels mapping
     SEVERITY_LEVELS = {
         'critical': 15,  # Level 15
@@ -1,16 +1,19 @@
 import os
 import logging
 import smtplib
-import hashlib
-import json
+import functools
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
 from config import Config
-from opensearch_api import OpenSearchAPI
+from opensearch_api import OpenSearchAPI, SOURCE_PROFILES, known_severity_levels, matches_severity_levels, run_concurrently
 from report_generator import ReportGenerator
+from alert_record import AlertRecord, enrich_rules, normalize_alerts
+from alert_dedup import get_alert_deduplicator
+from mail_sender import get_mail_outbox, get_smtp_pool
+from wazuh_api import get_rule_catalog
 import datetime
-from models import SentAlert, SystemConfig, db
+from models import AlertWatermark, SystemConfig, db
 
 logger = logging.getLogger(__name__)
 
@@ -24,76 +27,7 @@ class EmailAlerts:
         self.opensearch = OpenSearchAPI()
         self.report_generator = ReportGenerator()
         
-    def _generate_alert_identifier(self, alert_data):
-        """
-        Generate a unique identifier for an alert based on specified fields
-        to prevent duplicate notifications
-        
-        Args:
-            alert_data: The alert data from OpenSearch
-            
-        Returns:
-            String hash representing the unique alert
-        """
-        # Extract key fields for deduplication
-        source = alert_data.get('source', {})
-        
-        # Get the fields that should be used to identify unique alerts
-        # Use fewer fields to prevent over-deduplication
-        fields = {
-            'rule_id': source.get('rule', {}).get('id', ''),
-            'agent_ip': source.get('agent', {}).get('ip', ''),
-            'agent_name': source.get('agent', {}).get('name', ''),
-            'rule_level': source.get('rule', {}).get('level', ''),
-            # Use rounded timestamp (to nearest minute) to group similar alerts
-            'timestamp_minute': source.get('@timestamp', '')[:16] if source.get('@timestamp') else ''
-        }
-        
-        # Create a string representation and hash it
-        identifier_str = json.dumps(fields, sort_keys=True)
-        return hashlib.md5(identifier_str.encode()).hexdigest()
-    
-    def _is_alert_already_sent(self, alert_config_id, alert_identifier):
-        """
-        Check if an alert with this identifier has already been sent for this config
-        
-        Args:
-            alert_config_id: ID of the alert configuration
-            alert_identifier: Hash of the alert's unique identifiers
-            
-        Returns:
-            Boolean indicating if the alert was already sent
-        """
-        # Get duplicate prevention window from system config or use 4 hours as default
-        # Reduced from 24 hours to 4 hours to allow more alerts through
-        duplicate_window = int(SystemConfig.get_value('alert_duplicate_window', '4'))
-        cutoff_time = datetime.datetime.utcnow() - datetime.timedelta(hours=duplicate_window)
-        
-        # Query for existing alerts
-        existing_alert = SentAlert.query.filter(
-            SentAlert.alert_config_id == alert_config_id,
-            SentAlert.alert_identifier == alert_identifier,
-            SentAlert.timestamp >= cutoff_time
-        ).first()
-        
-        return existing_alert is not None
-        
-    def _record_sent_alert(self, alert_config_id, alert_identifier):
-        """
-        Record that an alert has been sent to prevent duplicates
-        
-        Args:
-            alert_config_id: ID of the alert configuration
-            alert_identifier: Hash of the alert's unique identifiers
-        """
-        sent_alert = SentAlert(
-            alert_config_id=alert_config_id,
-            alert_identifier=alert_identifier
-        )
-        db.session.add(sent_alert)
-        db.session.commit()
-    
-    def send_alert_email(self, recipient, subject, message, attachments=None):
+    def send_alert_email(self, recipient, subject, message, attachments=None, wait=True, source=None):
         """
         Send alert email
         
@@ -102,9 +36,12 @@ class EmailAlerts:
             subject: Email subject
             message: Email body (HTML)
             attachments: List of dicts with 'content' (BytesIO), 'filename', and 'mime_type'
+            wait: Send now over a pooled SMTP session; if False, store the
+                message in the outbox for delivery (with retries) and return
+            source: What the email is for, shown in the outbox (e.g. "alert_config:3")
             
         Returns:
-            Boolean indicating success or failure
+            Boolean indicating success (or, with wait=False, that it was queued)
         """
         if not self.smtp_username or not self.smtp_password:
             logger.error("SMTP credentials not configured")
@@ -149,27 +86,17 @@ class EmailAlerts:
                         logger.error(f"Error attaching file {attachment.get('filename', 'unknown')}: {str(attach_error)}")
                         continue
             
-            # Connect to SMTP server and send email
-            logger.info(f"📧 Connecting to SMTP server: {self.smtp_server}:{self.smtp_port}")
+            if not wait:
+                return get_mail_outbox().enqueue(msg, source=source)
             
+            # Send over a pooled, already authenticated SMTP session
             try:
-                with smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30) as server:
-                    server.set_debuglevel(1)  # Enable SMTP debugging
-                    
-                    if self.smtp_use_tls:
-                        logger.info("📧 Starting TLS connection")
-                        server.starttls()
-                    
-                    logger.info(f"📧 Logging in with username: {self.smtp_username}")
-                    server.login(self.smtp_username, self.smtp_password)
-                    
-                    logger.info("📧 Sending message")
-                    send_result = server.send_message(msg)
-                    
-                    if send_result:
-                        logger.warning(f"📧 Some recipients failed: {send_result}")
-                    else:
-                        logger.info("📧 Message sent to all recipients successfully")
+                send_result = get_smtp_pool().send(msg)
+                
+                if send_result:
+                    logger.warning(f"📧 Some recipients failed: {send_result}")
+                else:
+                    logger.info("📧 Message sent to all recipients successfully")
                 
                 logger.info(f"✅ Alert email successfully sent to {recipient}")
                 return True
@@ -198,21 +125,192 @@ class EmailAlerts:
         try:
             # Get all enabled alert configurations
             configs = AlertConfig.query.filter_by(enabled=True).all()
+            if not configs:
+                return
             
+            batches, alert_counts = self.evaluate_alert_configs(configs)
             for config in configs:
                 logger.info(f"Checking alerts for config: {config.name} (Recipient: {config.email_recipient})")
-                self.send_severity_alert(config)
+                self.send_severity_alert(config, alerts_data=batches[config.id], alert_counts=alert_counts.get(config.id),
+                                         wait=False)
                 
         except Exception as e:
             logger.error(f"Error in check_and_send_alerts: {str(e)}")
 
-    def send_severity_alert(self, alert_config, alerts_data=None):
+    def evaluate_alert_configs(self, alert_configs):
+        """
+        Fetch the alerts each AlertConfig has not been sent yet, with one query.
+        
+        Every config keeps an AlertWatermark at the last alert it handled.
+        One oldest-first stream over the union of the configs' severity
+        levels resumes after the oldest watermark (configs without one start
+        alert_check_interval minutes back), stops ALERT_INGEST_GRACE_SECONDS
+        short of now, and hands each hit to every config whose levels match
+        and whose watermark it is past. A config takes at most
+        ALERT_CONFIG_MAX_ALERTS per cycle and picks up the rest next cycle;
+        while it is more than two intervals behind it gets its own stream.
+        Severity counts are then fetched once per distinct window among the
+        configs that have alerts.
+        
+        Args:
+            alert_configs: AlertConfig objects
+            
+        Returns:
+            ({config_id: alerts_data}, {config_id: alert_counts}). Each
+            alerts_data carries the "watermark" that send_severity_alert
+            stores once it is handled and the "window" (start, end) its
+            alerts were read from; on a query error every config's
+            alerts_data is {"error": ...}. Configs without alerts get no
+            counts.
+        """
+        alert_check_interval = int(SystemConfig.get_value('alert_check_interval', '2'))
+        window_end = datetime.datetime.utcnow() - datetime.timedelta(seconds=Config.ALERT_INGEST_GRACE_SECONDS)
+        window_start = window_end - datetime.timedelta(minutes=alert_check_interval)
+        oldest_allowed = window_end - datetime.timedelta(minutes=Config.ALERT_WATERMARK_MAX_AGE_MINUTES)
+        
+        # Where each config resumes: (alert time, sort values or None)
+        cursors = {}
+        for config in alert_configs:
+            watermark = config.watermark
+            if watermark and watermark.alert_timestamp >= oldest_allowed:
+                cursors[config.id] = (watermark.alert_timestamp, watermark.get_sort_values())
+            else:
+                if watermark:
+                    logger.warning(f"Watermark for alert config {config.id} is older than "
+                                   f"{Config.ALERT_WATERMARK_MAX_AGE_MINUTES} minutes; restarting from the last interval")
+                cursors[config.id] = (window_start, None)
+        
+        levels = {config.id: known_severity_levels(config.get_alert_levels()) for config in alert_configs}
+        include_fields = {config.id: config.get_include_fields() for config in alert_configs}
+        
+        def is_past(position, cursor):
+            if cursor[1] is None or position[1] is None:
+                return position[0] >= cursor[0]
+            return position[1] > cursor[1]
+        
+        def classify(config_ids):
+            # A config without any known severity keyword matches everything
+            if all(levels[config_id] for config_id in config_ids):
+                union_levels = sorted(set().union(*(levels[config_id] for config_id in config_ids)))
+            else:
+                union_levels = None
+            fields = set()
+            for config_id in config_ids:
+                fields.update(include_fields[config_id])
+            stream_start, stream_after = min((cursors[config_id] for config_id in config_ids),
+                                             key=lambda cursor: (cursor[0], cursor[1] is not None))
+            
+            batches = {config_id: {"results": [], "total": 0, "watermark": None} for config_id in config_ids}
+            last_position = None
+            read = 0
+            cut_off = False
+            for hit in self.opensearch.iter_alerts(
+                    severity_levels=union_levels,
+                    start_time=stream_start.isoformat(),
+                    end_time=window_end.isoformat(),
+                    sort_order="asc",
+                    max_results=Config.ALERT_CYCLE_MAX_ALERTS,
+                    projection=SOURCE_PROFILES["email"] + sorted(fields),
+                    search_after=stream_after):
+                # The first sort value is @timestamp in epoch milliseconds
+                last_position = (datetime.datetime.utcfromtimestamp(hit["sort"][0] / 1000), hit["sort"])
+                read += 1
+                record = AlertRecord.from_hit(hit)
+                for config_id in config_ids:
+                    batch = batches[config_id]
+                    if len(batch["results"]) < Config.ALERT_CONFIG_MAX_ALERTS and \
+                            is_past(last_position, cursors[config_id]) and \
+                            matches_severity_levels(record, levels[config_id]):
+                        batch["results"].append(hit)
+                        batch["total"] += 1
+                        batch["watermark"] = last_position
+                if all(len(batch["results"]) >= Config.ALERT_CONFIG_MAX_ALERTS for batch in batches.values()):
+                    cut_off = True
+                    break
+            
+            # Configs that were not cut off have seen everything read so far,
+            # and everything up to window_end if the stream ran out
+            if not cut_off and read < Config.ALERT_CYCLE_MAX_ALERTS:
+                last_position = (window_end, None)
+            for config_id, batch in batches.items():
+                if len(batch["results"]) < Config.ALERT_CONFIG_MAX_ALERTS and last_position and \
+                        is_past(last_position, cursors[config_id]):
+                    batch["watermark"] = last_position
+                # The stretch of time this batch covers, for the email text and counts
+                batch["window"] = (cursors[config_id][0],
+                                   batch["watermark"][0] if batch["watermark"] else window_end)
+            return batches
+        
+        # Configs at most two intervals behind share one stream. A config that
+        # fell further behind (it kept hitting ALERT_CONFIG_MAX_ALERTS) reads
+        # from its own cursor, so its backlog never holds the others back.
+        lag_limit = window_end - 2 * datetime.timedelta(minutes=alert_check_interval)
+        caught_up = [config_id for config_id, cursor in cursors.items() if cursor[0] >= lag_limit]
+        lagging = [config_id for config_id in cursors if config_id not in caught_up]
+        calls = {f"lagging:{config_id}": functools.partial(classify, [config_id]) for config_id in lagging}
+        if caught_up:
+            calls["shared"] = functools.partial(classify, caught_up)
+        fetched = run_concurrently(calls)
+        
+        batches = {}
+        for name, group in (("shared", caught_up),) + tuple((f"lagging:{config_id}", [config_id]) for config_id in lagging):
+            if not group:
+                continue
+            result = fetched[name]
+            if 'error' in result:
+                logger.error(f"Error fetching alerts for alert configs {group}: {result['error']}")
+                batches.update({config_id: {"error": result['error']} for config_id in group})
+            else:
+                batches.update(result)
+        if lagging:
+            logger.info(f"Alert configs {lagging} are behind and were read from their own watermarks")
+        logger.info(f"Evaluated {len(alert_configs)} alert configs with {len(calls)} "
+                    f"{'query' if len(calls) == 1 else 'queries'}")
+        
+        # Severity counts over each window that has alerts to send; configs
+        # read together mostly share one window, and so one count query
+        windows = {config_id: batch["window"] for config_id, batch in batches.items()
+                   if batch.get("results")}
+        distinct = sorted(set(windows.values()))
+        counts = run_concurrently({
+            index: functools.partial(
+                self.opensearch.get_alert_count_by_severity,
+                start_time=start.isoformat(),
+                end_time=end.isoformat()
+            )
+            for index, (start, end) in enumerate(distinct)
+        }) if distinct else {}
+        alert_counts = {config_id: counts[distinct.index(window)] for config_id, window in windows.items()}
+        return batches, alert_counts
+
+    def _advance_watermark(self, alert_config, alerts_data):
+        """Store the watermark of a handled batch so the next cycle resumes after it"""
+        watermark = (alerts_data or {}).get('watermark')
+        if not watermark or not hasattr(alert_config, 'id'):
+            return
+        
+        alert_timestamp, sort_values = watermark
+        try:
+            row = db.session.get(AlertWatermark, alert_config.id)
+            if row is None:
+                row = AlertWatermark(alert_config_id=alert_config.id)
+                db.session.add(row)
+            row.alert_timestamp = alert_timestamp
+            row.set_sort_values(sort_values)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error storing watermark for alert config {alert_config.id}: {str(e)}")
+
+    def send_severity_alert(self, alert_config, alerts_data=None, alert_counts=None, wait=True):
         """
         Send an alert email based on severity configuration
         
         Args:
             alert_config: AlertConfig object
             alerts_data: Optional pre-fetched alerts data
+            alert_counts: Optional pre-fetched severity counts for the window
+            wait: False to queue the email instead of sending it before returning
             
         Returns:
             Boolean indicating success or failure
@@ -230,22 +328,49 @@ class EmailAlerts:
                 logger.error("No recipient specified for alert")
                 return False
             
-            # Set time range for alerts
-            # Get the alert check interval from system config or use 2 minutes as default
-            alert_check_interval = int(SystemConfig.get_value('alert_check_interval', '2'))
+            # Set time range for alerts: the window the pre-fetched alerts were
+            # read from, or else the last alert check interval
             current_time_utc = datetime.datetime.utcnow()
             current_time_pkt = current_time_utc + datetime.timedelta(hours=5)  # Pakistan Standard Time
-            end_time = current_time_utc.isoformat()
-            start_time = (current_time_utc - datetime.timedelta(minutes=alert_check_interval)).isoformat()
+            if alerts_data and alerts_data.get('window'):
+                window_start, window_end = alerts_data['window']
+            else:
+                # Get the alert check interval from system config or use 2 minutes as default
+                alert_check_interval = int(SystemConfig.get_value('alert_check_interval', '2'))
+                window_start = current_time_utc - datetime.timedelta(minutes=alert_check_interval)
+                window_end = current_time_utc
+            start_time = window_start.isoformat()
+            end_time = window_end.isoformat()
+            window_start_pkt = window_start + datetime.timedelta(hours=5)
+            window_end_pkt = window_end + datetime.timedelta(hours=5)
             
-            # If alerts data not provided, fetch it
+            # Get the include_fields if available
+            include_fields = []
+            if hasattr(alert_config, 'get_include_fields') and callable(getattr(alert_config, 'get_include_fields')):
+                include_fields = alert_config.get_include_fields()
+            else:
+                include_fields = ["@timestamp", "agent.ip", "agent.labels.location.set", "agent.name", "rule.description", "rule.id"]
+            
+            # If alerts data not provided, fetch it together with the severity counts
             if not alerts_data:
-                alerts_data = self.opensearch.search_alerts(
-                    severity_levels=severity_levels,
-                    start_time=start_time,
-                    end_time=end_time,
-                    limit=100
-                )
+                # Only pull the fields the email table, dedup key and report use
+                fetched = run_concurrently({
+                    "alerts": functools.partial(
+                        self.opensearch.search_alerts,
+                        severity_levels=severity_levels,
+                        start_time=start_time,
+                        end_time=end_time,
+                        limit=100,
+                        projection=SOURCE_PROFILES["email"] + list(include_fields)
+                    ),
+                    "counts": functools.partial(
+                        self.opensearch.get_alert_count_by_severity,
+                        start_time=start_time,
+                        end_time=end_time
+                    )
+                })
+                alerts_data = fetched["alerts"]
+                alert_counts = fetched["counts"]
             
             if 'error' in alerts_data:
                 logger.error(f"Error fetching alerts for email: {alerts_data['error']}")
@@ -257,6 +382,7 @@ class EmailAlerts:
             
             if total_alerts_found == 0 and not alerts_data.get('manual_test', False):
                 logger.info(f"No alerts to send for levels: {', '.join(severity_levels)}")
+                self._advance_watermark(alert_config, alerts_data)
                 return True  # Return success as there's nothing to send
                 
             # If this is a manual test with no alerts, create a test message
@@ -277,50 +403,40 @@ class EmailAlerts:
                         <p>This is a test alert triggered manually from the Scheduler Management interface.</p>
                         <p>No actual alerts were found matching your configuration criteria.</p>
                         <p>Alert levels: {', '.join(severity_levels)}</p>
-                        <p>Search time range: {(current_time_pkt - datetime.timedelta(minutes=alert_check_interval)).strftime('%Y-%m-%d %H:%M:%S')} to {current_time_pkt.strftime('%Y-%m-%d %H:%M:%S')} (PKT)</p>
+                        <p>Search time range: {window_start_pkt.strftime('%Y-%m-%d %H:%M:%S')} to {window_end_pkt.strftime('%Y-%m-%d %H:%M:%S')} (PKT)</p>
                     </div>
                     <p>This email confirms that your alert notification system is working correctly.</p>
                 </body>
                 </html>
                 """
-                return self.send_alert_email(recipient, subject, message)
+                return self.send_alert_email(recipient, subject, message, wait=wait,
+                                             source=f"alert_config:{getattr(alert_config, 'id', '')}")
                 
             # Filter out alerts that have already been sent
+            new_identifiers = []
             if hasattr(alert_config, 'id'):
-                new_alerts = []
-                duplicate_count = 0
-                
-                for alert in alerts_data.get('results', []):
-                    alert_identifier = self._generate_alert_identifier(alert)
-                    
-                    if not self._is_alert_already_sent(alert_config.id, alert_identifier):
-                        new_alerts.append(alert)
-                        logger.debug(f"New alert found: {alert_identifier[:10]}...")
-                    else:
-                        duplicate_count += 1
-                        logger.debug(f"Duplicate alert skipped: {alert_identifier[:10]}...")
+                deduplicator = get_alert_deduplicator()
+                new_alerts, new_identifiers, duplicate_count = deduplicator.filter_new(
+                    alert_config.id, alerts_data.get('results', []))
                 
                 logger.info(f"Alert deduplication - Total: {len(alerts_data.get('results', []))}, New: {len(new_alerts)}, Duplicates: {duplicate_count}")
                 
                 # If no new alerts and this isn't a manual test, return success
                 if not new_alerts and not alerts_data.get('manual_test', False):
                     logger.info(f"All {len(alerts_data.get('results', []))} alerts have already been sent for config {alert_config.id}")
+                    self._advance_watermark(alert_config, alerts_data)
                     return True  # Return success as all alerts were already sent
                 
-                # Record new alerts as sent AFTER we know we'll actually send them
-                for alert in new_alerts:
-                    alert_identifier = self._generate_alert_identifier(alert)
-                    self._record_sent_alert(alert_config.id, alert_identifier)
-                
                 # Replace the results with only new alerts
                 alerts_data['results'] = new_alerts
                 alerts_data['total'] = len(new_alerts)
             
             # Get alert count by severity
-            alert_counts = self.opensearch.get_alert_count_by_severity(
-                start_time=start_time,
-                end_time=end_time
-            )
+            if alert_counts is None:
+                alert_counts = self.opensearch.get_alert_count_by_severity(
+                    start_time=start_time,
+                    end_time=end_time
+                )
             
             # Generate report as attachment with all alert data
             report_config = {
@@ -351,13 +467,6 @@ class EmailAlerts:
             total_alerts = alerts_data.get('total', 0)
             subject = f"Security Alert: {total_alerts} new alerts detected"
             
-            # Get the include_fields if available
-            include_fields = []
-            if hasattr(alert_config, 'get_include_fields') and callable(getattr(alert_config, 'get_include_fields')):
-                include_fields = alert_config.get_include_fields()
-            else:
-                include_fields = ["@timestamp", "agent.ip", "agent.labels.location.set", "agent.name", "rule.description", "rule.id"]
-            
             # Build email body
             body = f"""
             <html>
@@ -380,9 +489,9 @@ class EmailAlerts:
                 <h1>Security Alert Notification</h1>
                 
                 <div class="alert-summary">
-                    <p>A total of <span class="alert-count">{total_alerts}</span> alerts have been detected in the last {alert_check_interval} minutes matching your alert configuration.</p>
+                    <p>A total of <span class="alert-count">{total_alerts}</span> alerts have been detected over {max(1, round((window_end - window_start).total_seconds() / 60))} minutes matching your alert configuration.</p>
                     <p>Alert levels: {', '.join(severity_levels)}</p>
-                    <p>Time range: {(current_time_pkt - datetime.timedelta(minutes=alert_check_interval)).strftime('%Y-%m-%d %H:%M:%S')} to {current_time_pkt.strftime('%Y-%m-%d %H:%M:%S')} (PKT)</p>
+                    <p>Time range: {window_start_pkt.strftime('%Y-%m-%d %H:%M:%S')} to {window_end_pkt.strftime('%Y-%m-%d %H:%M:%S')} (PKT)</p>
                     <p>Generated at: {current_time_pkt.strftime('%Y-%m-%d %H:%M:%S')} PKT</p>
                 </div>
                 
@@ -435,65 +544,27 @@ class EmailAlerts:
             body += "</tr>"
             
             # Add recent alerts with the specified fields (show first 60 in email)
-            for alert in alerts_data.get('results', [])[:60]:  # Show more alerts in email
-                source = alert.get('source', {})
-                
-                # Determine severity level
-                level = source.get('rule', {}).get('level', 0)
-                severity_class = "low"
-                if level >= 15:
-                    severity_class = "critical"
-                elif level >= 12:
-                    severity_class = "high"
-                elif level >= 7:
-                    severity_class = "medium"
-                
-                body += f'<tr class="{severity_class}">'
+            records = enrich_rules(normalize_alerts(alerts_data.get('results', [])[:60]), get_rule_catalog())
+            for record in records:  # Show more alerts in email
+                body += f'<tr class="{record.severity}">'
                 
                 # Add data for each field
                 for field in include_fields:
-                    value = "N/A"
-                    
-                    # Handle nested fields with dot notation
-                    if '.' in field:
-                        parts = field.split('.')
-                        current = source.copy()
-                        
-                        # Special handling for agent.labels.location.set
-                        if field == "agent.labels.location.set":
-                            if 'agent' in current and 'labels' in current['agent'] and 'location' in current['agent']['labels']:
-                                value = current['agent']['labels']['location'].get('set', 'N/A')
-                        else:
-                            # General handling for nested fields
-                            for part in parts:
-                                if isinstance(current, dict) and part in current:
-                                    current = current.get(part)
-                                else:
-                                    current = "N/A"
-                                    break
-                            
-                            if current not in ["N/A", None]:
-                                value = current
+                    if field == "@timestamp":
+                        # Convert UTC timestamp to Pakistan time
+                        value = record.format_timestamp('%Y-%m-%d %H:%M:%S PKT', offset_hours=5)
+                    elif field == "rule.id":
+                        value = record.rule_id if record.rule_id is not None else "N/A"
+                        if record.mitre_ids:
+                            value = f"{value} (MITRE {', '.join(record.mitre_ids)})"
+                    elif field == "rule.description":
+                        value = record.rule_description or "N/A"
                     else:
-                        value = source.get(field, "N/A")
+                        value = record.get(field, "N/A")
                     
                     # Special formatting for agent.name to include IP
-                    if field == "agent.name" and value != "N/A":
-                        agent_ip = source.get('agent', {}).get('ip', 'N/A')
-                        if agent_ip != 'N/A':
-                            value = f"{value} ({agent_ip})"
-                    
-                    # Format timestamp nicely if it's a timestamp field
-                    if field == "@timestamp" and value != "N/A" and isinstance(value, str):
-                        try:
-                            # Convert UTC timestamp to Pakistan time
-                            if 'T' in value:
-                                utc_time = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
-                                pkt_time = utc_time + datetime.timedelta(hours=5)
-                                value = pkt_time.strftime('%Y-%m-%d %H:%M:%S PKT')
-                        except Exception:
-                            # If formatting fails, just use the original value
-                            pass
+                    if field == "agent.name" and value != "N/A" and record.agent_ip:
+                        value = f"{value} ({record.agent_ip})"
                     
                     # Truncate very long values
                     if isinstance(value, str) and len(value) > 100:
@@ -545,9 +616,17 @@ class EmailAlerts:
             logger.info(f"📧 Body length: {len(body)} characters")
             
             try:
-                result = self.send_alert_email(recipient, subject, body, attachments)
+                result = self.send_alert_email(recipient, subject, body, attachments, wait=wait,
+                                               source=f"alert_config:{getattr(alert_config, 'id', '')}")
                 if result:
-                    logger.info(f"✅ Alert email successfully sent to {recipient}")
+                    logger.info(f"✅ Alert email successfully {'sent to' if wait else 'queued for'} {recipient}")
+                    # Only now are the alerts delivered (or safely in the outbox)
+                    if new_identifiers:
+                        try:
+                            get_alert_deduplicator().record_sent(alert_config.id, new_identifiers)
+                        except Exception as record_error:
+                            logger.error(f"Error recording sent alerts for config {alert_config.id}: {str(record_error)}")
+                    self._advance_watermark(alert_config, alerts_data)
                 else:
                     logger.error(f"❌ Alert email failed to send to {recipient}")
                 return result
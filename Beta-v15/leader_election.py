@@ -0,0 +1,145 @@
+import atexit
+import functools
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from config import Config
+from models import SchedulerLease, db
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """
+    Elect one process (across gunicorn workers and hosts sharing the
+    database) to run the alert, report and storage jobs.
+
+    Every process tries to take or renew a SchedulerLease row every
+    LEADER_RENEW_SECONDS with a single conditional UPDATE, which only
+    succeeds for the current holder or once the lease has expired. A leader
+    that dies stops renewing, so another process takes over within about
+    LEADER_LEASE_SECONDS. A process that cannot renew steps down locally
+    before its lease can be taken by anyone else.
+    """
+
+    def __init__(self, name="scheduler"):
+        self.name = name
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._valid_until = 0
+        self._thread = None
+        self._app = None
+        self._stop = threading.Event()
+
+    @property
+    def is_leader(self):
+        return time.monotonic() < self._valid_until
+
+    def try_acquire(self):
+        """Take or renew the lease; call inside an app context"""
+        started = time.monotonic()
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=Config.LEADER_LEASE_SECONDS)
+        try:
+            updated = SchedulerLease.query.filter(
+                SchedulerLease.name == self.name,
+                or_(SchedulerLease.holder == self.holder, SchedulerLease.expires_at < now)
+            ).update({"holder": self.holder, "expires_at": expires}, synchronize_session=False)
+            if not updated and db.session.get(SchedulerLease, self.name) is None:
+                db.session.add(SchedulerLease(name=self.name, holder=self.holder,
+                                              acquired_at=now, expires_at=expires))
+                updated = 1
+            db.session.commit()
+        except IntegrityError:
+            # Another process created the row first
+            db.session.rollback()
+            updated = 0
+        except Exception:
+            db.session.rollback()
+            self._valid_until = 0
+            raise
+
+        was_leader = self.is_leader
+        if updated:
+            # Step down locally a renew interval before the lease could be taken
+            self._valid_until = started + Config.LEADER_LEASE_SECONDS - Config.LEADER_RENEW_SECONDS
+            if not was_leader:
+                logger.info(f"{self.holder} is now the scheduler leader")
+        else:
+            self._valid_until = 0
+            if was_leader:
+                logger.warning(f"{self.holder} lost the scheduler lease")
+        return bool(updated)
+
+    def release(self):
+        """Give up the lease so a standby takes over at its next renewal"""
+        if not self.is_leader or self._app is None:
+            return
+        self._valid_until = 0
+        try:
+            with self._app.app_context():
+                SchedulerLease.query.filter_by(name=self.name, holder=self.holder).update(
+                    {"expires_at": datetime.utcnow()}, synchronize_session=False)
+                db.session.commit()
+            logger.info(f"{self.holder} released the scheduler lease")
+        except Exception as e:
+            logger.warning(f"Could not release scheduler lease: {str(e)}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self._app.app_context():
+                    self.try_acquire()
+            except Exception as e:
+                logger.error(f"Error renewing scheduler lease: {str(e)}")
+            self._stop.wait(Config.LEADER_RENEW_SECONDS)
+
+    def start(self, app):
+        """Start competing for the lease in a background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._app = app
+        with app.app_context():
+            try:
+                self.try_acquire()
+            except Exception as e:
+                logger.error(f"Error acquiring scheduler lease: {str(e)}")
+        self._thread = threading.Thread(target=self._run, name="leader-lease", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        self.release()
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "holder": self.holder,
+            "is_leader": self.is_leader,
+            "valid_for_seconds": max(0, round(self._valid_until - time.monotonic(), 1))
+        }
+
+
+_leader_lease = LeaderLease()
+
+
+def get_leader_lease():
+    """Return this process's scheduler lease"""
+    return _leader_lease
+
+
+def leader_only(func):
+    """Run a background job only in the process holding the scheduler lease"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _leader_lease.is_leader:
+            logger.debug(f"Skipping {func.__name__}: not the scheduler leader")
+            return None
+        return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,330 @@
+import atexit
+import datetime
+import email
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func
+from config import Config
+from models import OutboundEmail, db
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledConnection:
+    __slots__ = ("server", "opened_at", "sent")
+
+    def __init__(self, server):
+        self.server = server
+        self.opened_at = time.monotonic()
+        self.sent = 0
+
+    def reusable(self):
+        return (self.sent < Config.SMTP_MAX_MESSAGES_PER_CONNECTION and
+                time.monotonic() - self.opened_at < Config.SMTP_CONNECTION_MAX_AGE)
+
+    def close(self):
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+
+
+class SmtpConnectionPool:
+    """
+    Authenticated SMTP sessions kept open and reused, so a burst of messages
+    costs one connect, STARTTLS and login instead of one per message.
+
+    At most SMTP_POOL_SIZE sessions are open at once. A session is retired
+    after SMTP_MAX_MESSAGES_PER_CONNECTION messages or SMTP_CONNECTION_MAX_AGE
+    seconds, and one the server dropped while idle is replaced and the
+    message retried once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(Config.SMTP_POOL_SIZE)
+        self._idle = []
+        self._pid = os.getpid()
+        self._counters = {"connections_opened": 0, "messages_sent": 0, "reconnects": 0, "errors": 0}
+
+    def _connect(self):
+        logger.info(f"📧 Connecting to SMTP server: {Config.SMTP_SERVER}:{Config.SMTP_PORT}")
+        server = smtplib.SMTP(Config.SMTP_SERVER, Config.SMTP_PORT, timeout=Config.SMTP_TIMEOUT)
+        try:
+            if Config.SMTP_USE_TLS:
+                server.starttls()
+            server.login(Config.SMTP_USERNAME, Config.SMTP_PASSWORD)
+        except Exception:
+            server.close()
+            raise
+        with self._lock:
+            self._counters["connections_opened"] += 1
+        return _PooledConnection(server)
+
+    def _checkout(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Sessions opened before a fork belong to the parent
+                self._idle = []
+                self._pid = os.getpid()
+            while self._idle:
+                connection = self._idle.pop()
+                if connection.reusable():
+                    return connection
+                connection.close()
+        return self._connect()
+
+    def _checkin(self, connection):
+        if connection.reusable():
+            with self._lock:
+                self._idle.append(connection)
+        else:
+            connection.close()
+
+    def send(self, msg):
+        """
+        Send a message over a pooled session.
+
+        Returns:
+            The refused recipients dict from smtplib (empty when all accepted).
+            Raises smtplib errors as sending one message directly would.
+        """
+        with self._slots:
+            connection = self._checkout()
+            try:
+                try:
+                    refused = connection.server.send_message(msg)
+                except (smtplib.SMTPServerDisconnected, ConnectionError):
+                    connection.close()
+                    if connection.sent == 0:
+                        raise
+                    # The server dropped an idle session; retry once on a new one
+                    with self._lock:
+                        self._counters["reconnects"] += 1
+                    connection = self._connect()
+                    refused = connection.server.send_message(msg)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                # The session itself is still usable
+                self._checkin(connection)
+                with self._lock:
+                    self._counters["errors"] += 1
+                raise
+            except Exception:
+                connection.close()
+                with self._lock:
+                    self._counters["errors"] += 1
+                raise
+
+            connection.sent += 1
+            self._checkin(connection)
+            with self._lock:
+                self._counters["messages_sent"] += 1
+            return refused
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["idle_connections"] = len(self._idle)
+        stats["pool_size"] = Config.SMTP_POOL_SIZE
+        return stats
+
+
+class MailOutbox:
+    """
+    Durable queue of outgoing email in the OutboundEmail table.
+
+    Jobs enqueue a built message (one INSERT) and move on; deliver_due,
+    run by the scheduler leader (or by the fallback alert worker when the
+    scheduler is not running), sends due messages over the connection
+    pool with SMTP_SEND_WORKERS threads. A failed attempt is retried after
+    an exponential backoff (OUTBOX_RETRY_BASE_SECONDS doubling, capped at
+    OUTBOX_RETRY_MAX_SECONDS) until OUTBOX_MAX_ATTEMPTS, after which the
+    message is dead-lettered for an admin to replay. Recipients the server
+    refuses outright are dead-lettered at once.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._lock = threading.Lock()
+        self._counters = {"enqueued": 0, "sent": 0, "failed_attempts": 0, "dead_lettered": 0}
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self._counters[name] += value
+
+    def enqueue(self, msg, source=None):
+        """Store a built message for delivery; returns False if it could not be stored"""
+        try:
+            db.session.add(OutboundEmail(
+                recipient=msg['To'],
+                subject=str(msg['Subject'] or '')[:500],
+                source=source,
+                raw_message=msg.as_bytes(),
+                next_attempt_at=datetime.datetime.utcnow()
+            ))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"❌ Could not queue email to {msg['To']}: {str(e)}")
+            return False
+        self._count(enqueued=1)
+        return True
+
+    @staticmethod
+    def _backoff(attempts):
+        delay = min(Config.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), Config.OUTBOX_RETRY_MAX_SECONDS)
+        return datetime.timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+    def _claim(self, now):
+        """
+        Mark up to OUTBOX_BATCH_SIZE due messages as being sent and return them.
+
+        The attempt is counted here rather than after the send, so a message
+        whose send never reports back (the process died mid-send) still
+        reaches OUTBOX_MAX_ATTEMPTS and is dead-lettered instead of being
+        reclaimed forever.
+        """
+        due = OutboundEmail.query.filter(
+            OutboundEmail.status.in_(('pending', 'sending')),
+            OutboundEmail.next_attempt_at <= now
+        ).order_by(OutboundEmail.next_attempt_at).limit(Config.OUTBOX_BATCH_SIZE).all()
+        claimed = []
+        abandoned = 0
+        for row in due:
+            if row.status == 'sending' and row.attempts >= Config.OUTBOX_MAX_ATTEMPTS:
+                row.status = 'dead'
+                row.last_error = f"Send did not complete within {Config.OUTBOX_SEND_TIMEOUT}s " \
+                                 f"on attempt {row.attempts}"
+                abandoned += 1
+                logger.error(f"❌ Email {row.id} to {row.recipient} dead-lettered: {row.last_error}")
+                continue
+            row.status = 'sending'
+            row.attempts += 1
+            row.next_attempt_at = now + datetime.timedelta(seconds=Config.OUTBOX_SEND_TIMEOUT)
+            claimed.append(row)
+        db.session.commit()
+        if abandoned:
+            self._count(failed_attempts=abandoned, dead_lettered=abandoned)
+        return claimed
+
+    def _send(self, raw_message):
+        try:
+            refused = self.pool.send(email.message_from_bytes(raw_message))
+            return None, refused
+        except Exception as e:
+            return e, None
+
+    def deliver_due(self):
+        """Send every message that is due; call inside an app context"""
+        now = datetime.datetime.utcnow()
+        due = self._claim(now)
+        if not due:
+            return {"sent": 0, "retrying": 0, "dead": 0}
+
+        workers = max(1, min(Config.SMTP_SEND_WORKERS, len(due)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mail-outbox") as executor:
+            outcomes = list(executor.map(self._send, [row.raw_message for row in due]))
+
+        sent = retrying = dead = 0
+        now = datetime.datetime.utcnow()
+        for row, (error, refused) in zip(due, outcomes):
+            if error is None:
+                row.status = 'sent'
+                row.sent_at = now
+                row.last_error = f"Some recipients refused: {refused}" if refused else None
+                sent += 1
+                continue
+
+            row.last_error = f"{type(error).__name__}: {str(error)}"[:2000]
+            if isinstance(error, smtplib.SMTPRecipientsRefused) or row.attempts >= Config.OUTBOX_MAX_ATTEMPTS:
+                row.status = 'dead'
+                dead += 1
+                logger.error(f"❌ Email {row.id} to {row.recipient} dead-lettered after "
+                             f"{row.attempts} attempts: {row.last_error}")
+            else:
+                row.status = 'pending'
+                row.next_attempt_at = now + self._backoff(row.attempts)
+                retrying += 1
+                logger.warning(f"⚠️ Email {row.id} to {row.recipient} failed (attempt {row.attempts}), "
+                               f"retrying at {row.next_attempt_at.isoformat()}: {row.last_error}")
+        db.session.commit()
+
+        self._count(sent=sent, failed_attempts=retrying + dead, dead_lettered=dead)
+        if sent:
+            logger.info(f"✅ Sent {sent} queued emails")
+        return {"sent": sent, "retrying": retrying, "dead": dead}
+
+    def replay(self, ids=None):
+        """Put dead-lettered messages (all, or the given ids) back in the queue; returns how many"""
+        query = OutboundEmail.query.filter(OutboundEmail.status == 'dead')
+        if ids is not None:
+            query = query.filter(OutboundEmail.id.in_(ids))
+        try:
+            replayed = query.update({
+                "status": 'pending',
+                "attempts": 0,
+                "next_attempt_at": datetime.datetime.utcnow()
+            }, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return replayed
+
+    def prune(self):
+        """Delete sent messages older than OUTBOX_RETENTION_DAYS; dead ones stay until replayed"""
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=Config.OUTBOX_RETENTION_DAYS)
+        try:
+            deleted = OutboundEmail.query.filter(
+                OutboundEmail.status == 'sent',
+                OutboundEmail.sent_at < cutoff
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return deleted
+
+    def stats(self):
+        """Outbox depth by status and this process's counters; call inside an app context"""
+        depth = dict(db.session.query(OutboundEmail.status, func.count(OutboundEmail.id))
+                     .group_by(OutboundEmail.status).all())
+        oldest_pending = db.session.query(func.min(OutboundEmail.created_at)).filter(
+            OutboundEmail.status.in_(('pending', 'sending'))).scalar()
+        with self._lock:
+            stats = dict(self._counters)
+        stats["depth"] = {status: depth.get(status, 0) for status in ('pending', 'sending', 'sent', 'dead')}
+        stats["oldest_pending_seconds"] = round(
+            (datetime.datetime.utcnow() - oldest_pending).total_seconds(), 1) if oldest_pending else None
+        stats["pool"] = self.pool.stats()
+        return stats
+
+
+_smtp_pool = SmtpConnectionPool()
+_mail_outbox = MailOutbox(_smtp_pool)
+atexit.register(_smtp_pool.close_all)
+
+
+def get_smtp_pool():
+    """Return the process-wide SMTP connection pool"""
+    return _smtp_pool
+
+
+def get_mail_outbox():
+    """Return the process-wide handle on the outgoing mail outbox"""
+    return _mail_outbox
@@ -185,6 +185,12 @@ class RetentionPolicy(db.Model):
 
 class SentAlert(db.Model):
     """Track already sent alerts to prevent duplicates"""
+    __table_args__ = (
+        # The dedup lookup, and the cache sync / pruning scans by age
+        db.Index('ix_sent_alert_config_identifier_timestamp', 'alert_config_id', 'alert_identifier', 'timestamp'),
+        db.Index('ix_sent_alert_timestamp', 'timestamp'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     alert_config_id = db.Column(db.Integer, db.ForeignKey('alert_config.id'), nullable=False)
     alert_identifier = db.Column(db.String(500), nullable=False)  # Hash of unique alert identifiers
@@ -197,6 +203,90 @@ class SentAlert(db.Model):
         return f'<SentAlert {self.alert_identifier[:10]}... for config {self.alert_config_id}>'
 
 
+class ReportDelivery(db.Model):
+    """Record of a scheduled report sent for a period, so it goes out once"""
+    __table_args__ = (
+        db.UniqueConstraint('report_config_id', 'period_key', name='uq_report_delivery_period'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    report_config_id = db.Column(db.Integer, db.ForeignKey('report_config.id'), nullable=False)
+    period_key = db.Column(db.String(20), nullable=False)  # e.g. the PKT date of a daily report
+    sent_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    report_config = db.relationship('ReportConfig', backref=db.backref(
+        'deliveries', cascade='all, delete-orphan'))
+    
+    def __repr__(self):
+        return f'<ReportDelivery report {self.report_config_id} for {self.period_key}>'
+
+
+class OutboundEmail(db.Model):
+    """
+    An email waiting in (or done with) the durable outbox.
+
+    status is pending, sending, sent or dead. A pending or sending message is
+    (re)tried once next_attempt_at passes; for one being sent it is the
+    deadline after which a crashed attempt is retried.
+    """
+    __table_args__ = (
+        db.Index('ix_outbound_email_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(500), nullable=False)
+    subject = db.Column(db.String(500))
+    source = db.Column(db.String(100))  # e.g. alert_config:3 or report_config:7
+    raw_message = db.Column(db.LargeBinary, nullable=False)  # Serialized MIME message
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'recipient': self.recipient,
+            'subject': self.subject,
+            'source': self.source,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+    
+    def __repr__(self):
+        return f'<OutboundEmail {self.id} to {self.recipient} ({self.status})>'
+
+
+class AlertWatermark(db.Model):
+    """
+    How far alert polling has got for one alert configuration: the time and
+    sort values of the last alert it handled. The next cycle resumes strictly
+    after it with search_after.
+    """
+    alert_config_id = db.Column(db.Integer, db.ForeignKey('alert_config.id'), primary_key=True)
+    alert_timestamp = db.Column(db.DateTime, nullable=False)
+    sort_values = db.Column(db.Text, nullable=False)  # JSON list of the hit's sort values, or null for a time
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    alert_config = db.relationship('AlertConfig', backref=db.backref(
+        'watermark', uselist=False, cascade='all, delete-orphan'))
+    
+    def get_sort_values(self):
+        return json.loads(self.sort_values)
+    
+    def set_sort_values(self, values):
+        self.sort_values = json.dumps(values)
+    
+    def __repr__(self):
+        return f'<AlertWatermark config {self.alert_config_id} at {self.alert_timestamp}>'
+
+
 class SystemConfig(db.Model):
     """
     Store global system configuration settings
@@ -236,6 +326,22 @@ class SystemConfig(db.Model):
         return f'<SystemConfig {self.key}={self.value}>'
 
 
+class SchedulerLease(db.Model):
+    """
+    Time-limited lease naming the one process that runs the background jobs.
+
+    The holder renews it well before expires_at; once it lapses any other
+    process may take it over.
+    """
+    name = db.Column(db.String(100), primary_key=True)
+    holder = db.Column(db.String(255), nullable=False)
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<SchedulerLease {self.name} held by {self.holder} until {self.expires_at}>'
+
+
 class StoredAlert(db.Model):
     """
     Store alerts from Wazuh/OpenSearch date-wise for AI search training.
@@ -244,7 +350,7 @@ class StoredAlert(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     alert_date = db.Column(db.Date, nullable=False, index=True)
     alert_timestamp = db.Column(db.DateTime, nullable=False, index=True)
-    alert_id = db.Column(db.String(255), nullable=False)
+    alert_id = db.Column(db.String(255), nullable=False, index=True)
     agent_id = db.Column(db.String(100))
     agent_name = db.Column(db.String(255))
     agent_ip = db.Column(db.String(50))
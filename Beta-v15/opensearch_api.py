@@ -1,12 +1,1353 @@
 import logging
 import json
+import copy
+import asyncio
+import base64
+import contextvars
 import datetime
-from opensearchpy import OpenSearch, RequestsHttpConnection
-from opensearchpy.exceptions import ConnectionError, AuthenticationException, RequestError
+import functools
+import inspect
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from flask import has_request_context, request
+from opensearchpy import OpenSearch, RequestsHttpConnection, Transport
+from opensearchpy.exceptions import (ConnectionError, AuthenticationException, RequestError,
+                                     TransportError)
+from alert_record import parse_timestamp
 from config import Config
+from search_strategies import build_search_clause
+from wazuh_api import get_rule_catalog
 
 logger = logging.getLogger(__name__)
 
+# Keyword field used alongside @timestamp to give hits a stable, unique sort
+ALERT_TIEBREAKER_FIELD = "id"
+
+# Named _source projections for consumers that only render a few fields.
+# Wazuh documents carry large full_log, data.win.* and syscheck.* payloads
+# that these paths never read.
+SOURCE_PROFILES = {
+    # Dashboard recent-activity rows and short voice summaries
+    "summary": [
+        "@timestamp", "rule.id", "rule.level", "rule.description",
+        "agent.id", "agent.name", "agent.ip"
+    ],
+    # CSV/XLSX exports and the report template
+    "export": [
+        "@timestamp", "rule.id", "rule.level", "rule.description",
+        "agent.id", "agent.name", "agent.ip", "agent.labels.location.set"
+    ],
+    # Alert emails: dedup keys and severity; callers add AlertConfig include_fields
+    "email": [
+        "@timestamp", "rule.id", "rule.level", "rule.description",
+        "agent.id", "agent.name", "agent.ip", "agent.labels.location.set"
+    ]
+}
+
+# Seconds each kind of cached query result stays fresh
+CACHE_TTLS = {
+    "alert_counts": 30,
+    "threat_types": 60,
+    "timeline": 60,
+    "top_rules": 60,
+    "locations": 60,
+    "recent_alerts": 10,
+    "term_page": 60
+}
+
+# Dimensions that can be paged with get_term_page: the grouping field and
+# the _source fields returned from one representative (latest) alert
+TERM_DIMENSIONS = {
+    "rules": {"field": "rule.id", "metadata": ["rule.description", "rule.level"]},
+    "agents": {"field": "agent.name", "metadata": ["agent.id", "agent.ip", "agent.labels.location.set"]},
+    "users": {"field": "data.win.eventdata.targetUserName", "metadata": []},
+    "locations": {"field": "agent.labels.location.set", "metadata": []},
+    "threat_types": {"field": "rule.groups", "metadata": []}
+}
+
+
+# Severity keywords accepted in severity_levels, as rule.level ranges
+SEVERITY_RANGES = {
+    'low': (1, 6),
+    'medium': (7, 11),
+    'high': (12, 14),
+    'critical': (15, 100)
+}
+# The 'fim' severity selects file integrity monitoring rules
+FIM_RULE_IDS = [553, 554]
+# Noisy "misc events": kept out of low/medium and selectable as 'events'
+MISC_EVENT_RULE_IDS = [750, 60642, 752, 550, 60106]
+MISC_EVENT_DESCRIPTIONS = [
+    "SonicWall warning messages",
+    "SonicWall error messages",
+    "Integrity checksum changed",
+    "Registry value integrity checksum changed"
+]
+
+
+def _is_misc_event(record):
+    if str(record.rule_id) in {str(rule_id) for rule_id in MISC_EVENT_RULE_IDS}:
+        return True
+    description = (record.rule_description or '').lower()
+    return any(phrase.lower() in description for phrase in MISC_EVENT_DESCRIPTIONS)
+
+
+def known_severity_levels(severity_levels):
+    """The lower-cased severity keywords the alert query understands"""
+    return [severity.lower() for severity in severity_levels or []
+            if severity.lower() in SEVERITY_RANGES or severity.lower() in ('fim', 'events')]
+
+
+def matches_severity_levels(record, severity_levels):
+    """
+    In-memory twin of the severity filter OpenSearchAPI builds for
+    severity_levels, applied to an AlertRecord. Unknown keywords are ignored
+    and no known keyword means no filter, as in the query.
+    """
+    known = known_severity_levels(severity_levels)
+    if not known:
+        return True
+
+    try:
+        level = int(record.rule_level)
+    except (TypeError, ValueError):
+        level = None
+    for severity in known:
+        if severity == 'fim':
+            if str(record.rule_id) in {str(rule_id) for rule_id in FIM_RULE_IDS}:
+                return True
+        elif severity == 'events':
+            if _is_misc_event(record):
+                return True
+        elif level is not None:
+            low, high = SEVERITY_RANGES[severity]
+            if low <= level <= high and not (severity in ('low', 'medium') and _is_misc_event(record)):
+                return True
+    return False
+
+
+def parse_index_date(index_name):
+    """Return the day of a daily index such as wazuh-alerts-4.x-YYYY.MM.DD, or None"""
+    try:
+        return datetime.datetime.strptime(index_name.rsplit('-', 1)[-1], '%Y.%m.%d').date()
+    except ValueError:
+        return None
+
+
+# Client-error statuses that still mean the cluster is overloaded
+RETRY_ON_STATUS = (429,)
+# POST endpoints that only read and can be safely retried
+_READ_ENDPOINTS = ("/_search", "/_msearch", "/_count", "/_mget")
+
+# Per-request timeout (seconds) for OpenSearchAPI methods that page through
+# large result sets; everything else uses OPENSEARCH_REQUEST_TIMEOUT
+CALL_TIMEOUTS = {
+    "search_alerts": Config.OPENSEARCH_TIMEOUT,
+    "iter_alerts": Config.OPENSEARCH_TIMEOUT,
+    "get_index_stats": Config.OPENSEARCH_TIMEOUT
+}
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised without contacting the cluster while the circuit breaker is open"""
+
+
+def _is_client_error(error):
+    """A 4xx answer: the cluster is up and the request itself was bad"""
+    status = error.status_code
+    return isinstance(status, int) and 400 <= status < 500 and status not in RETRY_ON_STATUS
+
+
+def _is_idempotent_read(method, url):
+    if method in ("GET", "HEAD"):
+        return True
+    return method == "POST" and url.split("?", 1)[0].endswith(_READ_ENDPOINTS)
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker for cluster requests.
+
+    After OPENSEARCH_BREAKER_FAILURES consecutive failures the breaker opens
+    and requests fail fast. After OPENSEARCH_BREAKER_RESET_SECONDS one trial
+    request is let through (half-open); its outcome closes or re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        """Return True if a request may be sent now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            reset = Config.OPENSEARCH_BREAKER_RESET_SECONDS
+            if self.state == self.OPEN and now - self.opened_at >= reset:
+                self.state = self.HALF_OPEN
+                self.trial_started_at = now
+                logger.info("OpenSearch circuit breaker half-open, sending trial request")
+                return True
+            if self.state == self.HALF_OPEN and now - self.trial_started_at >= reset:
+                # The previous trial never reported back
+                self.trial_started_at = now
+                return True
+            self.rejected += 1
+            return False
+
+    def is_open(self):
+        with self._lock:
+            return (self.state == self.OPEN and
+                    time.monotonic() - self.opened_at < Config.OPENSEARCH_BREAKER_RESET_SECONDS)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("OpenSearch circuit breaker closed")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                    self.state == self.CLOSED and self.failures >= Config.OPENSEARCH_BREAKER_FAILURES):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                logger.error(f"OpenSearch circuit breaker opened after {self.failures} failures")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected
+            }
+
+
+# The instrumented API call currently running in this context, if any
+_current_call = contextvars.ContextVar("opensearch_current_call", default=None)
+# Name of the scheduler job or worker issuing queries, set via query_caller()
+_query_caller = contextvars.ContextVar("opensearch_query_caller", default=None)
+
+
+class _InstrumentedConnection(RequestsHttpConnection):
+    """HTTP connection that adds raw response sizes to the current call record"""
+
+    def perform_request(self, *args, **kwargs):
+        status, headers, raw_data = super().perform_request(*args, **kwargs)
+        record = _current_call.get()
+        if record is not None and raw_data:
+            record.response_bytes += len(raw_data)
+        return status, headers, raw_data
+
+
+class _PooledTransport(Transport):
+    """
+    Transport that reports in-flight requests to the shared client pool and
+    guards them with its circuit breaker, per-call timeouts and jittered
+    retries for idempotent reads.
+    """
+    owner = None
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None,
+                        ignore=(), headers=None):
+        owner = self.owner
+        if owner is None:
+            return super().perform_request(method, url, params=params, body=body,
+                                           timeout=timeout, ignore=ignore, headers=headers)
+
+        record = _current_call.get()
+        if timeout is None and not (params and "request_timeout" in params):
+            operation = record.operation if record is not None else None
+            timeout = CALL_TIMEOUTS.get(operation, Config.OPENSEARCH_REQUEST_TIMEOUT)
+        attempts = 1 + (Config.OPENSEARCH_MAX_RETRIES if _is_idempotent_read(method, url) else 0)
+
+        for attempt in range(attempts):
+            if not owner.breaker.allow():
+                raise CircuitOpenError("N/A", "OpenSearch circuit breaker is open", None)
+
+            owner._checkout()
+            try:
+                response = super().perform_request(method, url, params=params, body=body,
+                                                   timeout=timeout, ignore=ignore, headers=headers)
+            except TransportError as e:
+                if not isinstance(e, ConnectionError) and _is_client_error(e):
+                    # The cluster answered; the request itself was bad
+                    owner.breaker.record_success()
+                    raise
+                # Connection errors, 429 and every 5xx (shard failures, an
+                # overloaded node) count against the breaker
+                owner.breaker.record_failure()
+                if isinstance(e, ConnectionError):
+                    owner._mark_unhealthy()
+                if attempt + 1 >= attempts:
+                    raise
+                delay = random.uniform(0, min(Config.OPENSEARCH_RETRY_BACKOFF_MAX,
+                                              Config.OPENSEARCH_RETRY_BACKOFF * 2 ** attempt))
+                logger.warning(f"OpenSearch {method} {url} failed ({str(e)}), retrying in {delay:.2f}s")
+            else:
+                owner.breaker.record_success()
+                if record is not None:
+                    record.add_response(method, url, response)
+                return response
+            finally:
+                owner._checkin()
+            time.sleep(delay)
+
+
+class OpenSearchClientPool:
+    """
+    Process-wide OpenSearch client shared by every OpenSearchAPI instance.
+
+    The underlying client keeps a pool of keep-alive HTTP connections, so
+    routes and scheduler jobs reuse established TLS sessions instead of
+    opening (and pinging) a new connection per request. The client is built
+    lazily on first use and rebuilt if the process forks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._client = None
+        self._pid = None
+        self._healthy = None
+        self._last_health_check = None
+        self._in_use = 0
+        self._requests = 0
+        self.breaker = CircuitBreaker()
+
+    def _build_client(self):
+        host = Config.OPENSEARCH_URL
+        headers = None if Config.OPENSEARCH_KEEPALIVE else {"Connection": "close"}
+        client = OpenSearch(
+            hosts=[host],
+            http_auth=(Config.OPENSEARCH_USER, Config.OPENSEARCH_PASSWORD),
+            use_ssl=True if host.startswith('https') else False,
+            verify_certs=Config.OPENSEARCH_VERIFY_SSL,
+            connection_class=_InstrumentedConnection,
+            transport_class=_PooledTransport,
+            pool_maxsize=Config.OPENSEARCH_POOL_MAXSIZE,
+            timeout=Config.OPENSEARCH_TIMEOUT,
+            # _PooledTransport does its own jittered retries
+            max_retries=0,
+            headers=headers
+        )
+        client.transport.owner = self
+        return client
+
+    def get_client(self):
+        """Return the shared client, creating it on first use in this process"""
+        pid = os.getpid()
+        if self._client is not None and self._pid == pid:
+            return self._client
+
+        with self._lock:
+            if self._client is None or self._pid != pid:
+                self._client = self._build_client()
+                self._pid = pid
+                self._healthy = None
+                self._last_health_check = None
+                self._in_use = 0
+                self._requests = 0
+                self.breaker = CircuitBreaker()
+                logger.info(f"Created shared OpenSearch client (pool size {Config.OPENSEARCH_POOL_MAXSIZE})")
+            return self._client
+
+    def is_healthy(self, force=False):
+        """
+        Lazily check cluster reachability.
+
+        Pings at most once per OPENSEARCH_HEALTH_CHECK_INTERVAL seconds and
+        returns the cached result in between.
+        """
+        client = self.get_client()
+        now = time.monotonic()
+        if (not force and self._last_health_check is not None and
+                now - self._last_health_check < Config.OPENSEARCH_HEALTH_CHECK_INTERVAL):
+            return self._healthy
+
+        try:
+            healthy = bool(client.ping())
+        except (ConnectionError, AuthenticationException) as e:
+            logger.error(f"Failed to connect to OpenSearch: {str(e)}")
+            healthy = False
+
+        if healthy and not self._healthy:
+            logger.info("Successfully connected to OpenSearch")
+        elif not healthy:
+            logger.error("Failed to connect to OpenSearch, ping failed")
+
+        self._healthy = healthy
+        self._last_health_check = now
+        return healthy
+
+    def _mark_unhealthy(self):
+        self._healthy = False
+        self._last_health_check = time.monotonic()
+
+    def _checkout(self):
+        with self._stats_lock:
+            self._in_use += 1
+            self._requests += 1
+
+    def _checkin(self):
+        with self._stats_lock:
+            self._in_use -= 1
+
+    def _http_pools(self):
+        """Yield the urllib3 connection pools behind the shared client"""
+        if self._client is None:
+            return
+        for connection in self._client.transport.connection_pool.connections:
+            session = getattr(connection, 'session', None)
+            if session is None:
+                continue
+            for adapter in session.adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    yield pools[key]
+
+    def stats(self):
+        """Return connection pool statistics for this process"""
+        idle = 0
+        handshakes = 0
+        try:
+            for http_pool in self._http_pools():
+                handshakes += http_pool.num_connections
+                if http_pool.pool is not None:
+                    idle += sum(1 for conn in list(http_pool.pool.queue) if conn is not None)
+        except Exception as e:
+            logger.debug(f"Could not read OpenSearch HTTP pool stats: {str(e)}")
+
+        return {
+            "pid": os.getpid(),
+            "initialized": self._client is not None,
+            "pool_maxsize": Config.OPENSEARCH_POOL_MAXSIZE,
+            "keepalive": Config.OPENSEARCH_KEEPALIVE,
+            "timeout": Config.OPENSEARCH_TIMEOUT,
+            "in_use": self._in_use,
+            "idle": idle,
+            "handshakes": handshakes,
+            "requests": self._requests,
+            "healthy": self._healthy,
+            "breaker": self.breaker.stats()
+        }
+
+
+_client_pool = OpenSearchClientPool()
+
+
+def get_client_pool():
+    """Return the process-wide OpenSearch client pool"""
+    return _client_pool
+
+
+class _Flight:
+    """A query currently being computed on behalf of concurrent callers"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class AggregationCache:
+    """
+    Process-wide TTL/LRU cache for OpenSearch aggregation results.
+
+    Entries are keyed by the query kind and its normalized request body.
+    Concurrent callers asking for the same key while it is being computed
+    wait for the first caller's result instead of querying the cluster
+    again (single-flight). Error results are never stored.
+
+    Each result is also remembered as the last good one for its query
+    shape (see relative_key), which is what a dashboard falls back to
+    during an outage: its absolute time range moves on every request, so
+    the exact key is rarely cached.
+    """
+
+    def __init__(self, maxsize=None, granularity=None):
+        self.maxsize = maxsize or Config.OPENSEARCH_CACHE_MAXSIZE
+        self.granularity = granularity or Config.OPENSEARCH_CACHE_GRANULARITY
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._entries = OrderedDict()
+        self._last_good = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.stale_served = 0
+
+    def _check_pid(self):
+        # Locks and in-flight waiters do not survive a fork
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._reset()
+
+    def _round_time(self, value, up=False):
+        """Round an ISO timestamp to the cache granularity, leaving other values as-is"""
+        if not isinstance(value, str) or self.granularity <= 1:
+            return value
+        try:
+            parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return value
+
+        epoch = datetime.datetime(1970, 1, 1, tzinfo=parsed.tzinfo)
+        seconds = (parsed - epoch).total_seconds()
+        remainder = seconds % self.granularity
+        if remainder:
+            seconds -= remainder
+            if up:
+                seconds += self.granularity
+        return (epoch + datetime.timedelta(seconds=seconds)).isoformat()
+
+    def round_range(self, start_time, end_time):
+        """Widen a time range outwards to the cache granularity"""
+        return self._round_time(start_time), self._round_time(end_time, up=True)
+
+    def make_key(self, kind, body):
+        return f"{kind}:{json.dumps(body, sort_keys=True, default=str)}"
+
+    def _parse_time(self, value):
+        try:
+            return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except (AttributeError, ValueError):
+            return None
+
+    def relative_key(self, kind, body, start_time=None, end_time=None):
+        """
+        Key a query by its shape rather than its absolute range: the body
+        with start_time/end_time replaced by placeholders, plus the span of
+        the range ("the last 24 hours" instead of "until 10:42"). The index
+        list is left out as it follows the range.
+        """
+        start, end = self._parse_time(start_time), self._parse_time(end_time)
+        span = None
+        if start is not None and end is not None:
+            span = int(round((end - start).total_seconds() / self.granularity)) * self.granularity
+        placeholders = {value: name for name, value in (("<start>", start_time), ("<end>", end_time))
+                        if isinstance(value, str)}
+
+        def strip(node):
+            if isinstance(node, dict):
+                return {k: strip(v) for k, v in node.items()}
+            if isinstance(node, list):
+                return [strip(v) for v in node]
+            if isinstance(node, str):
+                return placeholders.get(node, node)
+            return node
+
+        return self.make_key(f"last_good:{kind}", {"span": span, "body": strip(body)})
+
+    def get(self, key):
+        """Return a copy of a fresh cached value, or None"""
+        with self._lock:
+            self._check_pid()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, stored_at, value = entry
+            if expires_at < time.monotonic():
+                # Expired entries stay (LRU-bounded) so they can be served stale
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def _stale_entry(self, key, max_age):
+        max_age = Config.OPENSEARCH_STALE_MAX_AGE if max_age is None else max_age
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[1] > max_age:
+            return None
+        return entry
+
+    def has_stale(self, key, max_age=None):
+        with self._lock:
+            self._check_pid()
+            return self._stale_entry(key, max_age) is not None
+
+    def has_last_good(self, relative_key, max_age=None):
+        if relative_key is None:
+            return False
+        max_age = Config.OPENSEARCH_STALE_MAX_AGE if max_age is None else max_age
+        with self._lock:
+            self._check_pid()
+            entry = self._last_good.get(relative_key)
+            return entry is not None and time.monotonic() - entry[0] <= max_age
+
+    def get_stale(self, key, max_age=None):
+        """Return a copy of a cached value regardless of TTL if it is not older than max_age"""
+        with self._lock:
+            self._check_pid()
+            entry = self._stale_entry(key, max_age)
+            if entry is None:
+                return None
+            self.stale_served += 1
+        return copy.deepcopy(entry[2])
+
+    def get_last_good(self, relative_key, max_age=None):
+        """Return a copy of the last good result for a query shape if not older than max_age"""
+        if relative_key is None:
+            return None
+        max_age = Config.OPENSEARCH_STALE_MAX_AGE if max_age is None else max_age
+        with self._lock:
+            self._check_pid()
+            entry = self._last_good.get(relative_key)
+            if entry is None or time.monotonic() - entry[0] > max_age:
+                return None
+            self.stale_served += 1
+        return copy.deepcopy(entry[1])
+
+    def get_fallback(self, key, relative_key=None):
+        """Stale entry for the exact key, else the last good result for its shape"""
+        stale = self.get_stale(key)
+        if stale is None:
+            stale = self.get_last_good(relative_key)
+        return stale
+
+    def set(self, key, value, ttl, relative_key=None):
+        if not Config.OPENSEARCH_CACHE_ENABLED or not ttl:
+            return
+        if isinstance(value, dict) and "error" in value:
+            return
+        with self._lock:
+            self._check_pid()
+            now = time.monotonic()
+            stored = copy.deepcopy(value)
+            self._entries[key] = (now + ttl, now, stored)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            if relative_key is not None:
+                # Values are only ever copied out, so both maps can share one copy
+                self._last_good[relative_key] = (now, stored)
+                self._last_good.move_to_end(relative_key)
+                while len(self._last_good) > self.maxsize:
+                    self._last_good.popitem(last=False)
+
+    def get_or_load(self, key, loader, ttl, store=True, allow_stale=False, relative_key=None):
+        """
+        Return the cached value for key, or run loader() once for all
+        concurrent callers and cache its result for ttl seconds.
+
+        With allow_stale, a failing loader (including one rejected by the
+        open circuit breaker) falls back to an expired entry, or else the
+        last good result for relative_key, no older than
+        OPENSEARCH_STALE_MAX_AGE.
+        """
+        if not Config.OPENSEARCH_CACHE_ENABLED:
+            return loader()
+
+        try:
+            return self._load(key, loader, ttl, store, relative_key)
+        except Exception as e:
+            stale = self.get_fallback(key, relative_key) if allow_stale else None
+            if stale is None:
+                raise
+            logger.warning(f"Serving stale cached result after OpenSearch failure: {str(e)}")
+            return stale
+
+    def _load(self, key, loader, ttl, store, relative_key=None):
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.value)
+
+        try:
+            flight.value = loader()
+            if store:
+                self.set(key, flight.value, ttl, relative_key)
+            return copy.deepcopy(flight.value)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._last_good.clear()
+
+    def stats(self):
+        """Return hit/miss counters for this process"""
+        with self._lock:
+            self._check_pid()
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "pid": self._pid,
+                "enabled": Config.OPENSEARCH_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "last_good_entries": len(self._last_good),
+                "maxsize": self.maxsize,
+                "granularity": self.granularity,
+                "ttls": dict(CACHE_TTLS),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "stale_served": self.stale_served,
+                "in_flight": len(self._inflight),
+                "hit_ratio": round((self.hits + self.coalesced) / lookups, 3) if lookups else None
+            }
+
+
+_aggregation_cache = AggregationCache()
+
+
+def get_aggregation_cache():
+    """Return the process-wide aggregation cache"""
+    return _aggregation_cache
+
+
+class IndexResolver:
+    """
+    Map a time range to the daily alert indices that can contain it.
+
+    The index list comes from _cat/indices and is refreshed every
+    OPENSEARCH_INDEX_REFRESH_INTERVAL seconds, or sooner when a range
+    reaches past the newest known day (a new daily index was rolled).
+    Indices whose names carry no date are always included.
+    """
+
+    # Minimum seconds between refreshes triggered by an unknown newer day
+    MIN_REFRESH_INTERVAL = 30
+
+    def __init__(self, pattern=None):
+        self.pattern = pattern or Config.OPENSEARCH_INDEX_PATTERN
+        self._lock = threading.Lock()
+        self._daily = {}
+        self._undated = []
+        self._loaded_at = None
+
+    def invalidate(self):
+        """Force a refresh on next use, e.g. after indices were deleted"""
+        self._loaded_at = None
+
+    def refresh(self, client):
+        rows = client.cat.indices(index=self.pattern, format="json", h="index")
+        daily = {}
+        undated = []
+        for row in rows:
+            name = row["index"]
+            day = parse_index_date(name)
+            if day is None:
+                undated.append(name)
+            else:
+                daily.setdefault(day, []).append(name)
+
+        with self._lock:
+            self._daily = daily
+            self._undated = sorted(undated)
+            self._loaded_at = time.monotonic()
+        logger.debug(f"Loaded {sum(len(v) for v in daily.values())} daily indices for {self.pattern}")
+
+    def _ensure_loaded(self, client, end_day):
+        now = time.monotonic()
+        age = None if self._loaded_at is None else now - self._loaded_at
+        newest = max(self._daily) if self._daily else None
+        stale = age is None or age >= Config.OPENSEARCH_INDEX_REFRESH_INTERVAL
+        rolled = (newest is not None and end_day > newest and
+                  age >= self.MIN_REFRESH_INTERVAL)
+        if stale or rolled:
+            self.refresh(client)
+
+    def resolve(self, client, start_time=None, end_time=None):
+        """
+        Return a comma-separated list of the indices covering
+        [start_time, end_time], or the index pattern when the range is
+        open-ended, unparseable, or covers every index anyway.
+        """
+        start = parse_timestamp(start_time)
+        end = parse_timestamp(end_time)
+        if start is None or end is None or start > end:
+            return self.pattern
+
+        try:
+            self._ensure_loaded(client, end.date())
+        except Exception as e:
+            logger.warning(f"Could not list indices for {self.pattern}: {str(e)}")
+            return self.pattern
+
+        with self._lock:
+            daily = self._daily
+            undated = self._undated
+
+        days = [day for day in daily if start.date() <= day <= end.date()]
+        if not days or len(days) == len(daily):
+            return self.pattern
+
+        names = []
+        for day in sorted(days):
+            names.extend(daily[day])
+        return ",".join(names + undated)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pattern": self.pattern,
+                "daily_indices": sum(len(v) for v in self._daily.values()),
+                "undated_indices": len(self._undated),
+                "oldest_day": min(self._daily).isoformat() if self._daily else None,
+                "newest_day": max(self._daily).isoformat() if self._daily else None,
+                "age_seconds": (round(time.monotonic() - self._loaded_at, 1)
+                                if self._loaded_at is not None else None)
+            }
+
+
+_index_resolver = IndexResolver()
+
+
+def get_index_resolver():
+    """Return the process-wide time-range index resolver"""
+    return _index_resolver
+
+
+_INTERVAL_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+
+def encode_cursor(after_key):
+    """Turn a composite aggregation after_key into an opaque URL-safe cursor"""
+    if not after_key:
+        return None
+    raw = json.dumps(after_key, sort_keys=True, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        after_key = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(after_key, dict):
+        raise ValueError("Invalid cursor")
+    return after_key
+
+
+def _interval_seconds(interval):
+    """Return the length of a fixed histogram interval such as 1h or 1d, or None"""
+    if not isinstance(interval, str) or len(interval) < 2 or interval[-1] not in _INTERVAL_UNITS:
+        return None
+    try:
+        count = int(interval[:-1])
+    except ValueError:
+        return None
+    seconds = count * _INTERVAL_UNITS[interval[-1]]
+    # Buckets longer than a day are calendar-aligned by OpenSearch, not epoch-aligned
+    if count <= 0 or seconds > 86400:
+        return None
+    return seconds
+
+
+class TimelineStore:
+    """
+    Per-process store of closed alert timeline buckets.
+
+    Once a histogram bucket ends more than OPENSEARCH_TIMELINE_SETTLE_SECONDS
+    ago its per-severity counts no longer change, so it is kept and only the
+    still-open buckets and any gaps are queried. Buckets are keyed by index
+    pattern and interval, and are dropped when retention deletes data.
+    """
+
+    MAX_BUCKETS_PER_SERIES = 5000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self.buckets_served = 0
+        self.buckets_queried = 0
+
+    def plan(self, pattern, start_time, end_time, interval):
+        """
+        Work out which bucket ranges must be queried for a timeline.
+
+        Returns None when the interval or times cannot be bucketed here, in
+        which case the caller should run the full histogram.
+        """
+        step = _interval_seconds(interval)
+        start = parse_timestamp(start_time)
+        end = parse_timestamp(end_time)
+        if step is None or start is None or end is None or start > end:
+            return None
+
+        epoch = datetime.datetime(1970, 1, 1)
+        first = int((start - epoch).total_seconds()) // step * step
+        last = int((end - epoch).total_seconds()) // step * step
+        settled = (datetime.datetime.utcnow() - epoch).total_seconds() - Config.OPENSEARCH_TIMELINE_SETTLE_SECONDS
+
+        series_key = (pattern, interval)
+        with self._lock:
+            series = self._series.get(series_key, {})
+            cached = {}
+            queries = []
+            gap_start = None
+            bucket = first
+            while bucket <= last:
+                if bucket + step > settled:
+                    break
+                point = series.get(bucket)
+                if point is None:
+                    if gap_start is None:
+                        gap_start = bucket
+                else:
+                    cached[bucket] = point
+                    if gap_start is not None:
+                        queries.append((gap_start, bucket))
+                        gap_start = None
+                bucket += step
+            if bucket <= last:
+                # Open buckets are always re-queried, together with a gap right before them
+                queries.append((gap_start if gap_start is not None else bucket, last + step))
+            elif gap_start is not None:
+                queries.append((gap_start, bucket))
+
+        return {
+            "series": series_key,
+            "step": step,
+            "first": first,
+            "last": last,
+            "settled": settled,
+            "cached": cached,
+            "queries": [
+                (epoch + datetime.timedelta(seconds=gte), epoch + datetime.timedelta(seconds=lt))
+                for gte, lt in queries
+            ]
+        }
+
+    def merge(self, plan, results):
+        """
+        Combine cached buckets with freshly queried ones.
+
+        results holds one list of (bucket_start_seconds, point) per planned
+        query. Closed buckets among them are stored for next time.
+        """
+        step = plan["step"]
+        points = dict(plan["cached"])
+        fresh = {}
+        for buckets in results:
+            for bucket, point in buckets:
+                points[bucket] = point
+                if bucket + step <= plan["settled"]:
+                    fresh[bucket] = point
+
+        with self._lock:
+            series = self._series.setdefault(plan["series"], {})
+            series.update(fresh)
+            overflow = len(series) - self.MAX_BUCKETS_PER_SERIES
+            if overflow > 0:
+                for bucket in sorted(series)[:overflow]:
+                    del series[bucket]
+            self.buckets_served += len(plan["cached"])
+            self.buckets_queried += sum(len(buckets) for buckets in results)
+
+        timeline = []
+        bucket = plan["first"]
+        while bucket <= plan["last"]:
+            if bucket in points:
+                timeline.append(dict(points[bucket]))
+            bucket += step
+        return timeline
+
+    def invalidate(self, before=None):
+        """Drop stored buckets that start before the given datetime, or all of them"""
+        with self._lock:
+            if before is None:
+                self._series.clear()
+                return
+            cutoff = (before - datetime.datetime(1970, 1, 1)).total_seconds()
+            for series in self._series.values():
+                for bucket in [b for b in series if b < cutoff]:
+                    del series[bucket]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "series": len(self._series),
+                "buckets": sum(len(series) for series in self._series.values()),
+                "buckets_served": self.buckets_served,
+                "buckets_queried": self.buckets_queried
+            }
+
+
+_timeline_store = TimelineStore()
+
+
+def get_timeline_store():
+    """Return the process-wide timeline bucket store"""
+    return _timeline_store
+
+
+_FANOUT_THREAD_PREFIX = "opensearch-fanout"
+_fanout_lock = threading.Lock()
+_fanout_executor = None
+_fanout_pid = None
+
+
+def _get_fanout_executor():
+    """Return the shared fan-out thread pool, recreating it after a fork"""
+    global _fanout_executor, _fanout_pid
+    pid = os.getpid()
+    if _fanout_executor is not None and _fanout_pid == pid:
+        return _fanout_executor
+    with _fanout_lock:
+        if _fanout_executor is None or _fanout_pid != pid:
+            # Sized like the HTTP pool so fan-out never queues on connections
+            _fanout_executor = ThreadPoolExecutor(
+                max_workers=Config.OPENSEARCH_POOL_MAXSIZE,
+                thread_name_prefix=_FANOUT_THREAD_PREFIX
+            )
+            _fanout_pid = pid
+        return _fanout_executor
+
+
+def run_concurrently(calls):
+    """
+    Run independent blocking calls at the same time from sync code.
+
+    calls maps a name to a zero-argument callable (use functools.partial to
+    bind arguments). Returns a dict of each call's result, so the total
+    latency is that of the slowest call rather than the sum. A call that
+    raises yields {"error": str} like the API methods do.
+    """
+    def run_inline(name, call):
+        try:
+            return call()
+        except Exception as e:
+            logger.error(f"Concurrent call '{name}' failed: {str(e)}")
+            return {"error": str(e)}
+
+    # Nested fan-out from a pool thread could wait on itself; run it inline
+    if len(calls) <= 1 or threading.current_thread().name.startswith(_FANOUT_THREAD_PREFIX):
+        return {name: run_inline(name, call) for name, call in calls.items()}
+
+    executor = _get_fanout_executor()
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, call)
+        for name, call in calls.items()
+    }
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            logger.error(f"Concurrent call '{name}' failed: {str(e)}")
+            results[name] = {"error": str(e)}
+    return results
+
+
+@contextmanager
+def query_caller(name):
+    """
+    Attribute OpenSearch calls made inside the block (or decorated function)
+    to a scheduler job or worker. Route calls are attributed automatically.
+    """
+    token = _query_caller.set(name)
+    try:
+        yield
+    finally:
+        _query_caller.reset(token)
+
+
+def _current_caller():
+    caller = _query_caller.get()
+    if caller:
+        return caller
+    if has_request_context():
+        return f"route:{request.endpoint}"
+    return f"thread:{threading.current_thread().name}"
+
+
+class _CallRecord:
+    """Cluster-side figures collected while one API call runs"""
+
+    __slots__ = ("operation", "caller", "requests", "took", "hits", "shards_total",
+                 "shards_failed", "response_bytes", "paths", "elapsed")
+
+    def __init__(self, operation, caller):
+        self.operation = operation
+        self.caller = caller
+        self.requests = 0
+        self.took = 0
+        self.hits = 0
+        self.shards_total = 0
+        self.shards_failed = 0
+        self.response_bytes = 0
+        self.paths = []
+        self.elapsed = 0.0
+
+    def add_response(self, method, url, response):
+        self.requests += 1
+        if len(self.paths) < 10:
+            self.paths.append(f"{method} {url}")
+        if not isinstance(response, dict):
+            return
+        for part in response.get("responses") or [response]:
+            self.took += part.get("took") or 0
+            shards = part.get("_shards") or {}
+            self.shards_total += shards.get("total") or 0
+            self.shards_failed += shards.get("failed") or 0
+            hits = part.get("hits")
+            if isinstance(hits, dict):
+                self.hits += len(hits.get("hits") or [])
+
+
+# Upper bounds (ms) of the wall-time histogram buckets
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class QueryMetrics:
+    """
+    Per-process latency histograms and slow-query log for OpenSearchAPI calls,
+    grouped by API method and calling route/job.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._slow = deque(maxlen=Config.OPENSEARCH_SLOW_QUERY_LOG_SIZE)
+
+    def record(self, call, wall_ms, error=None):
+        key = (call.operation, call.caller)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    "count": 0, "errors": 0, "cached": 0,
+                    "wall_ms_total": 0.0, "wall_ms_max": 0.0,
+                    "took_ms_total": 0, "took_ms_max": 0,
+                    "bytes_total": 0, "bytes_max": 0,
+                    "hits_total": 0, "shards_total": 0, "shards_failed": 0,
+                    "requests": 0,
+                    "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1)
+                }
+            series["count"] += 1
+            series["errors"] += 1 if error else 0
+            series["cached"] += 1 if call.requests == 0 and not error else 0
+            series["wall_ms_total"] += wall_ms
+            series["wall_ms_max"] = max(series["wall_ms_max"], wall_ms)
+            series["took_ms_total"] += call.took
+            series["took_ms_max"] = max(series["took_ms_max"], call.took)
+            series["bytes_total"] += call.response_bytes
+            series["bytes_max"] = max(series["bytes_max"], call.response_bytes)
+            series["hits_total"] += call.hits
+            series["shards_total"] += call.shards_total
+            series["shards_failed"] += call.shards_failed
+            series["requests"] += call.requests
+            bucket = len(LATENCY_BUCKETS_MS)
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if wall_ms <= bound:
+                    bucket = i
+                    break
+            series["histogram"][bucket] += 1
+
+        if wall_ms >= Config.OPENSEARCH_SLOW_QUERY_MS:
+            entry = {
+                "time": datetime.datetime.utcnow().isoformat(),
+                "operation": call.operation,
+                "caller": call.caller,
+                "wall_ms": round(wall_ms, 1),
+                "took_ms": call.took,
+                "requests": call.requests,
+                "hits": call.hits,
+                "response_bytes": call.response_bytes,
+                "shards": call.shards_total,
+                "shards_failed": call.shards_failed,
+                "paths": list(call.paths),
+                "error": error
+            }
+            with self._lock:
+                self._slow.append(entry)
+            logger.warning(
+                f"Slow OpenSearch call {call.operation} from {call.caller}: "
+                f"{wall_ms:.0f}ms wall, {call.took}ms took, {call.requests} requests, "
+                f"{call.response_bytes} bytes, {call.hits} hits, {call.shards_total} shards"
+            )
+
+    def _percentile(self, histogram, count, fraction):
+        target = count * fraction
+        seen = 0
+        for i, bucket_count in enumerate(histogram):
+            seen += bucket_count
+            if seen >= target:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else None
+        return None
+
+    def snapshot(self):
+        """Return per-operation figures, busiest first, and the slow-query log"""
+        with self._lock:
+            series_items = [(key, dict(series, histogram=list(series["histogram"])))
+                            for key, series in self._series.items()]
+            slow = list(self._slow)
+
+        operations = []
+        for (operation, caller), series in series_items:
+            count = series["count"]
+            operations.append({
+                "operation": operation,
+                "caller": caller,
+                "count": count,
+                "errors": series["errors"],
+                "cached": series["cached"],
+                "requests": series["requests"],
+                "wall_ms": {
+                    "total": round(series["wall_ms_total"], 1),
+                    "avg": round(series["wall_ms_total"] / count, 1),
+                    "max": round(series["wall_ms_max"], 1),
+                    # Percentiles are bucket upper bounds; None means above the last bucket
+                    "p50": self._percentile(series["histogram"], count, 0.5),
+                    "p95": self._percentile(series["histogram"], count, 0.95),
+                    "p99": self._percentile(series["histogram"], count, 0.99)
+                },
+                "took_ms": {
+                    "avg": round(series["took_ms_total"] / count, 1),
+                    "max": series["took_ms_max"]
+                },
+                "response_bytes": {
+                    "total": series["bytes_total"],
+                    "avg": round(series["bytes_total"] / count),
+                    "max": series["bytes_max"]
+                },
+                "hits_avg": round(series["hits_total"] / count, 1),
+                "shards_avg": round(series["shards_total"] / count, 1),
+                "shards_failed": series["shards_failed"],
+                "histogram": dict(zip([f"le_{bound}" for bound in LATENCY_BUCKETS_MS] + ["inf"],
+                                      series["histogram"]))
+            })
+        operations.sort(key=lambda item: item["wall_ms"]["total"], reverse=True)
+
+        return {
+            "pid": os.getpid(),
+            "slow_query_ms": Config.OPENSEARCH_SLOW_QUERY_MS,
+            "operations": operations,
+            "slow_queries": slow
+        }
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self._slow.clear()
+
+
+_query_metrics = QueryMetrics()
+
+
+def get_query_metrics():
+    """Return the process-wide OpenSearch query metrics"""
+    return _query_metrics
+
+
+def _instrumented(func):
+    """
+    Record wall time, server took, shards, hits, response bytes and caller
+    for an OpenSearchAPI method. Calls nested inside another instrumented
+    call are counted toward the outer one.
+    """
+    operation = func.__name__
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(self, *args, **kwargs):
+            if _current_call.get() is not None:
+                yield from func(self, *args, **kwargs)
+                return
+
+            call = _CallRecord(operation, _current_caller())
+            generator = func(self, *args, **kwargs)
+            error = None
+            try:
+                while True:
+                    # Only time spent producing items counts, not the consumer's
+                    token = _current_call.set(call)
+                    started = time.perf_counter()
+                    try:
+                        item = next(generator)
+                    except StopIteration:
+                        return
+                    except Exception as e:
+                        error = str(e)
+                        raise
+                    finally:
+                        call.elapsed += time.perf_counter() - started
+                        _current_call.reset(token)
+                    yield item
+            finally:
+                token = _current_call.set(call)
+                try:
+                    generator.close()
+                finally:
+                    _current_call.reset(token)
+                _query_metrics.record(call, call.elapsed * 1000, error)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if _current_call.get() is not None:
+            return func(self, *args, **kwargs)
+
+        call = _CallRecord(operation, _current_caller())
+        token = _current_call.set(call)
+        started = time.perf_counter()
+        error = None
+        try:
+            result = func(self, *args, **kwargs)
+            if isinstance(result, dict) and "error" in result:
+                error = str(result["error"])
+            return result
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            _current_call.reset(token)
+            _query_metrics.record(call, (time.perf_counter() - started) * 1000, error)
+    return wrapper
+
+
 class OpenSearchAPI:
     def __init__(self):
         self.host = Config.OPENSEARCH_URL
@@ -14,213 +1355,179 @@ class OpenSearchAPI:
         self.password = Config.OPENSEARCH_PASSWORD
         self.verify_ssl = Config.OPENSEARCH_VERIFY_SSL
         self.index_pattern = Config.OPENSEARCH_INDEX_PATTERN
+        self.pool = get_client_pool()
+        self.cache = get_aggregation_cache()
+        self.indices = get_index_resolver()
+        self.timeline = get_timeline_store()
         self.client = None
-        self._connect()
+        try:
+            self.client = self.pool.get_client()
+        except Exception as e:
+            logger.error(f"Failed to create OpenSearch client: {str(e)}")
     
     def _connect(self):
-        """Connect to OpenSearch instance"""
+        """Attach to the shared OpenSearch client and check cluster health"""
         try:
-            self.client = OpenSearch(
-                hosts=[self.host],
-                http_auth=(self.username, self.password),
-                use_ssl=True if self.host.startswith('https') else False,
-                verify_certs=self.verify_ssl,
-                connection_class=RequestsHttpConnection
-            )
-            if self.client.ping():
-                logger.info("Successfully connected to OpenSearch")
-                return True
-            else:
-                logger.error("Failed to connect to OpenSearch, ping failed")
+            self.client = self.pool.get_client()
+            if self.pool.breaker.is_open():
                 return False
-        except (ConnectionError, AuthenticationException) as e:
+            return self.pool.is_healthy()
+        except Exception as e:
             logger.error(f"Failed to connect to OpenSearch: {str(e)}")
+            self.client = None
             return False
         
-    def search_alerts(self, severity_levels=None, start_time=None, end_time=None, 
-                      limit=100, offset=0, sort_field="_score", sort_order="desc", 
-                      additional_filters=None):
-        """
-        Search for alerts in OpenSearch based on filters
-        """
-        if not self.client:
-            if not self._connect():
-                return {"error": "Failed to connect to OpenSearch"}
-        
-        try:
-            # Build the query
-            query = {
-                "bool": {
-                    "must": [],
-                    "filter": []
-                }
+    def _index_for(self, start_time=None, end_time=None):
+        """Return the narrowest index expression that covers the time range"""
+        if not Config.OPENSEARCH_INDEX_PRUNING or not self.client:
+            return self.index_pattern
+        return self.indices.resolve(self.client, start_time, end_time)
+    
+    def _build_alert_query(self, severity_levels=None, start_time=None, end_time=None,
+                           additional_filters=None):
+        """Build the bool query shared by search_alerts and iter_alerts"""
+        # Build the query
+        query = {
+            "bool": {
+                "must": [],
+                "filter": []
             }
-            
-            # Define Misc Events criteria (Rule IDs and descriptions)
-            misc_events_filter = {
-                "bool": {
-                    "should": [
-                        {"terms": {"rule.id": [750, 60642, 752, 550, 60106]}},
-                        {"match_phrase": {"rule.description": "SonicWall warning messages"}},
-                        {"match_phrase": {"rule.description": "SonicWall error messages"}},
-                        {"match_phrase": {"rule.description": "Integrity checksum changed"}},
-                        {"match_phrase": {"rule.description": "Registry value integrity checksum changed"}}
-                    ],
-                    "minimum_should_match": 1
-                }
+        }
+        
+        # Define Misc Events criteria (Rule IDs and descriptions)
+        misc_events_filter = {
+            "bool": {
+                "should": [{"terms": {"rule.id": MISC_EVENT_RULE_IDS}}] + [
+                    {"match_phrase": {"rule.description": phrase}}
+                    for phrase in MISC_EVENT_DESCRIPTIONS
+                ],
+                "minimum_should_match": 1
             }
+        }
 
-            # Map severity keywords to Wazuh/OpenSearch levels
-            severity_map = {
-                'low': {"gte": 1, "lte": 6},
-                'medium': {"gte": 7, "lte": 11},
-                'high': {"gte": 12, "lte": 14},
-                'critical': {"gte": 15, "lte": 100}
-            }
-            
-            # Add time range filter if specified
-            if start_time and end_time:
-                query["bool"]["filter"].append({
-                    "range": {
-                        "@timestamp": {
-                            "gte": start_time,
-                            "lte": end_time
-                        }
+        # Map severity keywords to Wazuh/OpenSearch levels
+        severity_map = {
+            severity: {"gte": low, "lte": high}
+            for severity, (low, high) in SEVERITY_RANGES.items()
+        }
+        
+        # Add time range filter if specified
+        if start_time and end_time:
+            query["bool"]["filter"].append({
+                "range": {
+                    "@timestamp": {
+                        "gte": start_time,
+                        "lte": end_time
                     }
-                })
-            
-            # Add severity level filters
-            if severity_levels:
-                level_ranges = []
-                for severity in severity_levels:
-                    severity = severity.lower()
-                    if severity in severity_map:
-                        # Exclude Misc Events from Low and Medium
-                        if severity in ['low', 'medium']:
-                            level_ranges.append({
-                                "bool": {
-                                    "must": [
-                                        {"range": {"rule.level": severity_map[severity]}}
-                                    ],
-                                    "must_not": [misc_events_filter]
-                                }
-                            })
-                        else:
-                            level_ranges.append({
-                                "range": {
-                                    "rule.level": severity_map[severity]
-                                }
-                            })
-                    elif severity == 'fim':
-                        # Special handling for FIM - filter by specific rule IDs
+                }
+            })
+        
+        # Add severity level filters
+        if severity_levels:
+            level_ranges = []
+            for severity in severity_levels:
+                severity = severity.lower()
+                if severity in severity_map:
+                    # Exclude Misc Events from Low and Medium
+                    if severity in ['low', 'medium']:
                         level_ranges.append({
-                            "terms": {
-                                "rule.id": [553, 554]
-                            }
-                        })
-                    elif severity == 'events':
-                        # Special handling for Misc Events
-                        level_ranges.append(misc_events_filter)
-                
-                if level_ranges:
-                    # Use filter instead of should for more precise filtering
-                    if len(level_ranges) == 1:
-                        query["bool"]["filter"].extend(level_ranges)
-                    else:
-                        query["bool"]["filter"].append({
                             "bool": {
-                                "should": level_ranges,
-                                "minimum_should_match": 1
-                            }
-                        })
-            
-            # Add additional filters if specified
-            if additional_filters:
-                for field, value in additional_filters.items():
-                    if field == 'search_query' and value:
-                        # Normalize common user-friendly terms to technical ones
-                        normalized_value = value.lower()
-                        if 'remote logon' in normalized_value:
-                            value = f"{value} \"Remote Logon\""
-                        
-                        # Multi-field search for agent name, IP, and description
-                        query["bool"]["must"].append({
-                            "bool": {
-                                "should": [
-                                    {
-                                        "multi_match": {
-                                            "query": value,
-                                            "fields": [
-                                                "agent.name^3",
-                                                "agent.ip^3",
-                                                "rule.description^15", # Higher boost for descriptions
-                                                "full_log^10",          # Higher boost for raw logs
-                                                "data.win.eventdata.targetUserName^20", # MASSIVE boost for user names
-                                                "data.win.eventdata.subjectUserName^20",
-                                                "data.win.eventdata.logonId^5",
-                                                "data.win.eventdata.logonType^5",
-                                                "data.win.eventdata.ipAddress^10",
-                                                "data.win.eventdata.ipPort^5",
-                                                "data.win.eventdata.status^10",
-                                                "data.win.eventdata.subStatus^10",
-                                                "syscheck.uname_after^20", # MASSIVE boost for FIM user names
-                                                "syscheck.path^20", # Boost for file paths
-                                                "data.win.eventdata.destinationUserName^20",
-                                                "data.win.eventdata.sourceUserName^20"
-                                            ],
-                                            "type": "best_fields",
-                                            "fuzziness": "AUTO",
-                                            "minimum_should_match": "1" # Minimal matching
-                                        }
-                                    },
-                                    {
-                                        "match_phrase": {
-                                            "syscheck.path": {
-                                                "query": value,
-                                                "boost": 100
-                                            }
-                                        }
-                                    },
-                                    {
-                                        "match_phrase": {
-                                            "data.win.eventdata.targetUserName": {
-                                                "query": value,
-                                                "boost": 100
-                                            }
-                                        }
-                                    },
-                                    {
-                                        "query_string": {
-                                            "query": f"*{value}*",
-                                            "fields": [
-                                                "rule.description", 
-                                                "data.win.eventdata.targetUserName", 
-                                                "data.win.eventdata.subjectUserName",
-                                                "syscheck.uname_after",
-                                                "syscheck.path",
-                                                "full_log",
-                                                "data.win.eventdata.destinationUserName"
-                                            ],
-                                            "boost": 10
-                                        }
-                                    }
-                                ]
-                            }
-                        })
-                    elif field == 'rule.id' and isinstance(value, list):
-                        # Handle list values for rule IDs (like FIM)
-                        query["bool"]["filter"].append({
-                            "terms": {
-                                field: value
+                                "must": [
+                                    {"range": {"rule.level": severity_map[severity]}}
+                                ],
+                                "must_not": [misc_events_filter]
                             }
                         })
                     else:
-                        # Regular term filter for other fields
-                        query["bool"]["filter"].append({
-                            "term": {
-                                field: value
+                        level_ranges.append({
+                            "range": {
+                                "rule.level": severity_map[severity]
                             }
                         })
+                elif severity == 'fim':
+                    # Special handling for FIM - filter by specific rule IDs
+                    level_ranges.append({
+                        "terms": {
+                            "rule.id": FIM_RULE_IDS
+                        }
+                    })
+                elif severity == 'events':
+                    # Special handling for Misc Events
+                    level_ranges.append(misc_events_filter)
+            
+            if level_ranges:
+                # Use filter instead of should for more precise filtering
+                if len(level_ranges) == 1:
+                    query["bool"]["filter"].extend(level_ranges)
+                else:
+                    query["bool"]["filter"].append({
+                        "bool": {
+                            "should": level_ranges,
+                            "minimum_should_match": 1
+                        }
+                    })
+        
+        # Add additional filters if specified
+        if additional_filters:
+            for field, value in additional_filters.items():
+                if field == 'search_query' and value:
+                    # Clause set depends on search_mode (see search_strategies)
+                    query["bool"]["must"].append(
+                        build_search_clause(value, additional_filters.get('search_mode'))
+                    )
+                elif field in ('search_query', 'search_mode'):
+                    continue
+                elif field == 'rule.id' and isinstance(value, list):
+                    # Handle list values for rule IDs (like FIM)
+                    query["bool"]["filter"].append({
+                        "terms": {
+                            field: value
+                        }
+                    })
+                else:
+                    # Regular term filter for other fields
+                    query["bool"]["filter"].append({
+                        "term": {
+                            field: value
+                        }
+                    })
+        
+        return query
+    
+    def _source_filter(self, projection):
+        """
+        Translate a projection into a _source filter.
+
+        Accepts a SOURCE_PROFILES name, a list of field names (includes), or
+        a dict with "includes"/"excludes". None keeps the full _source.
+        """
+        if not projection:
+            return None
+        if isinstance(projection, str):
+            if projection not in SOURCE_PROFILES:
+                logger.warning(f"Unknown source projection profile: {projection}")
+                return None
+            return {"includes": list(SOURCE_PROFILES[projection])}
+        if isinstance(projection, dict):
+            return projection
+        return {"includes": list(projection)}
+    
+    @_instrumented
+    def search_alerts(self, severity_levels=None, start_time=None, end_time=None, 
+                      limit=100, offset=0, sort_field="_score", sort_order="desc", 
+                      additional_filters=None, projection=None):
+        """
+        Search for alerts in OpenSearch based on filters
+
+        projection limits the returned _source fields (see _source_filter).
+        """
+        if not self.client:
+            if not self._connect():
+                return {"error": "Failed to connect to OpenSearch"}
+        
+        try:
+            query = self._build_alert_query(severity_levels, start_time, end_time,
+                                            additional_filters)
             
             # Build the search body
             search_body = {
@@ -231,30 +1538,24 @@ class OpenSearchAPI:
                     {sort_field: {"order": sort_order}}
                 ]
             }
+            source_filter = self._source_filter(projection)
+            if source_filter:
+                search_body["_source"] = source_filter
             
             # Execute the search
             response = self.client.search(
                 body=search_body,
-                index=self.index_pattern
+                index=self._index_for(start_time, end_time),
+                ignore_unavailable=True
             )
             
             # Format the results
-            hits = response["hits"]["hits"]
             total = response["hits"]["total"]["value"]
-            
-            results = []
-            for hit in hits:
-                results.append({
-                    "id": hit["_id"],
-                    "index": hit["_index"],
-                    "score": hit["_score"],
-                    "source": hit["_source"]
-                })
+            results = self._format_hits(response)
             
             return {
                 "total": total,
-                "results": results,
-                "request": search_body  # Include the request for debugging
+                "results": results
             }
             
         except RequestError as e:
@@ -264,6 +1565,101 @@ class OpenSearchAPI:
             logger.error(f"Error searching alerts: {str(e)}")
             return {"error": str(e)}
     
+    @_instrumented
+    def iter_alerts(self, severity_levels=None, start_time=None, end_time=None,
+                    additional_filters=None, sort_order="asc", batch_size=None,
+                    keep_alive=None, max_results=None, projection=None,
+                    search_after=None):
+        """
+        Stream matching alerts one hit at a time.
+
+        Opens a point-in-time over the index pattern and pages through it
+        with search_after, so memory stays bounded by batch_size and there is
+        no 10k from/size window. Falls back to plain search_after paging if
+        the cluster does not support point-in-time. Passing the "sort" of a
+        previously seen hit as search_after resumes strictly after it.
+
+        Yields dicts with the same shape as search_alerts results plus the
+        hit's "sort" values. Raises on query or connection errors.
+        """
+        if not self.client:
+            if not self._connect():
+                raise ConnectionError("N/A", "Failed to connect to OpenSearch", None)
+
+        batch_size = batch_size or Config.OPENSEARCH_BATCH_SIZE
+        keep_alive = keep_alive or Config.OPENSEARCH_PIT_KEEP_ALIVE
+        query = self._build_alert_query(severity_levels, start_time, end_time,
+                                        additional_filters)
+        source_filter = self._source_filter(projection)
+        # @timestamp alone is not unique; the Wazuh alert id breaks ties
+        sort = [
+            {"@timestamp": {"order": sort_order}},
+            {ALERT_TIEBREAKER_FIELD: {"order": sort_order}}
+        ]
+
+        index = self._index_for(start_time, end_time)
+        pit_id = self._open_point_in_time(keep_alive, index)
+        yielded = 0
+        try:
+            while True:
+                search_body = {
+                    "query": query,
+                    "size": batch_size,
+                    "sort": sort,
+                    "track_total_hits": False
+                }
+                if source_filter:
+                    search_body["_source"] = source_filter
+                if search_after:
+                    search_body["search_after"] = search_after
+
+                if pit_id:
+                    search_body["pit"] = {"id": pit_id, "keep_alive": keep_alive}
+                    response = self.client.search(body=search_body)
+                    pit_id = response.get("pit_id", pit_id)
+                else:
+                    response = self.client.search(body=search_body, index=index,
+                                                  ignore_unavailable=True)
+
+                hits = response["hits"]["hits"]
+                for hit in hits:
+                    yield {
+                        "id": hit["_id"],
+                        "index": hit["_index"],
+                        "score": hit["_score"],
+                        "source": hit["_source"],
+                        "sort": hit.get("sort")
+                    }
+                    yielded += 1
+                    if max_results and yielded >= max_results:
+                        return
+
+                if len(hits) < batch_size:
+                    return
+                search_after = hits[-1]["sort"]
+        finally:
+            if pit_id:
+                self._close_point_in_time(pit_id)
+
+    def _open_point_in_time(self, keep_alive, index=None):
+        """Open a point-in-time over the given indices, or None if unsupported"""
+        try:
+            response = self.client.create_pit(
+                index=index or self.index_pattern,
+                keep_alive=keep_alive
+            )
+            return response.get("pit_id")
+        except Exception as e:
+            logger.warning(f"Point-in-time not available, paging without it: {str(e)}")
+            return None
+
+    def _close_point_in_time(self, pit_id):
+        try:
+            self.client.delete_pit(body={"pit_id": [pit_id]})
+        except Exception as e:
+            logger.warning(f"Error closing point-in-time: {str(e)}")
+    
+    @_instrumented
     def get_alert_by_id(self, alert_id, index=None):
         """Get a specific alert by ID"""
         if not self.client:
@@ -297,7 +1693,56 @@ class OpenSearchAPI:
         except Exception as e:
             logger.error(f"Error getting alert: {str(e)}")
             return {"error": str(e)}
-    
+
+    @_instrumented
+    def get_alerts_by_ids(self, ids, index_hints=None):
+        """
+        Get several alerts in at most two round trips.
+
+        index_hints maps alert ID to the index it lives in. Hinted IDs are
+        fetched with one mget; the rest (and any hint that turned out to be
+        wrong) with a single ids query across the index pattern.
+
+        Returns {"results": hits in the order of ids, "missing": ids not found}
+        """
+        if not self.client:
+            if not self._connect():
+                return {"error": "Failed to connect to OpenSearch"}
+
+        ids = list(dict.fromkeys(str(alert_id) for alert_id in ids if alert_id))
+        index_hints = index_hints or {}
+        found = {}
+
+        try:
+            docs = [{"_index": index_hints[alert_id], "_id": alert_id}
+                    for alert_id in ids if index_hints.get(alert_id)]
+            if docs:
+                response = self.client.mget(body={"docs": docs})
+                for doc in response.get("docs", []):
+                    if doc.get("found"):
+                        found[doc["_id"]] = doc
+
+            unresolved = [alert_id for alert_id in ids if alert_id not in found]
+            if unresolved:
+                response = self.client.search(
+                    body={
+                        "query": {"ids": {"values": unresolved}},
+                        "size": len(unresolved)
+                    },
+                    index=self.index_pattern
+                )
+                for hit in response["hits"]["hits"]:
+                    found.setdefault(hit["_id"], hit)
+
+            return {
+                "results": [found[alert_id] for alert_id in ids if alert_id in found],
+                "missing": [alert_id for alert_id in ids if alert_id not in found]
+            }
+        except Exception as e:
+            logger.error(f"Error getting alerts by ID: {str(e)}")
+            return {"error": str(e)}
+
+    @_instrumented
     def get_alert_count_by_severity(self, start_time=None, end_time=None):
         """Get alert counts grouped by severity level"""
         if not self.client:
@@ -305,113 +1750,137 @@ class OpenSearchAPI:
                 return {"error": "Failed to connect to OpenSearch"}
         
         try:
-            # Build the query
-            query = {
-                "bool": {
-                    "filter": []
-                }
+            start_time, end_time = self.cache.round_range(start_time, end_time)
+            return self._cached_search(
+                "alert_counts",
+                self._alert_count_body(start_time, end_time),
+                self._parse_alert_counts,
+                start_time, end_time
+            )
+        except Exception as e:
+            logger.error(f"Error getting alert counts: {str(e)}")
+            return {"error": str(e)}
+    
+    def _cached_search(self, kind, body, parse, start_time=None, end_time=None):
+        """Run a search through the aggregation cache and return the parsed result"""
+        index = self._index_for(start_time, end_time)
+        
+        def load():
+            response = self.client.search(body=body, index=index, ignore_unavailable=True)
+            return parse(response)
+        
+        key = self.cache.make_key(kind, {"index": index, "body": body})
+        return self.cache.get_or_load(key, load, CACHE_TTLS.get(kind),
+                                      allow_stale=self._allow_stale(),
+                                      relative_key=self.cache.relative_key(kind, body, start_time, end_time))
+    
+    def _allow_stale(self):
+        """Interactive (dashboard) requests may get stale results during an outage; jobs may not"""
+        return has_request_context()
+    
+    def _alert_count_body(self, start_time=None, end_time=None):
+        """Build the severity count aggregation request"""
+        # Build the query
+        query = {
+            "bool": {
+                "filter": []
             }
-            
-            # Add time range filter if specified
-            if start_time and end_time:
-                query["bool"]["filter"].append({
+        }
+        
+        # Add time range filter if specified
+        if start_time and end_time:
+            query["bool"]["filter"].append({
+                "range": {
+                    "@timestamp": {
+                        "gte": start_time,
+                        "lte": end_time
+                    }
+                }
+            })
+        
+        # Build the search body with aggregation
+        return {
+            "size": 0,  # We only want aggregation results
+            "query": query,
+            "aggs": {
+                "severity_counts": {
                     "range": {
-                        "@timestamp": {
-                            "gte": start_time,
-                            "lte": end_time
-                        }
+                        "field": "rule.level",
+                        "ranges": [
+                            {"to": 1, "key": "none"},            # Level 0
+                            {"from": 1, "to": 7, "key": "low"},  # Levels 1-6
+                            {"from": 7, "to": 12, "key": "medium"},  # Levels 7-11
+                            {"from": 12, "to": 15, "key": "high"},   # Levels 12-14
+                            {"from": 15, "key": "critical"}       # Level 15+
+                        ]
                     }
-                })
-            
-            # Build the search body with aggregation
-            search_body = {
-                "size": 0,  # We only want aggregation results
-                "query": query,
-                "aggs": {
-                    "severity_counts": {
-                        "range": {
-                            "field": "rule.level",
-                            "ranges": [
-                                {"to": 1, "key": "none"},            # Level 0
-                                {"from": 1, "to": 7, "key": "low"},  # Levels 1-6
-                                {"from": 7, "to": 12, "key": "medium"},  # Levels 7-11
-                                {"from": 12, "to": 15, "key": "high"},   # Levels 12-14
-                                {"from": 15, "key": "critical"}       # Level 15+
-                            ]
-                        }
-                    },
-                    "fim_counts": {
-                        "terms": {
-                            "field": "rule.id",
-                            "include": [553, 554]
+                },
+                "fim_counts": {
+                    "terms": {
+                        "field": "rule.id",
+                        "include": [553, 554]
+                    }
+                },
+                "misc_events_counts": {
+                    "filter": {
+                        "bool": {
+                            "should": [
+                                {"terms": {"rule.id": [750, 60642, 752, 550, 60106]}},
+                                {"match_phrase": {"rule.description": "SonicWall warning messages"}},
+                                {"match_phrase": {"rule.description": "SonicWall error messages"}},
+                                {"match_phrase": {"rule.description": "Integrity checksum changed"}},
+                                {"match_phrase": {"rule.description": "Registry value integrity checksum changed"}}
+                            ],
+                            "minimum_should_match": 1
                         }
                     },
-                    "misc_events_counts": {
-                        "filter": {
-                            "bool": {
-                                "should": [
-                                    {"terms": {"rule.id": [750, 60642, 752, 550, 60106]}},
-                                    {"match_phrase": {"rule.description": "SonicWall warning messages"}},
-                                    {"match_phrase": {"rule.description": "SonicWall error messages"}},
-                                    {"match_phrase": {"rule.description": "Integrity checksum changed"}},
-                                    {"match_phrase": {"rule.description": "Registry value integrity checksum changed"}}
-                                ],
-                                "minimum_should_match": 1
-                            }
-                        },
-                        "aggs": {
-                            "severity_breakdown": {
-                                "range": {
-                                    "field": "rule.level",
-                                    "ranges": [
-                                        {"from": 1, "to": 7, "key": "low"},
-                                        {"from": 7, "to": 12, "key": "medium"}
-                                    ]
-                                }
+                    "aggs": {
+                        "severity_breakdown": {
+                            "range": {
+                                "field": "rule.level",
+                                "ranges": [
+                                    {"from": 1, "to": 7, "key": "low"},
+                                    {"from": 7, "to": 12, "key": "medium"}
+                                ]
                             }
                         }
                     }
                 }
             }
-            
-            # Execute the search
-            response = self.client.search(
-                body=search_body,
-                index=self.index_pattern
-            )
-            
-            # Format the results
-            buckets = response["aggregations"]["severity_counts"]["buckets"]
-            
-            result = {}
-            for bucket in buckets:
-                result[bucket["key"]] = bucket["doc_count"]
-            
-            # Add FIM count
-            fim_buckets = response["aggregations"]["fim_counts"]["buckets"]
-            fim_count = sum(bucket["doc_count"] for bucket in fim_buckets)
-            result["fim"] = fim_count
-
-            # Add Misc Events count
-            misc_aggs = response["aggregations"]["misc_events_counts"]
-            misc_count = misc_aggs["doc_count"]
-            result["events"] = misc_count
-            
-            # Subtract Misc Events from Low and Medium counts for accurate display
-            misc_low = 0
-            misc_medium = 0
-            for b in misc_aggs["severity_breakdown"]["buckets"]:
-                if b["key"] == "low": misc_low = b["doc_count"]
-                if b["key"] == "medium": misc_medium = b["doc_count"]
-            
-            result["low"] = max(0, result["low"] - misc_low)
-            result["medium"] = max(0, result["medium"] - misc_medium)
-            
-            return result
-        except Exception as e:
-            logger.error(f"Error getting alert counts: {str(e)}")
-            return {"error": str(e)}
+        }
+    
+    def _parse_alert_counts(self, response):
+        """Turn a severity count aggregation response into a counts dict"""
+        # Format the results
+        buckets = response["aggregations"]["severity_counts"]["buckets"]
+        
+        result = {}
+        for bucket in buckets:
+            result[bucket["key"]] = bucket["doc_count"]
+        
+        # Add FIM count
+        fim_buckets = response["aggregations"]["fim_counts"]["buckets"]
+        fim_count = sum(bucket["doc_count"] for bucket in fim_buckets)
+        result["fim"] = fim_count
+
+        # Add Misc Events count
+        misc_aggs = response["aggregations"]["misc_events_counts"]
+        misc_count = misc_aggs["doc_count"]
+        result["events"] = misc_count
+        
+        # Subtract Misc Events from Low and Medium counts for accurate display
+        misc_low = 0
+        misc_medium = 0
+        for b in misc_aggs["severity_breakdown"]["buckets"]:
+            if b["key"] == "low": misc_low = b["doc_count"]
+            if b["key"] == "medium": misc_medium = b["doc_count"]
+        
+        result["low"] = max(0, result["low"] - misc_low)
+        result["medium"] = max(0, result["medium"] - misc_medium)
+        
+        return result
     
+    @_instrumented
     def get_high_severity_by_threat_type(self, start_time=None, end_time=None):
         """Get high and critical severity alerts grouped by threat type (rule.groups) and locations"""
         if not self.client:
@@ -425,95 +1894,551 @@ class OpenSearchAPI:
             if not start_time:
                 start_time = (datetime.datetime.utcnow() - datetime.timedelta(hours=24)).isoformat()
             
-            # Build the query for high and critical severity events (levels 12-14 and 15+)
-            query = {
-                "bool": {
-                    "filter": [
-                        {
-                            "range": {
-                                "@timestamp": {
-                                    "gte": start_time,
-                                    "lte": end_time
-                                }
+            start_time, end_time = self.cache.round_range(start_time, end_time)
+            return self._cached_search(
+                "threat_types",
+                self._threat_types_body(start_time, end_time),
+                self._parse_threat_types,
+                start_time, end_time
+            )
+            
+        except Exception as e:
+            logger.error(f"Error getting high severity threats by type: {str(e)}")
+            return {"error": str(e)}
+    
+    def _threat_types_body(self, start_time, end_time):
+        """Build the high/critical threat type and location aggregation request"""
+        # Build the query for high and critical severity events (levels 12-14 and 15+)
+        query = {
+            "bool": {
+                "filter": [
+                    {
+                        "range": {
+                            "@timestamp": {
+                                "gte": start_time,
+                                "lte": end_time
                             }
                         }
-                    ],
-                    "should": [
-                        {
-                            "range": {
-                                "rule.level": {
-                                    "gte": 12,
-                                    "lte": 14  # High severity (levels 12-14)
-                                }
+                    }
+                ],
+                "should": [
+                    {
+                        "range": {
+                            "rule.level": {
+                                "gte": 12,
+                                "lte": 14  # High severity (levels 12-14)
                             }
-                        },
-                        {
-                            "range": {
-                                "rule.level": {
-                                    "gte": 15  # Critical severity (level 15+)
-                                }
+                        }
+                    },
+                    {
+                        "range": {
+                            "rule.level": {
+                                "gte": 15  # Critical severity (level 15+)
                             }
                         }
-                    ],
-                    "minimum_should_match": 1
+                    }
+                ],
+                "minimum_should_match": 1
+            }
+        }
+        
+        # Build the search body with aggregations
+        return {
+            "size": 0,  # We only want aggregation results
+            "query": query,
+            "aggs": {
+                "threat_types": {
+                    "terms": {
+                        "field": "rule.groups",
+                        "size": 10
+                    }
+                },
+                "locations": {
+                    "terms": {
+                        "field": "agent.labels.location.set",
+                        "size": 10
+                    }
                 }
             }
+        }
+    
+    def _parse_threat_types(self, response):
+        # Process threat types
+        threat_type_buckets = response['aggregations']['threat_types']['buckets']
+        threat_types = []
+        
+        for bucket in threat_type_buckets:
+            threat_types.append({
+                "name": bucket['key'],
+                "count": bucket['doc_count']
+            })
+        
+        # Process locations
+        location_buckets = response['aggregations']['locations']['buckets']
+        locations = []
+        
+        for bucket in location_buckets:
+            locations.append({
+                "name": bucket['key'],
+                "count": bucket['doc_count']
+            })
+        
+        return {
+            "threat_types": threat_types,
+            "locations": locations
+        }
+    
+    @_instrumented
+    def get_alerts_timeline(self, start_time, end_time, interval="1h"):
+        """Get alert counts per time bucket, broken down by severity"""
+        if not self.client:
+            if not self._connect():
+                return {"error": "Failed to connect to OpenSearch"}
+        
+        plan = None
+        try:
+            plan = self.timeline.plan(self.index_pattern, start_time, end_time, interval)
+            if plan is None:
+                start_time, end_time = self.cache.round_range(start_time, end_time)
+                return self._cached_search(
+                    "timeline",
+                    self._timeline_body(start_time, end_time, interval),
+                    self._parse_timeline,
+                    start_time, end_time
+                )
             
-            # Build the search body with aggregations
-            search_body = {
-                "size": 0,  # We only want aggregation results
-                "query": query,
-                "aggs": {
-                    "threat_types": {
-                        "terms": {
-                            "field": "rule.groups",
-                            "size": 10
-                        }
-                    },
-                    "locations": {
-                        "terms": {
-                            "field": "agent.labels.location.set",
-                            "size": 10
+            results = []
+            if plan["queries"]:
+                body = []
+                for gte, lt in plan["queries"]:
+                    body.append({"index": self._index_for(gte.isoformat(), lt.isoformat()),
+                                 "ignore_unavailable": True})
+                    body.append(self._timeline_range_body(gte, lt, interval))
+                response = self.client.msearch(body=body)
+                for part_response in response["responses"]:
+                    if "error" in part_response:
+                        raise RequestError(400, str(part_response["error"]), part_response)
+                    results.append(self._parse_timeline_buckets(part_response))
+            
+            return self.timeline.merge(plan, results)
+        except Exception as e:
+            logger.error(f"Error getting alerts timeline: {str(e)}")
+            if plan is not None and plan["cached"] and self._allow_stale():
+                # Closed buckets are still valid; only the open ones are missing
+                logger.warning("Serving stored timeline buckets after OpenSearch failure")
+                return self._stale_timeline(plan)
+            return {"error": str(e)}
+    
+    def _stale_timeline(self, plan):
+        """The stored (closed) buckets of a timeline plan, each marked stale"""
+        return [dict(point, stale=True) for point in self.timeline.merge(plan, [])]
+    
+    def _timeline_body(self, start_time, end_time, interval):
+        return {
+            "size": 0,
+            "query": {"bool": {"filter": [{"range": {"@timestamp": {"gte": start_time, "lte": end_time}}}]}},
+            "aggs": {
+                "alerts_over_time": {
+                    "date_histogram": {"field": "@timestamp", "interval": interval},
+                    "aggs": {
+                        "severity": {
+                            "range": {
+                                "field": "rule.level",
+                                "ranges": [
+                                    {"to": 1, "key": "none"},
+                                    {"from": 1, "to": 7, "key": "low"},
+                                    {"from": 7, "to": 12, "key": "medium"},
+                                    {"from": 12, "to": 15, "key": "high"},
+                                    {"from": 15, "key": "critical"}
+                                ]
+                            }
                         }
                     }
                 }
             }
-            
-            # Execute the search
-            response = self.client.search(
-                body=search_body,
-                index=self.index_pattern
+        }
+    
+    def _timeline_range_body(self, gte, lt, interval):
+        """Histogram over whole buckets [gte, lt), including empty ones"""
+        body = self._timeline_body(gte.isoformat(), lt.isoformat(), interval)
+        body["query"]["bool"]["filter"][0]["range"]["@timestamp"] = {
+            "gte": gte.isoformat(),
+            "lt": lt.isoformat()
+        }
+        step = _interval_seconds(interval)
+        epoch = datetime.datetime(1970, 1, 1)
+        body["aggs"]["alerts_over_time"]["date_histogram"].update({
+            "min_doc_count": 0,
+            "extended_bounds": {
+                "min": int((gte - epoch).total_seconds()) * 1000,
+                "max": (int((lt - epoch).total_seconds()) - step) * 1000
+            }
+        })
+        return body
+    
+    def _parse_timeline_buckets(self, response):
+        """Return (bucket start in epoch seconds, data point) pairs"""
+        buckets = []
+        if 'aggregations' in response and 'alerts_over_time' in response['aggregations']:
+            for bucket in response['aggregations']['alerts_over_time']['buckets']:
+                data_point = {'timestamp': bucket['key_as_string'], 'total': bucket['doc_count']}
+                for severity in bucket['severity']['buckets']:
+                    data_point[severity['key']] = severity['doc_count']
+                buckets.append((int(bucket['key']) // 1000, data_point))
+        return buckets
+    
+    def _parse_timeline(self, response):
+        return [data_point for _, data_point in self._parse_timeline_buckets(response)]
+    
+    @_instrumented
+    def get_top_rules(self, start_time, end_time, size=10):
+        """Get the most frequently triggered rules with description and level"""
+        if not self.client:
+            if not self._connect():
+                return {"error": "Failed to connect to OpenSearch"}
+        
+        try:
+            start_time, end_time = self.cache.round_range(start_time, end_time)
+            return self._cached_search(
+                "top_rules",
+                self._top_rules_body(start_time, end_time, size),
+                self._parse_top_rules,
+                start_time, end_time
             )
-            
-            # Process threat types
-            threat_type_buckets = response['aggregations']['threat_types']['buckets']
-            threat_types = []
-            
-            for bucket in threat_type_buckets:
-                threat_types.append({
-                    "name": bucket['key'],
-                    "count": bucket['doc_count']
+        except Exception as e:
+            logger.error(f"Error getting top rules: {str(e)}")
+            return {"error": str(e)}
+    
+    def _top_rules_body(self, start_time, end_time, size):
+        rule_terms = {"terms": {"field": "rule.id", "size": size}}
+        if not get_rule_catalog().loaded:
+            # One projected hit gives description and level without two more terms aggs
+            rule_terms["aggs"] = {"metadata": self._metadata_agg(TERM_DIMENSIONS["rules"]["metadata"])}
+        return {
+            "size": 0,
+            "query": {"bool": {"filter": [{"range": {"@timestamp": {"gte": start_time, "lte": end_time}}}]}},
+            "aggs": {"rule_id": rule_terms}
+        }
+    
+    def _parse_top_rules(self, response):
+        top_rules_data = []
+        if 'aggregations' in response and 'rule_id' in response['aggregations']:
+            buckets = response['aggregations']['rule_id']['buckets']
+            catalog = self._rule_catalog_entries(bucket['key'] for bucket in buckets)
+            for bucket in buckets:
+                rule = catalog.get(str(bucket['key'])) or self._bucket_metadata(bucket).get('rule', {})
+                top_rules_data.append({
+                    'rule_id': bucket['key'],
+                    'description': rule.get('description') or "N/A",
+                    'level': rule.get('level') or 0,
+                    'count': bucket['doc_count']
                 })
-            
-            # Process locations
-            location_buckets = response['aggregations']['locations']['buckets']
-            locations = []
-            
-            for bucket in location_buckets:
+        return top_rules_data
+    
+    def _rule_catalog_entries(self, rule_ids):
+        """Rule description/level/MITRE from the Wazuh rule catalog; {} if it is unavailable"""
+        try:
+            return get_rule_catalog().lookup_many(rule_ids)
+        except Exception as e:
+            logger.warning(f"Rule catalog lookup failed: {str(e)}")
+            return {}
+    
+    def _metadata_agg(self, fields):
+        """top_hits returning the listed fields of the latest alert in a bucket"""
+        return {
+            "top_hits": {
+                "size": 1,
+                "sort": [{"@timestamp": {"order": "desc"}}],
+                "_source": {"includes": fields}
+            }
+        }
+    
+    def _bucket_metadata(self, bucket):
+        hits = bucket.get('metadata', {}).get('hits', {}).get('hits', [])
+        return hits[0].get('_source', {}) if hits else {}
+    
+    @_instrumented
+    def get_term_page(self, dimension, start_time, end_time, page_size=100, cursor=None,
+                      min_level=None, approximate_total=False):
+        """
+        Page through every value of a TERM_DIMENSIONS field with a composite
+        aggregation.
+
+        Pages are in key order with exact per-key counts and the dimension's
+        metadata from the latest alert. cursor is the opaque "next" value of
+        the previous page. min_level restricts to alerts at or above a rule
+        level. approximate_total adds a cardinality estimate of the number of
+        distinct keys.
+
+        Returns {"items", "next", "total_approx"}.
+        """
+        if not self.client:
+            if not self._connect():
+                return {"error": "Failed to connect to OpenSearch"}
+        
+        if dimension not in TERM_DIMENSIONS:
+            return {"error": f"Unknown dimension: {dimension}"}
+        
+        try:
+            after_key = decode_cursor(cursor)
+        except ValueError as e:
+            return {"error": str(e)}
+        
+        try:
+            start_time, end_time = self.cache.round_range(start_time, end_time)
+            return self._cached_search(
+                "term_page",
+                self._term_page_body(dimension, start_time, end_time, page_size,
+                                     after_key, min_level, approximate_total),
+                functools.partial(self._parse_term_page, page_size=page_size, dimension=dimension),
+                start_time, end_time
+            )
+        except Exception as e:
+            logger.error(f"Error paging {dimension}: {str(e)}")
+            return {"error": str(e)}
+    
+    def _term_page_body(self, dimension, start_time, end_time, page_size, after_key=None,
+                        min_level=None, approximate_total=False):
+        spec = TERM_DIMENSIONS[dimension]
+        filters = [{"range": {"@timestamp": {"gte": start_time, "lte": end_time}}}]
+        if min_level is not None:
+            filters.append({"range": {"rule.level": {"gte": min_level}}})
+        
+        composite = {
+            "size": page_size,
+            "sources": [{"key": {"terms": {"field": spec["field"]}}}]
+        }
+        if after_key:
+            composite["after"] = after_key
+        
+        page_agg = {"composite": composite}
+        # Rule metadata comes from the Wazuh rule catalog once it is loaded
+        if spec["metadata"] and not (dimension == "rules" and get_rule_catalog().loaded):
+            page_agg["aggs"] = {"metadata": self._metadata_agg(spec["metadata"])}
+        
+        body = {
+            "size": 0,
+            "query": {"bool": {"filter": filters}},
+            "aggs": {"page": page_agg}
+        }
+        # Only the first page needs the estimate
+        if approximate_total and not after_key:
+            body["aggs"]["total_approx"] = {"cardinality": {"field": spec["field"]}}
+        return body
+    
+    def _parse_term_page(self, response, page_size, dimension=None):
+        aggregations = response.get('aggregations', {})
+        page = aggregations.get('page', {})
+        buckets = page.get('buckets', [])
+        catalog = {}
+        if dimension == "rules":
+            catalog = self._rule_catalog_entries(bucket['key']['key'] for bucket in buckets)
+        
+        items = []
+        for bucket in buckets:
+            item = {
+                'key': bucket['key']['key'],
+                'count': bucket['doc_count']
+            }
+            rule = catalog.get(str(item['key']))
+            metadata = {'rule': rule} if rule else self._bucket_metadata(bucket)
+            if metadata:
+                item['metadata'] = metadata
+            items.append(item)
+        
+        return {
+            'items': items,
+            # A short page is the last one
+            'next': encode_cursor(page.get('after_key')) if len(items) >= page_size else None,
+            'total_approx': aggregations.get('total_approx', {}).get('value')
+        }
+    
+    @_instrumented
+    def get_alert_locations(self, start_time, end_time, size=100):
+        """Get alert counts grouped by agent location label"""
+        if not self.client:
+            if not self._connect():
+                return {"error": "Failed to connect to OpenSearch"}
+        
+        try:
+            start_time, end_time = self.cache.round_range(start_time, end_time)
+            return self._cached_search(
+                "locations",
+                self._locations_body(start_time, end_time, size),
+                self._parse_locations,
+                start_time, end_time
+            )
+        except Exception as e:
+            logger.error(f"Error getting alert locations: {str(e)}")
+            return {"error": str(e)}
+    
+    def _locations_body(self, start_time, end_time, size):
+        return {
+            "size": 0,
+            "query": {
+                "bool": {
+                    "filter": [
+                        {"range": {"@timestamp": {"gte": start_time, "lte": end_time}}}
+                    ]
+                }
+            },
+            "aggs": {
+                "locations": {
+                    "terms": {
+                        "field": "agent.labels.location.set",
+                        "size": size
+                    }
+                }
+            }
+        }
+    
+    def _parse_locations(self, response):
+        locations = []
+        if 'aggregations' in response and 'locations' in response['aggregations']:
+            for bucket in response['aggregations']['locations']['buckets']:
                 locations.append({
-                    "name": bucket['key'],
-                    "count": bucket['doc_count']
+                    'name': bucket['key'],
+                    'count': bucket['doc_count']
                 })
+        return locations
+    
+    @_instrumented
+    def get_dashboard_snapshot(self, start_time, end_time, interval="1h",
+                               threat_start_time=None, threat_end_time=None):
+        """
+        Run every dashboard query in one _msearch round trip.
+
+        Returns a dict with alert_counts, recent_alerts, timeline, top_rules
+        and locations. A part that fails on the cluster is returned as an
+        {"error": ...} dict so the rest of the dashboard still renders.
+        Parts still fresh in the aggregation cache are not sent.
+        """
+        if not self.client:
+            if not self._connect():
+                return {"error": "Failed to connect to OpenSearch"}
+        
+        start_time, end_time = self.cache.round_range(start_time, end_time)
+        threat_start_time, threat_end_time = self.cache.round_range(
+            threat_start_time or start_time, threat_end_time or end_time)
+        
+        recent_body = {
+            "query": self._build_alert_query(start_time=start_time, end_time=end_time),
+            "size": 10,
+            "sort": [{"@timestamp": {"order": "desc"}}],
+            "_source": self._source_filter("summary")
+        }
+        
+        index = self._index_for(start_time, end_time)
+        threat_index = self._index_for(threat_start_time, threat_end_time)
+        parts = [
+            ("alert_counts", index, self._alert_count_body(start_time, end_time), self._parse_alert_counts),
+            ("recent_alerts", index, recent_body, self._format_hits),
+            ("top_rules", index, self._top_rules_body(start_time, end_time, 10), self._parse_top_rules),
+            ("locations", threat_index, self._locations_body(threat_start_time, threat_end_time, 100), self._parse_locations)
+        ]
+        
+        # Closed timeline buckets come from the timeline store; only the open
+        # bucket and any gaps ride along in the same _msearch
+        timeline_plan = self.timeline.plan(self.index_pattern, start_time, end_time, interval)
+        if timeline_plan is None:
+            parts.append(("timeline", index, self._timeline_body(start_time, end_time, interval), self._parse_timeline))
+        else:
+            for i, (gte, lt) in enumerate(timeline_plan["queries"]):
+                parts.append((f"timeline:{i}", self._index_for(gte.isoformat(), lt.isoformat()),
+                              self._timeline_range_body(gte, lt, interval), self._parse_timeline_buckets))
+        
+        # Timeline range parts have no fixed shape; their closed buckets are the fallback
+        part_ranges = {name: (start_time, end_time)
+                       for name in ("alert_counts", "recent_alerts", "top_rules", "timeline")}
+        part_ranges["locations"] = (threat_start_time, threat_end_time)
+        
+        snapshot = {}
+        missing = []
+        relative_keys = {}
+        for name, part_index, search_body, parse in parts:
+            key = self.cache.make_key(name, {"index": part_index, "body": search_body})
+            if name in part_ranges:
+                relative_keys[key] = self.cache.relative_key(name, search_body, *part_ranges[name])
+            cached = self.cache.get(key) if Config.OPENSEARCH_CACHE_ENABLED else None
+            if cached is not None:
+                snapshot[name] = cached
+            else:
+                missing.append((name, key, part_index, search_body, parse))
+        
+        def load():
+            body = []
+            for _, _, part_index, search_body, _ in missing:
+                body.append({"index": part_index, "ignore_unavailable": True})
+                body.append(search_body)
             
-            return {
-                "threat_types": threat_types,
-                "locations": locations
-            }
+            response = self.client.msearch(body=body)
             
-        except Exception as e:
-            logger.error(f"Error getting high severity threats by type: {str(e)}")
-            return {"error": str(e)}
+            loaded = {}
+            for (name, _, _, _, parse), part_response in zip(missing, response["responses"]):
+                if "error" in part_response:
+                    logger.error(f"Dashboard query '{name}' failed: {part_response['error']}")
+                    loaded[name] = {"error": str(part_response["error"])}
+                    continue
+                try:
+                    loaded[name] = parse(part_response)
+                except Exception as e:
+                    logger.error(f"Error parsing dashboard query '{name}': {str(e)}")
+                    loaded[name] = {"error": str(e)}
+            return loaded
+        
+        allow_stale = self._allow_stale()
+        if missing:
+            try:
+                # Identical concurrent snapshots share one _msearch
+                batch_key = "msearch:" + "|".join(key for _, key, _, _, _ in missing)
+                loaded = self.cache.get_or_load(batch_key, load, None, store=False)
+            except Exception as e:
+                logger.error(f"Error running dashboard multi-search: {str(e)}")
+                if not allow_stale or not any(self.cache.has_stale(key) or
+                                              self.cache.has_last_good(relative_keys.get(key))
+                                              for _, key, _, _, _ in missing):
+                    return {"error": str(e)}
+                loaded = {name: {"error": str(e)} for name, _, _, _, _ in missing}
+            
+            for name, key, _, _, _ in missing:
+                result = loaded[name]
+                if isinstance(result, dict) and "error" in result:
+                    # Keep the dashboard rendering from older data during an outage
+                    stale = self.cache.get_fallback(key, relative_keys.get(key)) if allow_stale else None
+                    if stale is not None:
+                        logger.warning(f"Serving stale dashboard part '{name}'")
+                        result = stale
+                else:
+                    self.cache.set(key, result, CACHE_TTLS.get(name), relative_keys.get(key))
+                snapshot[name] = result
+        
+        if timeline_plan is not None:
+            results = [snapshot.pop(f"timeline:{i}") for i in range(len(timeline_plan["queries"]))]
+            errors = [result for result in results if isinstance(result, dict)]
+            if not errors:
+                snapshot["timeline"] = self.timeline.merge(timeline_plan, results)
+            elif allow_stale and timeline_plan["cached"]:
+                # Closed buckets are still valid; only the open ones are missing
+                snapshot["timeline"] = self._stale_timeline(timeline_plan)
+            else:
+                snapshot["timeline"] = errors[0]
+        
+        return {name: snapshot[name]
+                for name in ("alert_counts", "recent_alerts", "timeline", "top_rules", "locations")}
     
+    def _format_hits(self, response):
+        """Format search hits the way search_alerts returns them"""
+        results = []
+        for hit in response["hits"]["hits"]:
+            results.append({
+                "id": hit["_id"],
+                "index": hit["_index"],
+                "score": hit["_score"],
+                "source": hit["_source"]
+            })
+        return results
+    
+    @_instrumented
     def get_index_stats(self):
         """Get statistics for the configured index pattern"""
         if not self.client:
@@ -534,3 +2459,31 @@ class OpenSearchAPI:
         except Exception as e:
             logger.error(f"Error getting index stats: {str(e)}")
             return {"error": str(e)}
+
+
+class AsyncOpenSearchAPI:
+    """
+    asyncio variant of OpenSearchAPI with the same method surface.
+
+    Each public method is a coroutine that runs the sync method on the
+    shared fan-out pool and shared client, so asyncio.gather() overlaps
+    cluster calls. iter_alerts stays a plain generator.
+    """
+
+    def __init__(self, api=None):
+        self._api = api or OpenSearchAPI()
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if name.startswith('_') or name == 'iter_alerts' or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(
+                _get_fanout_executor(),
+                functools.partial(context.run, attr, *args, **kwargs)
+            )
+        return call
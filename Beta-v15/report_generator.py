@@ -2,10 +2,13 @@ import os
 import logging
 import json
 import datetime
+import functools
 from jinja2 import Environment, FileSystemLoader
 from io import BytesIO
 from flask import render_template_string
-from opensearch_api import OpenSearchAPI
+from opensearch_api import OpenSearchAPI, run_concurrently
+from alert_record import enrich_rules, normalize_alerts
+from wazuh_api import get_rule_catalog
 from config import Config
 
 logger = logging.getLogger(__name__)
@@ -60,18 +63,31 @@ class ReportGenerator:
 
             logger.info(f"Report severity levels: {severity_levels}")
 
-            # Use provided alerts_data if available, otherwise fetch fresh data
+            # Fetch the severity counts, and the alerts unless they were provided,
+            # concurrently
+            calls = {
+                "counts": functools.partial(
+                    self.opensearch.get_alert_count_by_severity,
+                    start_time=start_time,
+                    end_time=end_time
+                )
+            }
             if alerts_data is None:
-                # Fetch alerts from OpenSearch
-                logger.info("Fetching alerts from OpenSearch...")
-                alerts_data = self.opensearch.search_alerts(
+                logger.info("Fetching alerts and alert counts by severity from OpenSearch...")
+                calls["alerts"] = functools.partial(
+                    self.opensearch.search_alerts,
                     severity_levels=severity_levels,
                     start_time=start_time,
                     end_time=end_time,
-                    limit=1000  # Increase limit for reports
+                    limit=1000,  # Increase limit for reports
+                    projection="export"
                 )
             else:
                 logger.info(f"Using provided alerts_data with {len(alerts_data.get('results', []))} alerts")
+            
+            fetched = run_concurrently(calls)
+            alerts_data = fetched.get("alerts", alerts_data)
+            alert_counts = fetched["counts"]
 
 
             if 'error' in alerts_data:
@@ -80,13 +96,6 @@ class ReportGenerator:
 
             logger.info(f"Fetched {alerts_data.get('total', 0)} alerts")
 
-            # Get alert count by severity
-            logger.info("Getting alert counts by severity...")
-            alert_counts = self.opensearch.get_alert_count_by_severity(
-                start_time=start_time,
-                end_time=end_time
-            )
-
             logger.info(f"Alert counts: {alert_counts}")
         except Exception as e:
             logger.error(f"Error during data fetching for report: {str(e)}")
@@ -103,16 +112,24 @@ class ReportGenerator:
 
         # Convert alert timestamps to Pakistan time
         pkt_alerts = []
-        for alert in alerts_data.get('results', []):
+        results = alerts_data.get('results', [])
+        records = enrich_rules(normalize_alerts(results), get_rule_catalog())
+        for alert, record in zip(results, records):
             alert_copy = alert.copy()
             if 'source' in alert_copy and '@timestamp' in alert_copy['source']:
-                try:
-                    utc_time = datetime.datetime.fromisoformat(alert_copy['source']['@timestamp'].replace('Z', '+00:00'))
-                    pkt_time = utc_time + datetime.timedelta(hours=timezone_offset)
-                    alert_copy['source']['@timestamp'] = pkt_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-                    alert_copy['source']['@timestamp_display'] = pkt_time.strftime('%Y-%m-%d %H:%M:%S PKT')
-                except:
-                    alert_copy['source']['@timestamp_display'] = alert_copy['source'].get('@timestamp', 'N/A')
+                # Copy the source too so the caller's alerts keep their UTC times
+                source = dict(alert_copy['source'])
+                if record.timestamp is not None:
+                    source['@timestamp'] = record.format_timestamp('%Y-%m-%dT%H:%M:%S.%fZ', timezone_offset)
+                source['@timestamp_display'] = record.format_timestamp('%Y-%m-%d %H:%M:%S PKT', timezone_offset)
+                # Description, level and MITRE IDs from the rule catalog where the alert lacks them
+                source['rule'] = {
+                    **source.get('rule', {}),
+                    'description': record.rule_description or 'N/A',
+                    'level': record.rule_level if record.rule_level is not None else 0,
+                    'mitre': {'id': record.mitre_ids}
+                }
+                alert_copy['source'] = source
             pkt_alerts.append(alert_copy)
 
         # Prepare data for the report
@@ -1,16 +1,92 @@
 import logging
 import os
 import json
+import threading
+import time
 import requests
 from datetime import datetime, timedelta
 from sqlalchemy import text
 from app import db
-from models import RetentionPolicy
-from opensearch_api import OpenSearchAPI
+from models import RetentionPolicy, SystemConfig
+from opensearch_api import OpenSearchAPI, get_index_resolver, get_timeline_store, parse_index_date
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# SystemConfig row announcing deletions to every process:
+# {"generation": n, "cutoff": ISO datetime before which data was deleted}
+RETENTION_GENERATION_KEY = 'retention_generation'
+
+_sync_lock = threading.Lock()
+_seen_generation = None
+_next_sync = 0
+
+
+def _read_generation():
+    value = SystemConfig.get_value(RETENTION_GENERATION_KEY)
+    if not value:
+        return {"generation": 0, "cutoff": None}
+    try:
+        return json.loads(value)
+    except ValueError:
+        return {"generation": 0, "cutoff": None}
+
+
+def _invalidate_local(cutoff):
+    # Deleted indices must no longer be resolved, and stored timeline
+    # buckets before the cutoff counted deleted alerts
+    get_index_resolver().invalidate()
+    get_timeline_store().invalidate(before=cutoff)
+
+
+def publish_retention_cutoff(cutoff):
+    """
+    Drop this process's cached index list and timeline buckets before
+    cutoff, and bump the shared generation so the other processes do the
+    same on their next sync_retention_invalidation.
+    """
+    global _seen_generation
+    _invalidate_local(cutoff)
+    try:
+        current = _read_generation()
+        if current.get("cutoff"):
+            cutoff = max(cutoff, datetime.fromisoformat(current["cutoff"]))
+        generation = current.get("generation", 0) + 1
+        SystemConfig.set_value(RETENTION_GENERATION_KEY,
+                               json.dumps({"generation": generation, "cutoff": cutoff.isoformat()}),
+                               "Bumped when retention deletes alert data")
+        with _sync_lock:
+            _seen_generation = generation
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Could not publish retention cutoff to other processes: {str(e)}")
+
+
+def sync_retention_invalidation():
+    """
+    Apply deletions announced by other processes to this process's caches.
+
+    Reads the shared generation at most every RETENTION_SYNC_SECONDS; call
+    inside an app context.
+    """
+    global _seen_generation, _next_sync
+    now = time.monotonic()
+    if now < _next_sync or not _sync_lock.acquire(blocking=False):
+        return
+    try:
+        _next_sync = now + Config.RETENTION_SYNC_SECONDS
+        current = _read_generation()
+        generation = current.get("generation", 0)
+        if _seen_generation is not None and generation != _seen_generation and current.get("cutoff"):
+            logger.info(f"Retention generation {generation}: dropping cached data before {current['cutoff']}")
+            _invalidate_local(datetime.fromisoformat(current["cutoff"]))
+        # A process starting up has nothing cached from before the deletion
+        _seen_generation = generation
+    except Exception as e:
+        logger.warning(f"Could not check retention generation: {str(e)}")
+    finally:
+        _sync_lock.release()
+
 class RetentionManager:
     def __init__(self):
         self.opensearch = OpenSearchAPI()
@@ -177,6 +253,10 @@ class RetentionManager:
             result['items_deleted'] = delete_response['deleted']
             result['details'] = delete_response
             
+            if delete_response['deleted']:
+                # Stored timeline buckets before the cutoff counted deleted alerts
+                publish_retention_cutoff(retention_date)
+            
             return result
         except Exception as e:
             logger.error(f"Error applying OpenSearch retention policy: {str(e)}")
@@ -286,20 +366,20 @@ class RetentionManager:
                         index_name = index_info['index']
                         
                         # Extract date from index name (format: wazuh-alerts-4.x-YYYY.MM.DD)
-                        try:
-                            date_part = index_name.split('-')[-3:]  # Get last 3 parts: YYYY.MM.DD
-                            if len(date_part) == 3:
-                                index_date_str = '.'.join(date_part)
-                                index_date = datetime.strptime(index_date_str, '%Y.%m.%d')
-                                
-                                if index_date < cutoff_date:
-                                    # Delete the old index
-                                    self.opensearch.client.indices.delete(index=index_name)
-                                    deleted_indices.append(index_name)
-                                    logger.info(f"Deleted old Wazuh index: {index_name}")
-                        except (ValueError, IndexError) as date_error:
-                            logger.warning(f"Could not parse date from index {index_name}: {date_error}")
+                        index_date = parse_index_date(index_name)
+                        if index_date is None:
+                            logger.warning(f"Could not parse date from index {index_name}")
                             continue
+                        
+                        if index_date < cutoff_date.date():
+                            # Delete the old index
+                            self.opensearch.client.indices.delete(index=index_name)
+                            deleted_indices.append(index_name)
+                            logger.info(f"Deleted old Wazuh index: {index_name}")
+                    
+                    if deleted_indices:
+                        # Deleted indices must no longer be resolved for queries
+                        publish_retention_cutoff(cutoff_date)
                     
                     if deleted_indices:
                         result['success'] = True
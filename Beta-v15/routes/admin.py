@@ -384,4 +384,148 @@ def ai_config():
     except Exception as e:
         logger.error(f"Error in AI configuration: {str(e)}")
         flash(f'Error loading AI configuration: {str(e)}', 'danger')
-        return redirect(url_for('dashboard.index'))
\ No newline at end of file
+        return redirect(url_for('dashboard.index'))
+
+@admin_bp.route('/api/opensearch/pool')
+@login_required
+def opensearch_pool_stats():
+    """
+    Return shared OpenSearch connection pool statistics for this worker process
+    """
+    try:
+        from opensearch_api import get_client_pool
+        return jsonify(get_client_pool().stats())
+    except Exception as e:
+        logger.error(f"Error getting OpenSearch pool stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/opensearch/cache', methods=['GET', 'DELETE'])
+@login_required
+def opensearch_cache_stats():
+    """
+    Return OpenSearch aggregation cache hit/miss counters and timeline store
+    size for this worker process. DELETE drops every cached entry.
+    """
+    try:
+        from opensearch_api import get_aggregation_cache, get_timeline_store
+        cache = get_aggregation_cache()
+        timeline = get_timeline_store()
+        if request.method == 'DELETE':
+            cache.clear()
+            timeline.invalidate()
+        stats = cache.stats()
+        stats['timeline'] = timeline.stats()
+        return jsonify(stats)
+    except Exception as e:
+        logger.error(f"Error getting OpenSearch cache stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/opensearch/metrics', methods=['GET', 'DELETE'])
+@login_required
+def opensearch_query_metrics():
+    """
+    Return OpenSearch call latency histograms and the slow-query log for this
+    worker process. DELETE resets them.
+    """
+    try:
+        from opensearch_api import get_query_metrics
+        metrics = get_query_metrics()
+        if request.method == 'DELETE':
+            metrics.reset()
+        return jsonify(metrics.snapshot())
+    except Exception as e:
+        logger.error(f"Error getting OpenSearch query metrics: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/wazuh/client')
+@login_required
+def wazuh_client_stats():
+    """
+    Return shared Wazuh API session, token cache, agent inventory and rule
+    catalog statistics for this worker process
+    """
+    try:
+        from wazuh_api import get_wazuh_client, get_agent_inventory, get_rule_catalog
+        stats = get_wazuh_client().stats()
+        stats['agent_inventory'] = get_agent_inventory().stats()
+        stats['rule_catalog'] = get_rule_catalog().stats()
+        return jsonify(stats)
+    except Exception as e:
+        logger.error(f"Error getting Wazuh client stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/alerts/dedup')
+@login_required
+def alert_dedup_stats():
+    """
+    Return sent alert deduplication counters, the in-memory cache's size
+    and false positive rates for this worker process, and the dedup tables'
+    sizes and last pruning run
+    """
+    try:
+        from alert_dedup import get_alert_deduplicator
+        deduplicator = get_alert_deduplicator()
+        stats = deduplicator.stats()
+        stats['tables'] = deduplicator.table_stats()
+        return jsonify(stats)
+    except Exception as e:
+        logger.error(f"Error getting alert dedup stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/mail/queue')
+@login_required
+def mail_queue_stats():
+    """
+    Return outbox depth by status, the most recent dead-lettered emails, and
+    this worker's send counters and SMTP pool statistics
+    """
+    try:
+        from mail_sender import get_mail_outbox
+        from models import OutboundEmail
+        stats = get_mail_outbox().stats()
+        dead = OutboundEmail.query.filter_by(status='dead').order_by(
+            OutboundEmail.created_at.desc()).limit(request.args.get('limit', 50, type=int)).all()
+        stats['dead_letters'] = [message.to_dict() for message in dead]
+        return jsonify(stats)
+    except Exception as e:
+        logger.error(f"Error getting mail queue stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/mail/queue/replay', methods=['POST'])
+@login_required
+def replay_mail_queue():
+    """
+    Requeue dead-lettered emails: the ids given as {"ids": [...]}, or all of
+    them if no ids are given
+    """
+    try:
+        from mail_sender import get_mail_outbox
+        ids = (request.get_json(silent=True) or {}).get('ids')
+        if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+            return jsonify({'error': 'ids must be a list of integers'}), 400
+        replayed = get_mail_outbox().replay(ids)
+        logger.info(f"{current_user.username} replayed {replayed} dead-lettered emails")
+        return jsonify({'replayed': replayed})
+    except Exception as e:
+        logger.error(f"Error replaying mail queue: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/scheduler/leader')
+@login_required
+def scheduler_leader():
+    """
+    Return which process holds the background job lease and whether this
+    worker is it
+    """
+    try:
+        from leader_election import get_leader_lease
+        from models import SchedulerLease
+        lease = get_leader_lease()
+        row = db.session.get(SchedulerLease, lease.name)
+        stats = lease.stats()
+        stats['current_holder'] = row.holder if row else None
+        stats['expires_at'] = row.expires_at.isoformat() if row else None
+        return jsonify(stats)
+    except Exception as e:
+        logger.error(f"Error getting scheduler lease: {str(e)}")
+        return jsonify({'error': str(e)}), 500
@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 import logging
 from datetime import datetime, timedelta
 import json
+from alert_record import normalize_alerts
 
 logger = logging.getLogger(__name__)
 
@@ -81,6 +82,7 @@ def get_alerts():
         search_query = request.args.get('search_query')
         if search_query:
             additional_filters['search_query'] = search_query  # Use search_query key for multi-field search
+            additional_filters['search_mode'] = request.args.get('search_mode')
 
         rule_id = request.args.get('rule_id')
         if rule_id:
@@ -366,12 +368,12 @@ def debug_alert(alert_id):
         if 'results' in alerts_data:
             debug_info['recent_alerts'] = [
                 {
-                    'timestamp': a.get('source', {}).get('@timestamp'),
-                    'rule_id': a.get('source', {}).get('rule', {}).get('id'),
-                    'agent_ip': a.get('source', {}).get('agent', {}).get('ip'),
-                    'level': a.get('source', {}).get('rule', {}).get('level')
+                    'timestamp': a.timestamp_raw,
+                    'rule_id': a.rule_id,
+                    'agent_ip': a.agent_ip,
+                    'level': a.rule_level
                 }
-                for a in alerts_data['results'][:5]
+                for a in normalize_alerts(alerts_data['results'][:5])
             ]
 
         # Check recent sent alerts
@@ -405,8 +407,8 @@ def manual_alert_check():
 
         import scheduler
 
-        # Run alert checking manually
-        scheduler.check_alerts()
+        # Run alert checking manually, including configs not scheduled now
+        scheduler.check_and_send_alerts(ignore_schedule=True)
 
         return jsonify({
             "message": "Manual alert check completed successfully",
@@ -422,8 +424,7 @@ def manual_alert_check():
 def export_alerts():
     """Export alerts in CSV, XLSX, or PDF format"""
     try:
-        import csv
-        import io
+        import itertools
         from flask import make_response
         from opensearch_api import OpenSearchAPI
 
@@ -460,12 +461,15 @@ def export_alerts():
 
         # Get export format
         export_format = request.args.get('format', 'csv').lower()
+        if export_format not in ('csv', 'xlsx', 'pdf'):
+            return jsonify({'error': 'Unsupported format'}), 400
 
         # Additional filters
         additional_filters = {}
         search_query = request.args.get('search_query')
         if search_query:
             additional_filters['search_query'] = search_query # Use search_query for consistency with search_alerts
+            additional_filters['search_mode'] = request.args.get('search_mode')
 
         rule_id = request.args.get('rule_id')
         if rule_id:
@@ -476,7 +480,29 @@ def export_alerts():
         if fim_alerts == 'true':
             additional_filters['rule.id'] = ['553', '554']
 
-        # Get all alerts for export (no pagination limit)
+        if export_format in ('csv', 'xlsx'):
+            # Stream every matching alert with point-in-time paging instead of
+            # a single 10k from/size page
+            alerts_iter = opensearch.iter_alerts(
+                severity_levels=severity_levels,
+                start_time=start_time,
+                end_time=end_time,
+                sort_order='desc',
+                additional_filters=additional_filters,
+                projection='export'
+            )
+
+            first_alert = next(alerts_iter, None)
+            if first_alert is None:
+                return jsonify({'error': 'No alerts found'}), 404
+
+            alerts_data = itertools.chain([first_alert], alerts_iter)
+
+            if export_format == 'csv':
+                return export_alerts_csv(alerts_data)
+            return export_alerts_xlsx(alerts_data)
+
+        # PDF exports render every row, so they stay a single bounded page
         results = opensearch.search_alerts(
             severity_levels=severity_levels,
             start_time=start_time,
@@ -485,100 +511,89 @@ def export_alerts():
             offset=0,
             sort_field='@timestamp',
             sort_order='desc',
-            additional_filters=additional_filters
+            additional_filters=additional_filters,
+            projection='export'
         )
 
         if 'results' not in results or not results['results']:
             return jsonify({'error': 'No alerts found'}), 404
 
-        alerts_data = results['results']
-
-        if export_format == 'csv':
-            return export_alerts_csv(alerts_data)
-        elif export_format == 'xlsx':
-            return export_alerts_xlsx(alerts_data)
-        elif export_format == 'pdf':
-            from report_generator import ReportGenerator
-            generator = ReportGenerator()
-            
-            # Prepare config-like object for ReportGenerator
-            report_config = {
-                'severity_levels': severity_levels
-            }
-            
-            pdf_file = generator.generate_report(
-                report_config=report_config,
-                start_time=start_time,
-                end_time=end_time,
-                format='pdf',
-                alerts_data=results
-            )
-            
-            if pdf_file:
-                response = make_response(pdf_file.getvalue())
-                response.headers['Content-Type'] = 'application/pdf'
-                response.headers['Content-Disposition'] = f'attachment; filename=alerts_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-                return response
-            else:
-                return jsonify({'error': 'Failed to generate PDF report'}), 500
+        from report_generator import ReportGenerator
+        generator = ReportGenerator()
+        
+        # Prepare config-like object for ReportGenerator
+        report_config = {
+            'severity_levels': severity_levels
+        }
+        
+        pdf_file = generator.generate_report(
+            report_config=report_config,
+            start_time=start_time,
+            end_time=end_time,
+            format='pdf',
+            alerts_data=results
+        )
+        
+        if pdf_file:
+            response = make_response(pdf_file.getvalue())
+            response.headers['Content-Type'] = 'application/pdf'
+            response.headers['Content-Disposition'] = f'attachment; filename=alerts_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+            return response
         else:
-            return jsonify({'error': 'Unsupported format'}), 400
+            return jsonify({'error': 'Failed to generate PDF report'}), 500
 
     except Exception as e:
         logger.error(f"Error exporting alerts: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def _export_row(record):
+    """CSV/Excel columns for one alert"""
+    return [
+        record.format_timestamp(),
+        record.agent_name or 'N/A',
+        record.agent_id or 'N/A',
+        record.agent_ip or 'N/A',
+        record.rule_id or 'N/A',
+        record.rule_description or 'N/A',
+        record.rule_level if record.rule_level is not None else 'N/A',
+        record.location or 'N/A'
+    ]
+
 def export_alerts_csv(alerts_data):
-    """Export alerts as CSV"""
+    """Export alerts as CSV, streaming rows as they are read from OpenSearch"""
     import csv
     import io
-    from flask import make_response
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    # Write header
-    writer.writerow([
-        'Timestamp',
-        'Agent Name',
-        'Agent ID', 
-        'Agent IP',
-        'Rule ID',
-        'Rule Description',
-        'Severity Level',
-        'Location'
-    ])
-
-    # Write data
-    for alert in alerts_data:
-        source = alert.get('source', {})
-        timestamp = source.get('@timestamp', 'N/A')
-        agent = source.get('agent', {})
-        rule = source.get('rule', {})
-
-        # Format timestamp
-        try:
-            if timestamp != 'N/A':
-                formatted_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M:%S')
-            else:
-                formatted_time = 'N/A'
-        except:
-            formatted_time = timestamp
+    from flask import Response, stream_with_context
 
+    def generate():
+        output = io.StringIO()
+        writer = csv.writer(output)
+
+        # Write header
         writer.writerow([
-            formatted_time,
-            agent.get('name', 'N/A'),
-            agent.get('id', 'N/A'),
-            agent.get('ip', 'N/A'),
-            rule.get('id', 'N/A'),
-            rule.get('description', 'N/A'),
-            rule.get('level', 'N/A'),
-            agent.get('labels', {}).get('location', {}).get('set', 'N/A')
+            'Timestamp',
+            'Agent Name',
+            'Agent ID', 
+            'Agent IP',
+            'Rule ID',
+            'Rule Description',
+            'Severity Level',
+            'Location'
         ])
 
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
+        # Write data
+        for row_count, record in enumerate(normalize_alerts(alerts_data), 1):
+            writer.writerow(_export_row(record))
+
+            # Flush in chunks so the response never holds the whole export
+            if row_count % 500 == 0:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate(0)
+
+        yield output.getvalue()
+
+    response = Response(stream_with_context(generate()), mimetype='text/csv')
     response.headers['Content-Disposition'] = f'attachment; filename=alerts_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
     return response
 
@@ -610,33 +625,8 @@ def export_alerts_xlsx(alerts_data):
             cell.fill = header_fill
 
         # Write data
-        for row_idx, alert in enumerate(alerts_data, 2):
-            source = alert.get('source', {})
-            timestamp = source.get('@timestamp', 'N/A')
-            agent = source.get('agent', {})
-            rule = source.get('rule', {})
-
-            # Format timestamp
-            try:
-                if timestamp != 'N/A':
-                    formatted_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M:%S')
-                else:
-                    formatted_time = 'N/A'
-            except:
-                formatted_time = timestamp
-
-            row_data = [
-                formatted_time,
-                agent.get('name', 'N/A'),
-                agent.get('id', 'N/A'),
-                agent.get('ip', 'N/A'),
-                rule.get('id', 'N/A'),
-                rule.get('description', 'N/A'),
-                rule.get('level', 'N/A'),
-                agent.get('labels', {}).get('location', {}).get('set', 'N/A')
-            ]
-
-            for col, value in enumerate(row_data, 1):
+        for row_idx, record in enumerate(normalize_alerts(alerts_data), 2):
+            for col, value in enumerate(_export_row(record), 1):
                 ws.cell(row=row_idx, column=col, value=value)
 
         # Auto-fit columns
@@ -706,32 +696,22 @@ def export_alerts_pdf(alerts_data):
         # Prepare table data
         table_data = [['Timestamp', 'Agent', 'Rule ID', 'Description', 'Level']]
 
-        for alert in alerts_data[:100]:  # Limit to first 100 for PDF
-            source = alert.get('source', {})
-            timestamp = source.get('@timestamp', 'N/A')
-            agent = source.get('agent', {})
-            rule = source.get('rule', {})
-
-            # Format timestamp
-            try:
-                if timestamp != 'N/A':
-                    formatted_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00')).strftime('%m/%d %H:%M')
-                else:
-                    formatted_time = 'N/A'
-            except:
-                formatted_time = timestamp[:10] if len(timestamp) > 10 else timestamp
+        for record in normalize_alerts(alerts_data[:100]):  # Limit to first 100 for PDF
+            formatted_time = record.format_timestamp('%m/%d %H:%M')
+            if record.timestamp is None:
+                formatted_time = formatted_time[:10]
 
             # Truncate long descriptions
-            description = rule.get('description', 'N/A')
+            description = record.rule_description or 'N/A'
             if len(description) > 40:
                 description = description[:37] + '...'
 
             table_data.append([
                 formatted_time,
-                agent.get('name', 'N/A')[:15],
-                str(rule.get('id', 'N/A')),
+                (record.agent_name or 'N/A')[:15],
+                str(record.rule_id or 'N/A'),
                 description,
-                str(rule.get('level', 'N/A'))
+                str(record.rule_level if record.rule_level is not None else 'N/A')
             ])
 
         # Create table
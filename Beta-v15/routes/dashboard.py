@@ -1,34 +1,83 @@
 from flask import Blueprint, render_template, jsonify, request, flash, current_app
 from flask_login import login_required, current_user
 import logging
+import functools
 from datetime import datetime, timedelta
-from opensearch_api import OpenSearchAPI
-from wazuh_api import WazuhAPI
+from opensearch_api import OpenSearchAPI, run_concurrently
+from wazuh_api import get_agent_inventory
 
 logger = logging.getLogger(__name__)
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+def _agent_stats(counts):
+    """Agent status counters for the dashboard cards; zeros when Wazuh is unreachable"""
+    if 'error' in counts:
+        return {'total': 0, 'active': 0, 'disconnected': 0, 'never_connected': 0}
+    return counts
+
 @dashboard_bp.route('/dashboard')
 @login_required
 def index():
     return render_template('dashboard.html')
 
+@dashboard_bp.route('/api/dashboard/snapshot')
+@login_required
+def dashboard_snapshot():
+    """Get every dashboard panel in one response backed by a single _msearch"""
+    try:
+        opensearch = OpenSearchAPI()
+        
+        days = int(request.args.get('days', 1))
+        now = datetime.utcnow()
+        end_time = now.isoformat()
+        start_time = (now - timedelta(days=days)).isoformat()
+        interval = '1h' if days <= 7 else '1d'
+        # Threat analysis always covers the last 24 hours
+        threat_start_time = (now - timedelta(days=1)).isoformat()
+        
+        # The cluster snapshot and the Wazuh agent listing run side by side
+        fetched = run_concurrently({
+            'snapshot': functools.partial(
+                opensearch.get_dashboard_snapshot,
+                start_time=start_time,
+                end_time=end_time,
+                interval=interval,
+                threat_start_time=threat_start_time,
+                threat_end_time=end_time
+            ),
+            'agents': get_agent_inventory().status_counts
+        })
+        snapshot = fetched['snapshot']
+        if 'error' in snapshot:
+            return jsonify(snapshot), 500
+        
+        snapshot['agent_stats'] = _agent_stats(fetched['agents'])
+        snapshot['time_range'] = {'start': start_time, 'end': end_time}
+        
+        return jsonify(snapshot)
+    except Exception as e:
+        logger.error(f"Error fetching dashboard snapshot: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @dashboard_bp.route('/api/dashboard/stats')
 @login_required
 def dashboard_stats():
     """Get dashboard statistics"""
     try:
         opensearch = OpenSearchAPI()
-        wazuh = WazuhAPI()
         
         days = int(request.args.get('days', 1))
         end_time = datetime.utcnow().isoformat()
         start_time = (datetime.utcnow() - timedelta(days=days)).isoformat()
         
-        alert_counts = opensearch.get_alert_count_by_severity(start_time=start_time, end_time=end_time)
-        recent_alerts = opensearch.search_alerts(start_time=start_time, end_time=end_time, limit=10, sort_field="@timestamp", sort_order="desc")
-        agents_status = wazuh.get_agents({"limit": 500})
+        fetched = run_concurrently({
+            'alert_counts': functools.partial(opensearch.get_alert_count_by_severity, start_time=start_time, end_time=end_time),
+            'recent_alerts': functools.partial(opensearch.search_alerts, start_time=start_time, end_time=end_time, limit=10, sort_field="@timestamp", sort_order="desc", projection="summary"),
+            'agent_stats': get_agent_inventory().status_counts
+        })
+        alert_counts = fetched['alert_counts']
+        recent_alerts = fetched['recent_alerts']
         
         # Include alert IDs in the response for correct navigation
         alerts_list = []
@@ -40,15 +89,7 @@ def dashboard_stats():
                     'source': hit.get('source')
                 })
         
-        agent_stats = {'total': 0, 'active': 0, 'disconnected': 0, 'never_connected': 0}
-        if agents_status and 'data' in agents_status and isinstance(agents_status['data'], dict) and 'affected_items' in agents_status['data']:
-            agents = agents_status['data']['affected_items']
-            agent_stats['total'] = len(agents)
-            for agent in agents:
-                status = agent.get('status', '')
-                if status == 'active': agent_stats['active'] += 1
-                elif status == 'disconnected': agent_stats['disconnected'] += 1
-                elif status == 'never_connected': agent_stats['never_connected'] += 1
+        agent_stats = _agent_stats(fetched['agent_stats'])
         
         return jsonify({
             'alert_counts': alert_counts,
@@ -65,12 +106,10 @@ def dashboard_stats():
 def dashboard_agents():
     """Get agents list with optional status filter"""
     try:
-        wazuh = WazuhAPI()
         status = request.args.get('status', 'all')
-        filters = {"limit": 1000} # Increased limit to ensure we get all agents
-        if status != 'all': filters["status"] = status
-        agents_data = wazuh.get_agents(filters)
-        agents_list = agents_data.get('data', {}).get('affected_items', []) if agents_data else []
+        agents_list = get_agent_inventory().agents(status)
+        if isinstance(agents_list, dict):
+            agents_list = []
         return jsonify(agents_list)
     except Exception as e:
         logger.error(f"Error fetching agents: {str(e)}")
@@ -84,39 +123,46 @@ def threat_analysis():
         end_time = datetime.utcnow().isoformat()
         start_time = (datetime.utcnow() - timedelta(days=1)).isoformat()
         
-        body = {
-            "size": 0,
-            "query": {
-                "bool": {
-                    "filter": [
-                        {"range": {"@timestamp": {"gte": start_time, "lte": end_time}}}
-                    ]
-                }
-            },
-            "aggs": {
-                "locations": {
-                    "terms": {
-                        "field": "agent.labels.location.set",
-                        "size": 100
-                    }
-                }
-            }
-        }
-        
-        response = opensearch.client.search(body=body, index=opensearch.index_pattern)
-        locations = []
-        if 'aggregations' in response and 'locations' in response['aggregations']:
-            for bucket in response['aggregations']['locations']['buckets']:
-                locations.append({
-                    'name': bucket['key'],
-                    'count': bucket['doc_count']
-                })
+        locations = opensearch.get_alert_locations(start_time, end_time, size=100)
+        if isinstance(locations, dict) and 'error' in locations:
+            return jsonify(locations), 500
         
         return jsonify({"locations": locations})
     except Exception as e:
         logger.error(f"Error getting threat analysis: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@dashboard_bp.route('/api/dashboard/terms/<dimension>')
+@login_required
+def term_page(dimension):
+    """
+    Page through every rule, agent, user, location or threat type seen in the
+    time range. Pass the returned "next" value as ?cursor= for the next page.
+    """
+    try:
+        opensearch = OpenSearchAPI()
+        days = int(request.args.get('days', 1))
+        page_size = min(int(request.args.get('size', 100)), 1000)
+        min_level = request.args.get('min_level', type=int)
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(days=days)
+        
+        page = opensearch.get_term_page(
+            dimension,
+            start_time.isoformat(),
+            end_time.isoformat(),
+            page_size=page_size,
+            cursor=request.args.get('cursor'),
+            min_level=min_level,
+            approximate_total=request.args.get('approx') == 'true'
+        )
+        if 'error' in page:
+            return jsonify(page), 400 if page['error'].startswith(('Unknown dimension', 'Invalid cursor')) else 500
+        return jsonify(page)
+    except Exception as e:
+        logger.error(f"Error paging {dimension}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @dashboard_bp.route('/api/dashboard/alerts_timeline')
 @login_required
 def alerts_timeline():
@@ -127,37 +173,9 @@ def alerts_timeline():
         end_time = datetime.utcnow()
         start_time = end_time - timedelta(days=days)
         interval = '1h' if days <= 7 else '1d'
-        body = {
-            "size": 0,
-            "query": {"bool": {"filter": [{"range": {"@timestamp": {"gte": start_time.isoformat(), "lte": end_time.isoformat()}}}]}},
-            "aggs": {
-                "alerts_over_time": {
-                    "date_histogram": {"field": "@timestamp", "interval": interval},
-                    "aggs": {
-                        "severity": {
-                            "range": {
-                                "field": "rule.level",
-                                "ranges": [
-                                    {"to": 1, "key": "none"},
-                                    {"from": 1, "to": 7, "key": "low"},
-                                    {"from": 7, "to": 12, "key": "medium"},
-                                    {"from": 12, "to": 15, "key": "high"},
-                                    {"from": 15, "key": "critical"}
-                                ]
-                            }
-                        }
-                    }
-                }
-            }
-        }
-        response = opensearch.client.search(body=body, index=opensearch.index_pattern)
-        timeline_data = []
-        if 'aggregations' in response and 'alerts_over_time' in response['aggregations']:
-            for bucket in response['aggregations']['alerts_over_time']['buckets']:
-                data_point = {'timestamp': bucket['key_as_string'], 'total': bucket['doc_count']}
-                for severity in bucket['severity']['buckets']:
-                    data_point[severity['key']] = severity['doc_count']
-                timeline_data.append(data_point)
+        timeline_data = opensearch.get_alerts_timeline(start_time.isoformat(), end_time.isoformat(), interval)
+        if isinstance(timeline_data, dict) and 'error' in timeline_data:
+            return jsonify(timeline_data), 500
         return jsonify(timeline_data)
     except Exception as e:
         logger.error(f"Error fetching alerts timeline: {str(e)}")
@@ -172,29 +190,9 @@ def top_rules():
         days = int(request.args.get('days', 1))
         end_time = datetime.utcnow()
         start_time = end_time - timedelta(days=days)
-        body = {
-            "size": 0,
-            "query": {"bool": {"filter": [{"range": {"@timestamp": {"gte": start_time.isoformat(), "lte": end_time.isoformat()}}}]}},
-            "aggs": {
-                "rule_id": {
-                    "terms": {"field": "rule.id", "size": 10},
-                    "aggs": {
-                        "rule_description": {"terms": {"field": "rule.description", "size": 1}},
-                        "rule_level": {"terms": {"field": "rule.level", "size": 1}}
-                    }
-                }
-            }
-        }
-        response = opensearch.client.search(body=body, index=opensearch.index_pattern)
-        top_rules_data = []
-        if 'aggregations' in response and 'rule_id' in response['aggregations']:
-            for bucket in response['aggregations']['rule_id']['buckets']:
-                top_rules_data.append({
-                    'rule_id': bucket['key'],
-                    'description': bucket['rule_description']['buckets'][0]['key'] if bucket['rule_description']['buckets'] else "N/A",
-                    'level': bucket['rule_level']['buckets'][0]['key'] if bucket['rule_level']['buckets'] else 0,
-                    'count': bucket['doc_count']
-                })
+        top_rules_data = opensearch.get_top_rules(start_time.isoformat(), end_time.isoformat(), size=10)
+        if isinstance(top_rules_data, dict) and 'error' in top_rules_data:
+            return jsonify(top_rules_data), 500
         return jsonify(top_rules_data)
     except Exception as e:
         logger.error(f"Error fetching top rules: {str(e)}")
@@ -7,6 +7,7 @@ from app import db
 from models import AiInsightTemplate, AiInsightResult, Conversation
 from ai_insights import AIInsights
 from opensearch_api import OpenSearchAPI
+from alert_record import normalize_alerts
 
 logger = logging.getLogger(__name__)
 
@@ -193,11 +194,10 @@ def analyze_data():
         alerts_data = []
         
         if alert_ids:
-            # Get specific alerts by IDs
-            for alert_id in alert_ids:
-                alert = opensearch.get_alert_by_id(alert_id)
-                if 'error' not in alert:
-                    alerts_data.append(alert)
+            # Get specific alerts by IDs, routed to their index when the UI knows it
+            results = opensearch.get_alerts_by_ids(alert_ids, data.get('index_hints'))
+            if 'error' not in results:
+                alerts_data = results['results']
         elif severity_levels:
             # Get alerts by severity levels and time range
             end_time = datetime.utcnow().isoformat()
@@ -507,8 +507,9 @@ def voice_qa():
                 ext_match = re.search(r'\.([a-zA-Z0-9]{3,4})\b', question.lower())
                 if ext_match:
                     extension = ext_match.group(1)
-                    # We look for the extension in the syscheck path or full_log
-                    additional_filters['search_query'] = f"*{extension}*"
+                    # Match the extension against the FIM path only
+                    additional_filters['search_query'] = f"*.{extension}"
+                    additional_filters['search_mode'] = 'path'
                     search_terms.append(f"file_type: {extension}")
                     logger.info(f"Searching for file extension: {extension}")
                 
@@ -533,6 +534,7 @@ def voice_qa():
                     for ip in ip_matches:
                         search_terms.append(f"IP: {ip}")
                     additional_filters['search_query'] = ' OR '.join(ip_matches)
+                    additional_filters.pop('search_mode', None)
                     logger.info(f"Searching for IPs: {ip_matches}")
                 
                 # Check for username patterns
@@ -551,6 +553,7 @@ def voice_qa():
                     # Use the username directly for searching across multiple fields
                     # We wrap in quotes for phrase matching in query_string if it contains special chars
                     additional_filters['search_query'] = f'"{username}"'
+                    additional_filters.pop('search_mode', None)
                     search_terms.append(f"user: {username}")
                     logger.info(f"Searching for username: {username}")
                 
@@ -583,7 +586,6 @@ def voice_qa():
                 else:
                     error_msg = results.get('error', 'Unknown error')
                     logger.warning(f"OpenSearch search error: {error_msg}")
-                    logger.warning(f"Search request was: {results.get('request', {})}")
             
             except Exception as e:
                 logger.error(f"Error fetching alert context: {str(e)}")
@@ -597,45 +599,18 @@ def voice_qa():
             alert_summary = f"=== SECURITY ALERT DATA (Found {context_count} total alerts) ===\n\n"
             
             # Extract key information from alerts
-            for idx, alert in enumerate(context_data[:30], 1):  # Increased to top 30
-                # OpenSearchAPI returns with 'source' key, not '_source'
-                source = alert.get('source', alert.get('_source', {}))
-                agent = source.get('agent', {})
-                rule = source.get('rule', {})
-                timestamp = source.get('@timestamp', '')
-                data = source.get('data', {})
-                
-                # Include detailed user/IP information if available
-                data_win = data.get('win', {})
-                eventdata = data_win.get('eventdata', {})
-                syscheck = source.get('syscheck', {})
-                
-                # Try multiple username fields for better identification
-                username = (
-                    eventdata.get('targetUserName') or
-                    eventdata.get('SubjectUserName') or
-                    eventdata.get('UserName') or
-                    eventdata.get('subjectUserName') or
-                    syscheck.get('uname_after') or
-                    data.get('user') or
-                    "N/A"
-                )
-                
-                source_ip = data.get('srcip') or eventdata.get('SourceAddress')
-                dest_ip = data.get('dstip') or eventdata.get('DestinationAddress')
-                login_type = eventdata.get('logonType')
-                
+            for idx, record in enumerate(normalize_alerts(context_data[:30]), 1):
                 alert_summary += f"ALERT #{idx}\n"
-                alert_summary += f"  - User Name: {username}\n"
-                alert_summary += f"  - Computer/Agent: {agent.get('name', 'Unknown')} (ID: {agent.get('id', 'N/A')}, IP: {agent.get('ip', 'N/A')})\n"
-                alert_summary += f"  - IP Activity: Source: {source_ip or 'N/A'}, Destination: {dest_ip or 'N/A'}\n"
-                alert_summary += f"  - Event: {rule.get('id', 'N/A')} - {rule.get('description', 'No description')}\n"
+                alert_summary += f"  - User Name: {record.username or 'N/A'}\n"
+                alert_summary += f"  - Computer/Agent: {record.agent_name or 'Unknown'} (ID: {record.agent_id or 'N/A'}, IP: {record.agent_ip or 'N/A'})\n"
+                alert_summary += f"  - IP Activity: Source: {record.source_ip or 'N/A'}, Destination: {record.destination_ip or 'N/A'}\n"
+                alert_summary += f"  - Event: {record.rule_id or 'N/A'} - {record.rule_description or 'No description'}\n"
                 
-                if syscheck.get('path'):
-                    alert_summary += f"  - File Path: {syscheck.get('path')}\n"
+                if record.file_path:
+                    alert_summary += f"  - File Path: {record.file_path}\n"
                 
-                alert_summary += f"  - Severity: {rule.get('level', 'Unknown')}\n"
-                alert_summary += f"  - Timestamp: {timestamp}\n"
+                alert_summary += f"  - Severity: {record.rule_level if record.rule_level is not None else 'Unknown'}\n"
+                alert_summary += f"  - Timestamp: {record.timestamp_raw or ''}\n"
                 alert_summary += "-" * 30 + "\n"
             
             context_data_for_ai = alert_summary
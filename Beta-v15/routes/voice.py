@@ -112,35 +112,33 @@ def execute_command():
         return jsonify({"error": str(e), "success": False}), 500
 
 
+def _voice_agent_stats():
+    """Total/active/disconnected agent counts from the shared agent inventory"""
+    from wazuh_api import get_agent_inventory
+    
+    counts = get_agent_inventory().status_counts()
+    if 'error' in counts:
+        return {'total': 0, 'active': 0, 'disconnected': 0}
+    return {key: counts[key] for key in ('total', 'active', 'disconnected')}
+
+
 def _execute_intent(intent, parameters):
     """Execute a specific intent and return results."""
     from opensearch_api import OpenSearchAPI
-    from wazuh_api import WazuhAPI
+    from alert_record import AlertRecord
     from ai_insights import AIInsights
     from datetime import datetime, timedelta
     
     try:
         if intent == "get_stats":
             api = OpenSearchAPI()
-            wazuh = WazuhAPI()
             
             days = parameters.get('days', 1)
             end_time = datetime.utcnow().isoformat()
             start_time = (datetime.utcnow() - timedelta(days=days)).isoformat()
             
             alert_counts = api.get_alert_count_by_severity(start_time=start_time, end_time=end_time)
-            agents_status = wazuh.get_agents({"limit": 500})
-            
-            agent_stats = {'total': 0, 'active': 0, 'disconnected': 0}
-            if agents_status and 'data' in agents_status and 'affected_items' in agents_status['data']:
-                agents = agents_status['data']['affected_items']
-                agent_stats['total'] = len(agents)
-                for agent in agents:
-                    status = agent.get('status', '')
-                    if status == 'active':
-                        agent_stats['active'] += 1
-                    elif status == 'disconnected':
-                        agent_stats['disconnected'] += 1
+            agent_stats = _voice_agent_stats()
             
             if alert_counts:
                 response_text = f"Dashboard summary: {alert_counts.get('critical', 0)} critical alerts, " \
@@ -169,15 +167,15 @@ def _execute_intent(intent, parameters):
                 severity_levels=['critical', 'high'],
                 start_time=start_time,
                 end_time=end_time,
-                limit=10
+                limit=10,
+                projection="summary"
             )
             
             alerts = result.get('results', []) if result else []
             
             if alerts:
                 count = len(alerts)
-                first_alert = alerts[0].get('source', {}) if alerts else {}
-                rule_desc = first_alert.get('rule', {}).get('description', 'Unknown alert')
+                rule_desc = AlertRecord.from_hit(alerts[0]).rule_description or 'Unknown alert'
                 response_text = f"Found {count} critical and high severity alerts. " \
                               f"The most recent is: {rule_desc}"
                 
@@ -194,19 +192,7 @@ def _execute_intent(intent, parameters):
                 }
         
         elif intent == "get_agent_status":
-            wazuh = WazuhAPI()
-            agents_status = wazuh.get_agents({"limit": 500})
-            
-            agent_stats = {'total': 0, 'active': 0, 'disconnected': 0}
-            if agents_status and 'data' in agents_status and 'affected_items' in agents_status['data']:
-                agents = agents_status['data']['affected_items']
-                agent_stats['total'] = len(agents)
-                for agent in agents:
-                    status = agent.get('status', '')
-                    if status == 'active':
-                        agent_stats['active'] += 1
-                    elif status == 'disconnected':
-                        agent_stats['disconnected'] += 1
+            agent_stats = _voice_agent_stats()
             
             response_text = f"Agent status: {agent_stats.get('active', 0)} active, " \
                           f"{agent_stats.get('disconnected', 0)} disconnected, " \
@@ -3,10 +3,15 @@ from datetime import datetime, timedelta
 import json
 import re
 from flask_apscheduler import APScheduler
-from models import AlertConfig, ReportConfig, SystemConfig, db, StoredAlert
+from config import Config
+from models import AlertConfig, ReportConfig, ReportDelivery, SystemConfig, db, StoredAlert
 from email_alerts import EmailAlerts
 from report_generator import ReportGenerator
-from opensearch_api import OpenSearchAPI
+from opensearch_api import OpenSearchAPI, query_caller
+from alert_record import AlertRecord
+from alert_dedup import get_alert_deduplicator
+from mail_sender import get_mail_outbox
+from leader_election import get_leader_lease, leader_only
 
 
 def normalize_time(time_str):
@@ -63,11 +68,77 @@ logger = logging.getLogger(__name__)
 # Initialize the scheduler
 scheduler = APScheduler()
 
+# Alerts looked up and inserted together by the storage job
+STORED_ALERT_BATCH_SIZE = 500
+# How far back the storage job reaches when nothing is stored yet
+STORED_ALERT_LOOKBACK = timedelta(days=3)
+
+
+def _stored_alert_row(record):
+    """Build the StoredAlert for an alert, or None if it has no id or timestamp"""
+    if not record.timestamp_raw or not record.id:
+        return None
+    
+    alert_dt = record.timestamp or datetime.utcnow()
+    
+    # Extract RDP activity if available
+    rdp_activity = None
+    if record.get('data.protocol') == 'rdp' or 'RDP' in str(record.rule_description or ''):
+        rdp_activity = 'RDP_SESSION'
+    
+    return StoredAlert(
+        alert_date=alert_dt.date(),
+        alert_timestamp=alert_dt,
+        alert_id=record.id,
+        agent_id=record.agent_id,
+        agent_name=record.agent_name,
+        agent_ip=record.agent_ip,
+        rule_id=record.rule_id,
+        rule_description=record.rule_description,
+        severity_level=record.severity,
+        severity_numeric=record.rule_level,
+        source_ip=record.source_ip,
+        destination_ip=record.destination_ip,
+        username=record.username,
+        event_type=record.rule_groups[0] if record.rule_groups else '',
+        login_type=record.login_type,
+        rdp_activity=rdp_activity,
+        file_path=record.file_path,
+        raw_data=json.dumps(record.source)[:5000]
+    )
+
+
+def _store_alert_batch(rows):
+    """
+    Insert the rows whose alert_id is not stored yet, with one lookup for
+    the whole batch. Returns (stored, skipped).
+    """
+    unique = {}
+    for row in rows:
+        unique.setdefault(row.alert_id, row)
+    try:
+        existing = {alert_id for (alert_id,) in db.session.query(StoredAlert.alert_id).filter(
+            StoredAlert.alert_id.in_(list(unique))).all()}
+        new_rows = [row for alert_id, row in unique.items() if alert_id not in existing]
+        db.session.add_all(new_rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(new_rows), len(rows) - len(new_rows)
+
+
 # Define the jobs to be run
+@leader_only
+@query_caller('job:store_alerts_in_database')
 def store_alerts_in_database():
     """
     Store alerts from OpenSearch in database on a date-wise basis.
     This trains the AI search engine with historical alert data.
+
+    Each run resumes from the newest stored alert (less
+    ALERT_INGEST_GRACE_SECONDS for late indexing), reaching back at most
+    STORED_ALERT_LOOKBACK.
     """
     logger.info("Running alert storage job for AI search training")
     
@@ -79,124 +150,43 @@ def store_alerts_in_database():
         with scheduler.app.app_context():
             opensearch = OpenSearchAPI()
             
-            # Fetch recent alerts (last 3 days for frequent training)
-            end_time = datetime.utcnow().isoformat()
-            start_time = (datetime.utcnow() - timedelta(days=3)).isoformat()
+            now = datetime.utcnow()
+            start = now - STORED_ALERT_LOOKBACK
+            latest = db.session.query(db.func.max(StoredAlert.alert_timestamp)).scalar()
+            if latest is not None:
+                start = max(start, latest - timedelta(seconds=Config.ALERT_INGEST_GRACE_SECONDS))
             
-            results = opensearch.search_alerts(
-                start_time=start_time,
-                end_time=end_time,
-                limit=1000  # Increased limit to get more training data
-            )
+            stored_count = 0
+            skipped_count = 0
+            pending = []
             
-            if results and 'error' not in results:
-                alerts = results.get('results', [])
-                stored_count = 0
-                skipped_count = 0
-                
-                for alert in alerts:
+            try:
+                # Walk every alert since the resume point with point-in-time paging
+                for alert in opensearch.iter_alerts(start_time=start.isoformat(), end_time=now.isoformat()):
                     try:
-                        # Extract key fields
-                        source = alert.get('_source', {})
-                        timestamp = source.get('@timestamp')
-                        alert_id = alert.get('_id', '')
-                        
-                        if not timestamp or not alert_id:
-                            continue
-                        
-                        # Parse timestamp
-                        try:
-                            alert_dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                        except:
-                            alert_dt = datetime.utcnow()
-                        
-                        alert_date = alert_dt.date()
-                        
-                        # Check if already stored
-                        existing = StoredAlert.query.filter_by(alert_id=alert_id).first()
-                        if existing:
-                            skipped_count += 1
-                            continue
-                        
-                        # Extract security data - handle Windows and generic events
-                        agent = source.get('agent', {})
-                        rule = source.get('rule', {})
-                        data_section = source.get('data', {})
-                        data_win = data_section.get('win', {})
-                        eventdata = data_win.get('eventdata', {})
-                        
-                        # Try to extract username from multiple possible locations
-                        username = (
-                            eventdata.get('targetUserName') or
-                            eventdata.get('SubjectUserName') or
-                            eventdata.get('UserName') or
-                            data_section.get('user') or
-                            None
-                        )
-                        
-                        # Extract source IP
-                        source_ip = (
-                            data_section.get('srcip') or
-                            eventdata.get('SourceAddress') or
-                            None
-                        )
-                        
-                        # Extract destination IP
-                        dest_ip = (
-                            data_section.get('dstip') or
-                            eventdata.get('DestinationAddress') or
-                            None
-                        )
-                        
-                        # Extract login type if available
-                        login_type = eventdata.get('logonType')
-                        
-                        # Extract file path for FIM alerts (syscheck.path)
-                        file_path = source.get('syscheck', {}).get('path')
-                        
-                        # Extract RDP activity if available
-                        rdp_activity = None
-                        if data_section.get('protocol') == 'rdp' or 'RDP' in str(source.get('rule', {}).get('description', '')):
-                            rdp_activity = 'RDP_SESSION'
-                        
-                        # Create stored alert with comprehensive data
-                        stored_alert = StoredAlert(
-                            alert_date=alert_date,
-                            alert_timestamp=alert_dt,
-                            alert_id=alert_id,
-                            agent_id=agent.get('id'),
-                            agent_name=agent.get('name'),
-                            agent_ip=agent.get('ip'),
-                            rule_id=rule.get('id'),
-                            rule_description=rule.get('description'),
-                            severity_level=rule.get('level'),
-                            severity_numeric=rule.get('id'),
-                            source_ip=source_ip,
-                            destination_ip=dest_ip,
-                            username=username,
-                            event_type=rule.get('groups', [''])[0] if rule.get('groups') else '',
-                            login_type=login_type,
-                            rdp_activity=rdp_activity,
-                            file_path=file_path,
-                            raw_data=json.dumps(source)[:5000]
-                        )
-                        
-                        db.session.add(stored_alert)
-                        stored_count += 1
-                        
-                        if stored_count % 100 == 0:
-                            db.session.commit()
-                            logger.info(f"Stored {stored_count} alerts, skipped {skipped_count} duplicates")
-                    
+                        row = _stored_alert_row(AlertRecord.from_hit(alert))
                     except Exception as e:
-                        logger.warning(f"Error storing alert {alert.get('_id', 'unknown')}: {str(e)}")
+                        logger.warning(f"Error storing alert {alert.get('id', 'unknown')}: {str(e)}")
                         continue
-                
-                if stored_count > 0:
-                    db.session.commit()
-                logger.info(f"Alert storage job completed: {stored_count} new alerts stored, {skipped_count} duplicates skipped")
-            else:
-                logger.warning(f"Could not fetch alerts from OpenSearch: {results}")
+                    if row is None:
+                        continue
+                    pending.append(row)
+                    
+                    if len(pending) >= STORED_ALERT_BATCH_SIZE:
+                        stored, skipped = _store_alert_batch(pending)
+                        pending = []
+                        stored_count += stored
+                        skipped_count += skipped
+                        logger.info(f"Stored {stored_count} alerts, skipped {skipped_count} duplicates")
+            except Exception as e:
+                # Keep what was read before the stream failed; the next run resumes after it
+                logger.error(f"Error reading alerts for storage: {str(e)}")
+            
+            if pending:
+                stored, skipped = _store_alert_batch(pending)
+                stored_count += stored
+                skipped_count += skipped
+            logger.info(f"Alert storage job completed: {stored_count} new alerts stored, {skipped_count} duplicates skipped")
     
     except Exception as e:
         logger.error(f"Error in alert storage job: {str(e)}")
@@ -204,10 +194,16 @@ def store_alerts_in_database():
         logger.error(traceback.format_exc())
 
 
-def check_and_send_alerts():
+@leader_only
+@query_caller('job:check_and_send_alerts')
+def check_and_send_alerts(ignore_schedule=False):
     """
     Check for alerts that need to be sent based on alert configurations
     This job will run at the interval defined in system config
+
+    Args:
+        ignore_schedule: Evaluate every enabled config regardless of its
+            notify_time (manual checks)
     """
     logger.info("Running scheduled alert check job")
 
@@ -227,7 +223,8 @@ def check_and_send_alerts():
             logger.info(f"Found {len(alert_configs)} enabled alert configurations")
             email_alerts = EmailAlerts()
 
-            # Process each alert configuration
+            # Pick the configs due this cycle
+            due_configs = []
             for alert_config in alert_configs:
                 try:
                     # Check if this alert should run based on notify_time
@@ -237,7 +234,9 @@ def check_and_send_alerts():
                     alert_levels = alert_config.get_alert_levels()
                     is_high_critical = any(level.lower() in ['high', 'critical'] for level in alert_levels)
                     
-                    if is_high_critical:
+                    if ignore_schedule:
+                        should_send_alert = True
+                    elif is_high_critical:
                         # High and Critical alerts should be sent immediately regardless of notify_time
                         logger.info(f"Alert config {alert_config.id} has HIGH/CRITICAL levels - sending immediately")
                         should_send_alert = True
@@ -267,26 +266,39 @@ def check_and_send_alerts():
                     else:
                         logger.info(f"Alert config {alert_config.id} has no specific notify_time - sending immediately")
 
-                    # Send the alert
-                    logger.info(f"🚨 SENDING ALERT for config ID {alert_config.id} ({alert_config.name}) to {alert_config.email_recipient}")
-
-                    try:
-                        result = email_alerts.send_severity_alert(alert_config)
-                        if result:
-                            logger.info(f"✅ Successfully sent alert for config ID {alert_config.id}")
-                        else:
-                            logger.error(f"❌ Failed to send alert for config ID {alert_config.id} - email_alerts.send_severity_alert returned False")
-                    except Exception as send_error:
-                        logger.error(f"❌ Exception while sending alert for config ID {alert_config.id}: {str(send_error)}")
-                        result = False
+                    due_configs.append(alert_config)
 
                 except Exception as e:
                     logger.error(f"Error processing alert config {alert_config.id}: {str(e)}")
 
+            if not due_configs:
+                return
+
+            # One query for every due config, split per config in memory
+            batches, alert_counts = email_alerts.evaluate_alert_configs(due_configs)
+
+            for alert_config in due_configs:
+                # Send the alert
+                logger.info(f"🚨 SENDING ALERT for config ID {alert_config.id} ({alert_config.name}) to {alert_config.email_recipient}")
+
+                try:
+                    result = email_alerts.send_severity_alert(
+                        alert_config, alerts_data=batches[alert_config.id], alert_counts=alert_counts.get(alert_config.id),
+                        wait=False)
+                    if result:
+                        logger.info(f"✅ Successfully sent alert for config ID {alert_config.id}")
+                    else:
+                        logger.error(f"❌ Failed to send alert for config ID {alert_config.id} - email_alerts.send_severity_alert returned False")
+                except Exception as send_error:
+                    logger.error(f"❌ Exception while sending alert for config ID {alert_config.id}: {str(send_error)}")
+                    result = False
+
     except Exception as e:
         logger.error(f"Error in check_and_send_alerts job: {str(e)}")
 
 
+@leader_only
+@query_caller('job:generate_and_send_reports')
 def generate_and_send_reports():
     """
     Generate and send reports based on report configurations
@@ -391,11 +403,10 @@ def generate_and_send_reports():
                         continue
 
                     # Check if we've already sent this report today to prevent duplicates
-                    from models import SentAlert
-                    today_key = f"report_{report_config.id}_{now_pakistan.strftime('%Y-%m-%d')}"
-                    existing_report = SentAlert.query.filter(
-                        SentAlert.alert_identifier == today_key,
-                        SentAlert.timestamp >= now_pakistan.replace(hour=0, minute=0, second=0, microsecond=0)
+                    today_key = now_pakistan.strftime('%Y-%m-%d')
+                    existing_report = ReportDelivery.query.filter_by(
+                        report_config_id=report_config.id,
+                        period_key=today_key
                     ).first()
 
                     if existing_report:
@@ -442,10 +453,9 @@ def generate_and_send_reports():
                         logger.info(f"✅ Report generated successfully for config {report_config.id}")
 
                         # Record that we've sent this report to prevent duplicates
-                        sent_report = SentAlert(
-                            alert_config_id=report_config.id,
-                            alert_identifier=today_key,
-                            timestamp=now_pakistan
+                        sent_report = ReportDelivery(
+                            report_config_id=report_config.id,
+                            period_key=today_key
                         )
                         db.session.add(sent_report)
                         db.session.commit()
@@ -530,11 +540,13 @@ def generate_and_send_reports():
                                     recipient=recipient,
                                     subject=subject,
                                     message=message,
-                                    attachments=attachments
+                                    attachments=attachments,
+                                    wait=False,
+                                    source=f"report_config:{report_config.id}"
                                 )
 
                                 if result:
-                                    logger.info(f"✅ Successfully sent report to {recipient}")
+                                    logger.info(f"✅ Queued report for {recipient}")
                                 else:
                                     logger.error(f"❌ Failed to send report to {recipient}")
                                     send_success = False
@@ -544,7 +556,7 @@ def generate_and_send_reports():
                                 send_success = False
 
                         if send_success:
-                            logger.info(f"✅ Report successfully sent to all {len(recipients)} recipients")
+                            logger.info(f"✅ Report queued for all {len(recipients)} recipients")
                         else:
                             logger.warning(f"⚠️ Report sending had some failures for config {report_config.id}")
 
@@ -572,7 +584,13 @@ def update_scheduler_jobs():
         # Use the application context from the scheduler
         with scheduler.app.app_context():
             # Get alert check interval from system config or use default (2 minutes for immediate response)
-            interval_value = SystemConfig.get_value('alert_check_interval', '2')
+            try:
+                interval_value = SystemConfig.get_value('alert_check_interval', '2')
+            except Exception as config_error:
+                # Tables may not exist yet on first start; the job must still be registered
+                db.session.rollback()
+                logger.warning(f"Could not read alert_check_interval: {str(config_error)}")
+                interval_value = '2'
             alert_check_interval = 2  # Default fallback - more frequent checks for immediate alerts
 
             if interval_value:
@@ -601,13 +619,14 @@ def update_scheduler_jobs():
             except Exception:
                 pass  # Job might not exist yet
 
-            # Add the alert check job
+            # Add the alert check job, the only alert evaluation job
             scheduler.add_job(
                 id='check_alerts',
                 func=check_and_send_alerts,
                 trigger='interval',
                 minutes=alert_check_interval,
-                replace_existing=True
+                replace_existing=True,
+                max_instances=1
             )
 
             # Add the report generation job 
@@ -625,44 +644,39 @@ def update_scheduler_jobs():
     except Exception as e:
         logger.error(f"Error updating scheduler jobs: {str(e)}")
 
-def check_alerts():
-    """Check for alerts based on configured alert rules"""
-    try:
-        logger.info("🔍 Running scheduled alert checking job")
-
-        # Get all enabled alert configurations
-        alert_configs = AlertConfig.query.filter_by(enabled=True).all()
-        logger.info(f"Found {len(alert_configs)} enabled alert configurations")
-
-        if not alert_configs:
-            logger.info("No enabled alert configurations found")
-            return
-
-        email_alerts = EmailAlerts()
-
-        for config in alert_configs:
-            try:
-                logger.info(f"📧 Processing alert config {config.id}: {config.name}")
-                logger.info(f"   - Email recipient: {config.email_recipient}")
-                logger.info(f"   - Alert levels: {config.get_alert_levels()}")
-
-                # Send severity-based alert
-                result = email_alerts.send_severity_alert(config)
+@leader_only
+def deliver_outbox():
+    """Send queued emails that are due, retrying failures with backoff"""
+    if not scheduler.app:
+        logger.error("Scheduler app is not initialized")
+        return
 
-                if result:
-                    logger.info(f"✅ Successfully processed alert config {config.id}")
-                else:
-                    logger.warning(f"⚠️ Failed to process alert config {config.id}")
+    try:
+        with scheduler.app.app_context():
+            result = get_mail_outbox().deliver_due()
+            if result['retrying'] or result['dead']:
+                logger.warning(f"Outbox: {result['sent']} sent, {result['retrying']} to retry, "
+                               f"{result['dead']} dead-lettered")
+    except Exception as e:
+        logger.error(f"❌ Error delivering outbox: {str(e)}")
 
-            except Exception as e:
-                logger.error(f"❌ Error processing alert config {config.id}: {str(e)}")
-                import traceback
-                logger.error(f"Traceback: {traceback.format_exc()}")
+@leader_only
+def prune_dedup_records():
+    """Delete sent alert, report delivery and delivered outbox records past their retention"""
+    if not scheduler.app:
+        logger.error("Scheduler app is not initialized")
+        return
 
+    try:
+        with scheduler.app.app_context():
+            result = get_alert_deduplicator().prune()
+            logger.info(f"🧹 Pruned {result['sent_alerts_deleted']} sent alerts and "
+                        f"{result['report_deliveries_deleted']} report deliveries in {result['duration_ms']} ms")
+            logger.info(f"🧹 Pruned {get_mail_outbox().prune()} delivered emails from the outbox")
+            if not result['complete']:
+                logger.info("Pruning stopped at the batch limit; the rest goes next run")
     except Exception as e:
-        logger.error(f"❌ Error in alert checking job: {str(e)}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error(f"❌ Error pruning dedup records: {str(e)}")
 
 def init_app(app):
     """
@@ -672,9 +686,10 @@ def init_app(app):
     scheduler.init_app(app)
     scheduler.app = app
 
-    # Start the scheduler
+    # Start the scheduler; jobs only do work in the process holding the lease
     scheduler.start()
     logger.info("APScheduler started")
+    get_leader_lease().start(app)
 
     # Set up the initial jobs
     with app.app_context():
@@ -716,25 +731,38 @@ def init_app(app):
             logger.error(f"Error creating system config: {str(config_error)}")
             # Continue with defaults
 
+        # Load recently sent alerts into the in-memory dedup cache
+        get_alert_deduplicator().warm()
+
         # Update the scheduler jobs
         update_scheduler_jobs()
 
-        # Add alert checking job - check every 2 minutes for immediate alerts
+        # Add alert storage job - store alerts in database every 30 minutes for AI training
         scheduler.add_job(
-            func=check_alerts,
+            func=store_alerts_in_database,
             trigger="interval",
-            minutes=2,
-            id='check_alerts',
+            minutes=30,
+            id='store_alerts',
             replace_existing=True,
             max_instances=1
         )
-        
-        # Add alert storage job - store alerts in database every 30 minutes for AI training
+
+        # Add outbox delivery job
         scheduler.add_job(
-            func=store_alerts_in_database,
+            func=deliver_outbox,
             trigger="interval",
-            minutes=30,
-            id='store_alerts',
+            seconds=Config.OUTBOX_POLL_SECONDS,
+            id='deliver_outbox',
+            replace_existing=True,
+            max_instances=1
+        )
+
+        # Add dedup record pruning job
+        scheduler.add_job(
+            func=prune_dedup_records,
+            trigger="interval",
+            minutes=Config.DEDUP_PRUNE_INTERVAL_MINUTES,
+            id='prune_dedup_records',
             replace_existing=True,
             max_instances=1
         )
\ No newline at end of file
@@ -0,0 +1,291 @@
+import ipaddress
+import logging
+import re
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Keyword fields grouped by what a search value is likely to be
+IP_FIELDS = [
+    "agent.ip",
+    "data.srcip",
+    "data.dstip",
+    "data.win.eventdata.ipAddress"
+]
+
+USER_FIELDS = [
+    "data.win.eventdata.targetUserName",
+    "data.win.eventdata.subjectUserName",
+    "data.win.eventdata.destinationUserName",
+    "data.win.eventdata.sourceUserName",
+    "syscheck.uname_after",
+    "data.srcuser",
+    "data.dstuser"
+]
+
+PATH_FIELDS = [
+    "syscheck.path"
+]
+
+# Whole-value keyword fields worth matching for free text
+TEXT_KEYWORD_FIELDS = [
+    "rule.description",
+    "agent.name"
+]
+
+# Analyzed field holding the raw event
+FULL_LOG_FIELD = "full_log"
+
+# Minimum share of free-text words a document must contain
+TEXT_MINIMUM_SHOULD_MATCH = "2<60%"
+
+_USERNAME_RE = re.compile(r'^[\w.$@-]+(\\[\w.$@-]+)?$')
+_WINDOWS_PATH_RE = re.compile(r'^[A-Za-z]:\\')
+_TRAILING_PUNCTUATION_RE = re.compile(r'[?!.,;:]+$')
+
+
+def detect_input_kind(value):
+    """
+    Classify a search value as "ip", "path", "username", "wildcard" or "text"
+
+    '*' and '?' only mark a wildcard in a single token; in a sentence such
+    as "who logged in?" they are punctuation.
+    """
+    value = value.strip()
+    if len(value.split()) > 1:
+        return "text"
+    if '*' in value or '?' in value:
+        return "wildcard"
+    try:
+        ipaddress.ip_address(value)
+        return "ip"
+    except ValueError:
+        pass
+    if value.startswith('/') or _WINDOWS_PATH_RE.match(value) or '/' in value:
+        return "path"
+    if _USERNAME_RE.match(value):
+        return "username"
+    return "text"
+
+
+def _fields_for(kind):
+    if kind == "ip":
+        return IP_FIELDS
+    if kind == "path":
+        return PATH_FIELDS
+    if kind == "username":
+        return USER_FIELDS + TEXT_KEYWORD_FIELDS
+    return TEXT_KEYWORD_FIELDS + USER_FIELDS + PATH_FIELDS
+
+
+def _term(field, value, kind):
+    # IP-typed fields reject case_insensitive
+    if kind == "ip":
+        return {"term": {field: value}}
+    return {"term": {field: {"value": value, "case_insensitive": True}}}
+
+
+def _should(clauses):
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"bool": {"should": clauses, "minimum_should_match": 1}}
+
+
+def exact_search(value, kind):
+    """Exact (case-insensitive) keyword match on the fields for this kind of value"""
+    return _should([_term(field, value, kind) for field in _fields_for(kind)])
+
+
+def prefix_search(value, kind):
+    """Keyword prefix match; a term-dictionary seek rather than a scan"""
+    if kind == "ip":
+        return exact_search(value, kind)
+    return _should([
+        {"prefix": {field: {"value": value, "case_insensitive": True}}}
+        for field in _fields_for(kind)
+    ])
+
+
+def phrase_search(value, kind):
+    """Phrase match on the raw log plus exact keyword matches"""
+    clauses = [{"match_phrase": {FULL_LOG_FIELD: value}}]
+    clauses.extend(_term(field, value, kind) for field in _fields_for(kind))
+    return _should(clauses)
+
+
+def wildcard_search(value, kind):
+    """Explicit wildcards, limited to path and user keyword fields"""
+    return _should([
+        {"wildcard": {field: {"value": value, "case_insensitive": True}}}
+        for field in PATH_FIELDS + USER_FIELDS
+    ])
+
+
+def auto_search(value, kind):
+    """Pick the cheapest clause set that fits the shape of the value"""
+    if kind == "wildcard":
+        return wildcard_search(value, kind)
+    if kind == "ip":
+        return phrase_search(value, kind)
+    if kind == "path":
+        return _should([exact_search(value, kind), prefix_search(value, kind),
+                        {"match_phrase": {FULL_LOG_FIELD: value}}])
+    if kind == "username":
+        return phrase_search(value, kind)
+    return text_search(value, kind)
+
+
+def text_search(value, kind):
+    """
+    Free text: most of the words in the raw log, phrase matches ranked
+    first. rule.description is a keyword field, so it only matches the
+    whole value exactly; a single word is also matched exactly against
+    the other keyword fields.
+    """
+    words = _TRAILING_PUNCTUATION_RE.sub('', value.strip()) or value
+    clauses = [
+        {"match": {FULL_LOG_FIELD: {"query": words, "minimum_should_match": TEXT_MINIMUM_SHOULD_MATCH}}},
+        {"match_phrase": {FULL_LOG_FIELD: {"query": words, "boost": 2}}}
+    ]
+    if len(words.split()) == 1:
+        clauses.append(exact_search(value, kind))
+    else:
+        clauses.append(_term("rule.description", value.strip(), kind))
+    return _should(clauses)
+
+
+def path_search(value, kind):
+    """Path-only search: a wildcard pattern such as '*.xlsx' or an exact/prefix path"""
+    if kind == "wildcard":
+        return _should([
+            {"wildcard": {field: {"value": value, "case_insensitive": True}}}
+            for field in PATH_FIELDS
+        ])
+    return _should([
+        {"prefix": {field: {"value": value, "case_insensitive": True}}}
+        for field in PATH_FIELDS
+    ])
+
+
+def deep_search(value, kind):
+    """
+    Fuzzy multi-field search plus a leading-wildcard query_string.
+
+    Scans term dictionaries on every shard, so it is opt-in only.
+    """
+    # Normalize common user-friendly terms to technical ones
+    normalized_value = value.lower()
+    if 'remote logon' in normalized_value:
+        value = f"{value} \"Remote Logon\""
+
+    # Multi-field search for agent name, IP, and description
+    return {
+        "bool": {
+            "should": [
+                {
+                    "multi_match": {
+                        "query": value,
+                        "fields": [
+                            "agent.name^3",
+                            "agent.ip^3",
+                            "rule.description^15", # Higher boost for descriptions
+                            "full_log^10",          # Higher boost for raw logs
+                            "data.win.eventdata.targetUserName^20", # MASSIVE boost for user names
+                            "data.win.eventdata.subjectUserName^20",
+                            "data.win.eventdata.logonId^5",
+                            "data.win.eventdata.logonType^5",
+                            "data.win.eventdata.ipAddress^10",
+                            "data.win.eventdata.ipPort^5",
+                            "data.win.eventdata.status^10",
+                            "data.win.eventdata.subStatus^10",
+                            "syscheck.uname_after^20", # MASSIVE boost for FIM user names
+                            "syscheck.path^20", # Boost for file paths
+                            "data.win.eventdata.destinationUserName^20",
+                            "data.win.eventdata.sourceUserName^20"
+                        ],
+                        "type": "best_fields",
+                        "fuzziness": "AUTO",
+                        "minimum_should_match": "1" # Minimal matching
+                    }
+                },
+                {
+                    "match_phrase": {
+                        "syscheck.path": {
+                            "query": value,
+                            "boost": 100
+                        }
+                    }
+                },
+                {
+                    "match_phrase": {
+                        "data.win.eventdata.targetUserName": {
+                            "query": value,
+                            "boost": 100
+                        }
+                    }
+                },
+                {
+                    "query_string": {
+                        "query": f"*{value}*",
+                        "fields": [
+                            "rule.description",
+                            "data.win.eventdata.targetUserName",
+                            "data.win.eventdata.subjectUserName",
+                            "syscheck.uname_after",
+                            "syscheck.path",
+                            "full_log",
+                            "data.win.eventdata.destinationUserName"
+                        ],
+                        "boost": 10
+                    }
+                }
+            ]
+        }
+    }
+
+
+# Search modes selectable through additional_filters['search_mode'].
+# Each builder takes (value, input kind) and returns a query clause.
+SEARCH_STRATEGIES = {
+    "auto": auto_search,
+    "exact": exact_search,
+    "prefix": prefix_search,
+    "phrase": phrase_search,
+    "path": path_search,
+    "deep": deep_search
+}
+
+
+def register_search_strategy(name, builder):
+    """Add or replace a search mode"""
+    SEARCH_STRATEGIES[name] = builder
+
+
+def _split_terms(value):
+    """Split 'a OR b' into terms and strip wrapping quotes"""
+    terms = [term.strip() for term in re.split(r'\s+OR\s+', value) if term.strip()]
+    return [term[1:-1] if len(term) > 1 and term[0] == term[-1] == '"' else term
+            for term in terms]
+
+
+def build_search_clause(value, mode=None):
+    """
+    Build the query clause for a free-text search value.
+
+    mode is one of SEARCH_STRATEGIES; unknown or missing modes use
+    Config.SEARCH_DEFAULT_MODE.
+    """
+    mode = (mode or Config.SEARCH_DEFAULT_MODE).lower()
+    builder = SEARCH_STRATEGIES.get(mode)
+    if builder is None:
+        logger.warning(f"Unknown search mode '{mode}', using {Config.SEARCH_DEFAULT_MODE}")
+        builder = SEARCH_STRATEGIES.get(Config.SEARCH_DEFAULT_MODE, auto_search)
+
+    # The deep query keeps its own query_string syntax handling
+    if builder is deep_search:
+        return deep_search(value, "text")
+
+    clauses = [builder(term, detect_input_kind(term)) for term in _split_terms(value)]
+    if not clauses:
+        return {"match_none": {}}
+    return _should(clauses)
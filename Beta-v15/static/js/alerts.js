@@ -127,6 +127,10 @@ function loadSecurityAlerts(page = 1) {
     const searchQuery = document.getElementById('search-filter')?.value;
     if (searchQuery && searchQuery.trim()) {
         params.append('search_query', searchQuery.trim());
+        const searchMode = document.getElementById('search-mode-filter')?.value;
+        if (searchMode) {
+            params.append('search_mode', searchMode);
+        }
     }
 
     const ruleId = document.getElementById('rule-filter')?.value;
@@ -213,6 +217,10 @@ function exportAlerts(format) {
     const searchQuery = document.getElementById('search-filter')?.value;
     if (searchQuery) {
         params.append('search_query', searchQuery);
+        const searchMode = document.getElementById('search-mode-filter')?.value;
+        if (searchMode) {
+            params.append('search_mode', searchMode);
+        }
     }
 
     const ruleId = document.getElementById('rule-filter')?.value;
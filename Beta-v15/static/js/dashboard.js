@@ -10,11 +10,8 @@ document.addEventListener('DOMContentLoaded', function() {
         return;
     }
 
-    // Load initial dashboard data
-    loadDashboardStatsForTimeRange(1);
-    loadAlertsTimeline(1);
-    loadTopRules(1);
-    loadThreatAnalysis();
+    // Load initial dashboard data (one request, one cluster round trip)
+    loadDashboardSnapshot(1);
 
     // Set up event listeners for time range buttons
     document.querySelectorAll('.timeline-range').forEach(item => {
@@ -22,9 +19,7 @@ document.addEventListener('DOMContentLoaded', function() {
             const days = this.getAttribute('data-days');
             document.querySelectorAll('.timeline-range').forEach(el => el.classList.remove('active'));
             this.classList.add('active');
-            loadDashboardStatsForTimeRange(days);
-            loadAlertsTimeline(days);
-            loadTopRules(days);
+            loadDashboardSnapshot(days);
         });
     });
 
@@ -86,10 +81,7 @@ document.addEventListener('DOMContentLoaded', function() {
         refreshBtn.addEventListener('click', function() {
             const activeRange = document.querySelector('.timeline-range.active');
             const days = activeRange ? activeRange.getAttribute('data-days') : 1;
-            loadDashboardStatsForTimeRange(days);
-            loadAlertsTimeline(days);
-            loadTopRules(days);
-            loadThreatAnalysis();
+            loadDashboardSnapshot(days);
         });
     }
 });
@@ -97,6 +89,30 @@ document.addEventListener('DOMContentLoaded', function() {
 // Using a module-level variable to store current modal instance to prevent multiple instances
 let agentDetailsModal = null;
 
+function loadDashboardSnapshot(days = 1) {
+    fetch(`/api/dashboard/snapshot?days=${days}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                console.error('Error loading dashboard snapshot:', data.error);
+                return;
+            }
+            updateAlertCountCards(data.alert_counts);
+            updateAgentCards(data.agent_stats);
+            updateRecentAlerts(data.recent_alerts);
+
+            const rulesBody = document.getElementById('top-rules-body');
+            if (rulesBody && Array.isArray(data.top_rules)) renderTopRules(data.top_rules, rulesBody);
+
+            const timelineContainer = document.getElementById('alerts-timeline-chart');
+            if (timelineContainer && Array.isArray(data.timeline)) renderTimelineChart(data.timeline, timelineContainer);
+
+            const locationsContainer = document.getElementById('locations-chart');
+            if (locationsContainer && Array.isArray(data.locations)) renderLocationsChart(data.locations, locationsContainer);
+        })
+        .catch(error => console.error('Error loading dashboard snapshot:', error));
+}
+
 function loadDashboardStatsForTimeRange(days = 1) {
     fetch(`/api/dashboard/stats?days=${days}`)
         .then(response => response.json())
@@ -172,25 +188,27 @@ function loadTopRules(days = 1) {
     if (!tableBody) return;
     fetch(`/api/dashboard/top_rules?days=${days}`)
         .then(response => response.json())
-        .then(rules => {
-            tableBody.innerHTML = rules.length === 0 ? '<tr><td class="text-center py-5 text-muted">No data</td></tr>' : '';
-            rules.forEach(rule => {
-                const row = document.createElement('tr');
-                row.className = 'top-rule-row clickable-row';
-                row.style.cursor = 'pointer';
-                row.setAttribute('data-rule-id', rule.rule_id);
-                row.innerHTML = `
-                    <td class="ps-4 py-3">
-                        <div class="d-flex justify-content-between align-items-center">
-                            <div class="fw-bold text-light">${rule.description}</div>
-                            <span class="badge bg-primary rounded-pill">${rule.count}</span>
-                        </div>
-                        <div class="small text-muted">Rule ID: ${rule.rule_id} | Level: ${rule.level}</div>
-                    </td>
-                `;
-                tableBody.appendChild(row);
-            });
-        });
+        .then(rules => renderTopRules(rules, tableBody));
+}
+
+function renderTopRules(rules, tableBody) {
+    tableBody.innerHTML = rules.length === 0 ? '<tr><td class="text-center py-5 text-muted">No data</td></tr>' : '';
+    rules.forEach(rule => {
+        const row = document.createElement('tr');
+        row.className = 'top-rule-row clickable-row';
+        row.style.cursor = 'pointer';
+        row.setAttribute('data-rule-id', rule.rule_id);
+        row.innerHTML = `
+            <td class="ps-4 py-3">
+                <div class="d-flex justify-content-between align-items-center">
+                    <div class="fw-bold text-light">${rule.description}</div>
+                    <span class="badge bg-primary rounded-pill">${rule.count}</span>
+                </div>
+                <div class="small text-muted">Rule ID: ${rule.rule_id} | Level: ${rule.level}</div>
+            </td>
+        `;
+        tableBody.appendChild(row);
+    });
 }
 
 function showAgentDetails(status = 'all') {
@@ -725,6 +725,11 @@ function directAnalyze(alertData) {
         alert_ids: [alertData.id],
         model_type: 'openai'
     };
+
+    // Let the server fetch the alert straight from its index
+    if (alertData.index && alertData.index !== 'N/A') {
+        analysisData.index_hints = { [alertData.id]: alertData.index };
+    }
     
     // Show loading modal
     const loadingModal = new bootstrap.Modal(document.getElementById('loading-modal'));
@@ -1,6 +1,12 @@
+import base64
+import os
+import threading
+import time
 import requests
 import logging
 import json
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from config import Config
 from urllib3.exceptions import InsecureRequestWarning
 import urllib3
@@ -11,65 +17,482 @@ if not Config.WAZUH_VERIFY_SSL:
 
 logger = logging.getLogger(__name__)
 
-class WazuhAPI:
+
+def _token_expiry(token):
+    """Read the exp claim (epoch seconds) from a JWT without verifying it"""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class WazuhClient:
+    """
+    Process-wide Wazuh API client shared by every WazuhAPI instance.
+
+    Requests go through one keep-alive requests.Session, and the JWT is
+    cached until shortly before its exp claim, so routes no longer
+    re-authenticate and re-handshake on every page load. The session is
+    rebuilt if the process forks.
+    """
+
     def __init__(self):
-        self.base_url = Config.WAZUH_API_URL
-        self.username = Config.WAZUH_API_USER
-        self.password = Config.WAZUH_API_PASSWORD
-        self.verify_ssl = Config.WAZUH_VERIFY_SSL
-        self.token = None
-        
-    def _get_token(self):
-        """Get authentication token from Wazuh API"""
+        self._lock = threading.Lock()
+        self._token_lock = threading.Lock()
+        self._session = None
+        self._pid = None
+        self._token = None
+        self._token_expires = 0
+        self._authentications = 0
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=Config.WAZUH_POOL_MAXSIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.verify = Config.WAZUH_VERIFY_SSL
+        return session
+
+    @property
+    def session(self):
+        pid = os.getpid()
+        if self._session is not None and self._pid == pid:
+            return self._session
+        with self._lock:
+            if self._session is None or self._pid != pid:
+                self._session = self._build_session()
+                self._pid = pid
+                self._token = None
+                self._token_expires = 0
+            return self._session
+
+    @property
+    def timeout(self):
+        return (Config.WAZUH_CONNECT_TIMEOUT, Config.WAZUH_TIMEOUT)
+
+    def get_token(self, stale_token=None):
+        """
+        Return a valid JWT, authenticating only when there is none, it is
+        about to expire, or it is stale_token (rejected by the manager).
+        Concurrent callers wait for one authentication.
+        """
+        token = self._token
+        if token and token != stale_token and time.time() < self._token_expires:
+            return token
+
+        with self._token_lock:
+            token = self._token
+            if token and token != stale_token and time.time() < self._token_expires:
+                return token
+            return self._authenticate()
+
+    def _authenticate(self):
         try:
-            auth_url = f"{self.base_url}/security/user/authenticate"
-            response = requests.post(
-                auth_url,
-                auth=(self.username, self.password),
-                verify=self.verify_ssl
+            response = self.session.post(
+                f"{Config.WAZUH_API_URL}/security/user/authenticate",
+                auth=(Config.WAZUH_API_USER, Config.WAZUH_API_PASSWORD),
+                timeout=self.timeout
             )
-            
-            if response.status_code == 200:
-                self.token = response.json()['data']['token']
-                return True
-            else:
-                logger.error(f"Authentication failed. Status code: {response.status_code}, Response: {response.text}")
-                return False
         except Exception as e:
             logger.error(f"Error while authenticating with Wazuh API: {str(e)}")
-            return False
+            return None
+
+        if response.status_code != 200:
+            logger.error(f"Authentication failed. Status code: {response.status_code}, Response: {response.text}")
+            return None
+
+        token = response.json()['data']['token']
+        expires = _token_expiry(token)
+        if expires is None:
+            # Wazuh's default token lifetime
+            expires = time.time() + 900
+        self._token = token
+        self._token_expires = expires - Config.WAZUH_TOKEN_REFRESH_MARGIN
+        self._authentications += 1
+        return token
+
+    def request(self, endpoint, method="GET", params=None, data=None):
+        """Make an authenticated request, re-authenticating at most once on 401"""
+        token = self.get_token()
+        if not token:
+            return {"error": "Authentication failed"}
+
+        url = f"{Config.WAZUH_API_URL}{endpoint}"
+        body = json.dumps(data) if data is not None else None
+
+        for attempt in range(2):
+            response = self.session.request(
+                method.upper(), url,
+                headers={
+                    "Authorization": f"Bearer {token}",
+                    "Content-Type": "application/json"
+                },
+                params=params,
+                data=body,
+                timeout=self.timeout
+            )
+            if response.status_code != 401:
+                return response.json()
+
+            # Token revoked or expired early; refresh once and retry
+            token = self.get_token(stale_token=token) if attempt == 0 else None
+            if not token:
+                break
+
+        return {"error": "Unable to refresh authentication token"}
+
+    def _fetch_page(self, endpoint, offset, params):
+        response = self.request(endpoint, params={**params, "limit": Config.WAZUH_PAGE_SIZE,
+                                                  "offset": offset})
+        data = response.get("data") if isinstance(response, dict) else None
+        if not isinstance(data, dict):
+            detail = response.get("detail") or response.get("error") if isinstance(response, dict) else None
+            raise RuntimeError(f"Unexpected {endpoint} response: {detail or response}")
+        return data
+
+    def fetch_all(self, endpoint, select=None, params=None):
+        """
+        Return every affected_item of a paged endpoint, requesting the pages
+        after the first in parallel. Raises on any failed page.
+        """
+        params = dict(params or {})
+        if select:
+            params["select"] = select
+        first = self._fetch_page(endpoint, 0, params)
+        items = list(first.get("affected_items", []))
+        total = first.get("total_affected_items", len(items))
+        offsets = range(len(items), total, Config.WAZUH_PAGE_SIZE) if items else []
+        if offsets:
+            with ThreadPoolExecutor(max_workers=Config.WAZUH_FETCH_WORKERS,
+                                    thread_name_prefix="wazuh-pages") as executor:
+                pages = executor.map(lambda offset: self._fetch_page(endpoint, offset, params), offsets)
+                for page in pages:
+                    items.extend(page.get("affected_items", []))
+        return items
+
+    def stats(self):
+        return {
+            "authenticated": self._token is not None,
+            "token_expires_in": max(0, int(self._token_expires - time.time())) if self._token else None,
+            "authentications": self._authentications
+        }
+
+
+_wazuh_client = WazuhClient()
+
+
+def get_wazuh_client():
+    """Return the process-wide Wazuh API client"""
+    return _wazuh_client
+
+
+class AgentInventory:
+    """
+    In-process copy of the Wazuh agent list.
+
+    The full agent records are loaded with parallel paged requests and
+    reloaded every WAZUH_AGENT_FULL_RELOAD_SECONDS. In between, every
+    WAZUH_AGENT_REFRESH_SECONDS only the fields that change (status and
+    keep-alive) are fetched and merged in. Status counters are kept up to
+    date on each refresh, so dashboards never download the agent list.
+    If a refresh fails the previous inventory keeps being served, and the
+    manager is not asked again for WAZUH_AGENT_RETRY_SECONDS.
+    """
+
+    # Fields fetched by the light refresh
+    REFRESH_FIELDS = "status,lastKeepAlive"
+    STATUSES = ("active", "disconnected", "never_connected", "pending")
+
+    def __init__(self, client=None):
+        self.client = client or get_wazuh_client()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._agents = {}
+        self._counts = None
+        self._loaded_at = None
+        self._refreshed_at = None
+        self._last_attempt = None
+        self._last_error = None
+
+    def invalidate(self):
+        """Force a full reload on next use"""
+        self._loaded_at = None
+        self._last_attempt = None
+
+    def _count(self, agents):
+        counts = {status: 0 for status in self.STATUSES}
+        for agent in agents.values():
+            status = agent.get("status", "")
+            if status in counts:
+                counts[status] += 1
+        counts["total"] = len(agents)
+        return counts
+
+    def _reload(self):
+        agents = {agent["id"]: agent for agent in self.client.fetch_all("/agents") if "id" in agent}
+        now = time.monotonic()
+        with self._lock:
+            self._agents = agents
+            self._counts = self._count(agents)
+            self._loaded_at = now
+            self._refreshed_at = now
+        logger.debug(f"Loaded {len(agents)} Wazuh agents")
+
+    def _refresh(self):
+        changes = {agent["id"]: agent for agent in self.client.fetch_all("/agents", select=self.REFRESH_FIELDS) if "id" in agent}
+        with self._lock:
+            known = self._agents
+        if changes.keys() != known.keys():
+            # Agents were added or removed; their full records are needed
+            self._reload()
+            return
+
+        agents = {agent_id: {**agent, **changes[agent_id]} for agent_id, agent in known.items()}
+        with self._lock:
+            self._agents = agents
+            self._counts = self._count(agents)
+            self._refreshed_at = time.monotonic()
+
+    def _retry_pending(self, now):
+        # Don't hammer an unreachable manager on every request
+        return (self._last_error is not None and self._last_attempt is not None and
+                now - self._last_attempt < Config.WAZUH_AGENT_RETRY_SECONDS)
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._refreshed_at < Config.WAZUH_AGENT_REFRESH_SECONDS:
+            return
+        if self._retry_pending(now):
+            return
+
+        # One thread refreshes; others keep serving the current inventory
+        if self._loaded_at is not None:
+            if not self._refresh_lock.acquire(blocking=False):
+                return
+        else:
+            self._refresh_lock.acquire()
+        try:
+            now = time.monotonic()
+            if self._loaded_at is not None and now - self._refreshed_at < Config.WAZUH_AGENT_REFRESH_SECONDS:
+                return
+            # Requests queued behind a failed first load return its error
+            if self._retry_pending(now):
+                return
+            self._last_attempt = now
+            if self._loaded_at is None or now - self._loaded_at >= Config.WAZUH_AGENT_FULL_RELOAD_SECONDS:
+                self._reload()
+            else:
+                self._refresh()
+            self._last_error = None
+        except Exception as e:
+            self._last_error = str(e)
+            logger.error(f"Error refreshing Wazuh agent inventory: {str(e)}")
+        finally:
+            self._refresh_lock.release()
+
+    def agents(self, status=None):
+        """Return the agent records, optionally only those with this status"""
+        self._ensure_fresh()
+        with self._lock:
+            if self._loaded_at is None:
+                return {"error": self._last_error or "Agent inventory not loaded"}
+            agents = list(self._agents.values())
+        if status and status != "all":
+            agents = [agent for agent in agents if agent.get("status") == status]
+        return agents
+
+    def status_counts(self):
+        """Return {"total", "active", "disconnected", "never_connected", "pending"}"""
+        self._ensure_fresh()
+        with self._lock:
+            if self._counts is None:
+                return {"error": self._last_error or "Agent inventory not loaded"}
+            return dict(self._counts)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "agents": len(self._agents),
+                "counts": self._counts,
+                "loaded_seconds_ago": round(now - self._loaded_at, 1) if self._loaded_at is not None else None,
+                "refreshed_seconds_ago": round(now - self._refreshed_at, 1) if self._refreshed_at is not None else None,
+                "last_error": self._last_error
+            }
+
+
+_agent_inventory = AgentInventory()
+
+
+def get_agent_inventory():
+    """Return the process-wide Wazuh agent inventory"""
+    return _agent_inventory
+
+
+class RuleCatalog:
+    """
+    In-process lookup table of Wazuh rules: id -> description, level,
+    groups and MITRE ATT&CK technique IDs.
+
+    The whole ruleset is loaded in bulk (only the needed fields) and
+    reloaded every WAZUH_RULE_RELOAD_SECONDS. Rule IDs seen in alerts but
+    missing from the catalog, e.g. custom rules added since the last load,
+    are fetched together in one request; IDs Wazuh does not know are not
+    asked for again for WAZUH_RULE_MISS_RETRY_SECONDS.
+    """
+
+    FIELDS = "id,level,description,groups,mitre"
+
+    def __init__(self, client=None):
+        self.client = client or get_wazuh_client()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._rules = {}
+        self._misses = {}
+        self._loaded_at = None
+        self._last_attempt = None
+        self._last_error = None
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def invalidate(self):
+        """Force a reload on next use"""
+        self._loaded_at = None
+        self._last_attempt = None
+
+    @staticmethod
+    def _mitre_ids(mitre):
+        """
+        Technique IDs from a rule's mitre field: /rules returns a list such as
+        ["T1110"], while alerts carry {"id": [...], "tactic": [...], ...}
+        """
+        if isinstance(mitre, dict):
+            mitre = mitre.get("id") or []
+        if isinstance(mitre, str):
+            return [mitre]
+        if not isinstance(mitre, list):
+            return []
+        return [item.get("id") if isinstance(item, dict) else item
+                for item in mitre if item and (not isinstance(item, dict) or item.get("id"))]
+
+    def _entry(self, rule):
+        return {
+            "id": str(rule["id"]),
+            "description": rule.get("description"),
+            "level": rule.get("level"),
+            "groups": rule.get("groups") or [],
+            "mitre_ids": self._mitre_ids(rule.get("mitre"))
+        }
+
+    def _load(self):
+        rules = {}
+        for rule in self.client.fetch_all("/rules", select=self.FIELDS):
+            if "id" in rule:
+                entry = self._entry(rule)
+                rules[entry["id"]] = entry
+        with self._lock:
+            self._rules = rules
+            self._misses = {}
+            self._loaded_at = time.monotonic()
+        logger.debug(f"Loaded {len(rules)} Wazuh rules")
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < Config.WAZUH_RULE_RELOAD_SECONDS:
+            return
+        # Don't hammer an unreachable manager on every lookup
+        if self._last_attempt is not None and now - self._last_attempt < Config.WAZUH_RULE_MISS_RETRY_SECONDS:
+            return
+
+        # One thread reloads; others keep using the current catalog
+        if not self._load_lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < Config.WAZUH_RULE_RELOAD_SECONDS:
+                return
+            self._last_attempt = time.monotonic()
+            self._load()
+            self._last_error = None
+        except Exception as e:
+            self._last_error = str(e)
+            logger.error(f"Error loading Wazuh rule catalog: {str(e)}")
+        finally:
+            self._load_lock.release()
+
+    def _fetch_missing(self, rule_ids):
+        now = time.monotonic()
+        with self._lock:
+            wanted = [rule_id for rule_id in rule_ids
+                      if rule_id not in self._rules and
+                      now - self._misses.get(rule_id, -Config.WAZUH_RULE_MISS_RETRY_SECONDS) >= Config.WAZUH_RULE_MISS_RETRY_SECONDS]
+            for rule_id in wanted:
+                self._misses[rule_id] = now
+        if not wanted:
+            return
+
+        try:
+            found = self.client.fetch_all("/rules", select=self.FIELDS,
+                                          params={"rule_ids": ",".join(wanted)})
+        except Exception as e:
+            logger.warning(f"Could not look up Wazuh rules {', '.join(wanted)}: {str(e)}")
+            return
+
+        with self._lock:
+            for rule in found:
+                if "id" in rule:
+                    entry = self._entry(rule)
+                    self._rules[entry["id"]] = entry
+                    self._misses.pop(entry["id"], None)
+
+    def lookup_many(self, rule_ids):
+        """Return {rule_id: entry} for the IDs the catalog knows"""
+        self._ensure_loaded()
+        rule_ids = list(dict.fromkeys(str(rule_id) for rule_id in rule_ids if rule_id not in (None, '')))
+        if self.loaded:
+            self._fetch_missing(rule_ids)
+        with self._lock:
+            return {rule_id: self._rules[rule_id] for rule_id in rule_ids if rule_id in self._rules}
+
+    def lookup(self, rule_id):
+        """Return the entry for one rule ID, or None"""
+        return self.lookup_many([rule_id]).get(str(rule_id))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rules": len(self._rules),
+                "unknown_ids": len(self._misses),
+                "age_seconds": (round(time.monotonic() - self._loaded_at, 1)
+                                if self._loaded_at is not None else None),
+                "last_error": self._last_error
+            }
+
+
+_rule_catalog = RuleCatalog()
+
+
+def get_rule_catalog():
+    """Return the process-wide Wazuh rule catalog"""
+    return _rule_catalog
+
+
+class WazuhAPI:
+    def __init__(self):
+        self.base_url = Config.WAZUH_API_URL
+        self.client = get_wazuh_client()
     
     def _make_request(self, endpoint, method="GET", params=None, data=None):
         """Make a request to the Wazuh API"""
-        if not self.token and not self._get_token():
-            return {"error": "Authentication failed"}
-        
-        url = f"{self.base_url}{endpoint}"
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
+        if method.upper() not in ("GET", "POST", "PUT", "DELETE"):
+            return {"error": f"Unsupported HTTP method: {method}"}
         
         try:
-            if method.upper() == "GET":
-                response = requests.get(url, headers=headers, params=params, verify=self.verify_ssl)
-            elif method.upper() == "POST":
-                response = requests.post(url, headers=headers, params=params, data=json.dumps(data), verify=self.verify_ssl)
-            elif method.upper() == "PUT":
-                response = requests.put(url, headers=headers, params=params, data=json.dumps(data), verify=self.verify_ssl)
-            elif method.upper() == "DELETE":
-                response = requests.delete(url, headers=headers, params=params, verify=self.verify_ssl)
-            else:
-                return {"error": f"Unsupported HTTP method: {method}"}
-            
-            # Handle 401 Unauthorized - Token may have expired
-            if response.status_code == 401:
-                if self._get_token():  # Try to get a new token
-                    return self._make_request(endpoint, method, params, data)  # Retry the request
-                else:
-                    return {"error": "Unable to refresh authentication token"}
-            
-            return response.json()
+            return self.client.request(endpoint, method, params, data)
         except Exception as e:
             logger.error(f"Error while making request to Wazuh API: {str(e)}")
             return {"error": str(e)}